@@ -0,0 +1,298 @@
+"""Admission control for the expensive routes: token buckets and LLM load shedding.
+
+``login`` pays for a bcrypt check on every attempt and ``generate-diet``,
+``generate-exercise`` and ``analyze_meals`` hold a worker for as long as
+OpenAI takes. ``@admit(LOGIN)`` / ``@admit(LLM)`` put each request through
+three token buckets first (per user, per client IP and one global), taking a
+token from all of them or from none. LLM routes additionally need one of
+``LLM_MAX_IN_FLIGHT`` slots, so once that many are running further requests
+are shed instead of queueing behind them. Refused requests get ``429`` with
+``Retry-After`` and are counted in ``admission_rejections_total``.
+
+Limits are ``"<burst>/<seconds>"``: a bucket holds up to ``burst`` tokens
+and refills that many every ``seconds``. Override one with
+``ADMISSION_<POLICY>_<SCOPE>``, e.g. ``ADMISSION_LOGIN_USER=5/60``.
+
+By default buckets and slots live in the worker's memory, so every gunicorn
+worker enforces the limits on its own. ``ADMISSION_STORE=<path>`` keeps them
+in a SQLite file that all workers on the host share instead. If that store
+fails, requests are admitted and a warning is logged. ``ADMISSION_ENABLED=0``
+turns admission control off.
+"""
+import collections
+import contextlib
+import functools
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from flask import jsonify, request, session
+
+from api import metrics
+from api.logs import get_logger
+
+log = get_logger(__name__)
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "1") != "0"
+ADMISSION_STORE = os.getenv("ADMISSION_STORE", "")
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", "4"))
+# A worker killed mid-request never releases its slot; the lease runs out instead
+LLM_SLOT_TTL_SECONDS = 180
+STORE_TIMEOUT_SECONDS = 0.5
+# Idle buckets are full again long before this, so dropping them changes nothing
+IDLE_BUCKET_SECONDS = 3600
+MAX_LOCAL_BUCKETS = 10000
+
+LOGIN, LLM = "login", "llm"
+SCOPES = ("user", "ip", "global")
+DEFAULT_LIMITS = {
+    LOGIN: {"user": "5/60", "ip": "20/60", "global": "20/2"},
+    LLM: {"user": "3/60", "ip": "10/60", "global": "30/60"},
+}
+
+Rate = collections.namedtuple("Rate", "burst seconds")
+
+
+def parse_rate(value):
+    """``"5/60"`` -> Rate(burst=5.0, seconds=60.0)."""
+    burst, _, seconds = str(value).partition("/")
+    rate = Rate(float(burst), float(seconds or 1))
+    if rate.burst < 1 or rate.seconds <= 0 or rate.seconds > IDLE_BUCKET_SECONDS:
+        raise ValueError(f"invalid rate {value!r}: need burst >= 1 and 0 < seconds <= {IDLE_BUCKET_SECONDS}")
+    return rate
+
+
+def load_limits():
+    return {policy: {scope: parse_rate(os.getenv(f"ADMISSION_{policy.upper()}_{scope.upper()}", default))
+                     for scope, default in scopes.items()}
+            for policy, scopes in DEFAULT_LIMITS.items()}
+
+
+LIMITS = load_limits()
+
+
+def _take(buckets, states, now):
+    """Take one token from every bucket or from none.
+
+    ``buckets`` is a list of (scope, key, rate) and ``states`` maps key to
+    (tokens, updated). Returns (new states, 0, None) on success, otherwise
+    (None, seconds until a token is available, scope of the emptiest bucket).
+    """
+    updated, wait, blocking = {}, 0.0, None
+    for scope, key, rate in buckets:
+        tokens, stamp = states.get(key) or (rate.burst, now)
+        tokens = min(rate.burst, tokens + max(0.0, now - stamp) * rate.burst / rate.seconds)
+        if tokens < 1:
+            needed = (1 - tokens) * rate.seconds / rate.burst
+            if needed > wait:
+                wait, blocking = needed, scope
+        updated[key] = (tokens - 1, now)
+    return (None, wait, blocking) if blocking else (updated, 0.0, None)
+
+
+class LocalBucketStore:
+    """Buckets and LLM slots in this worker's memory."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> (tokens, updated)
+        self._slots = collections.Counter()
+
+    def take(self, buckets, now):
+        """Returns (seconds to wait, blocking scope); (0, None) when admitted."""
+        with self._lock:
+            updated, wait, scope = _take(buckets, self._buckets, now)
+            if updated:
+                self._buckets.update(updated)
+                if len(self._buckets) > MAX_LOCAL_BUCKETS:
+                    self._buckets = {key: state for key, state in self._buckets.items()
+                                     if now - state[1] < IDLE_BUCKET_SECONDS}
+            return wait, scope
+
+    def acquire_slot(self, name, limit, now):
+        """Returns a token to pass to ``release_slot``, or None when all slots are taken."""
+        with self._lock:
+            if self._slots[name] >= limit:
+                return None
+            self._slots[name] += 1
+            return name
+
+    def release_slot(self, name, token):
+        with self._lock:
+            self._slots[name] -= 1
+
+
+class SharedBucketStore:
+    """Buckets and LLM slot leases in a SQLite file shared by the workers on one host."""
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+        "CREATE TABLE IF NOT EXISTS slots (token TEXT PRIMARY KEY, name TEXT NOT NULL, expires REAL NOT NULL)",
+    )
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        with self._transaction() as conn:
+            for ddl in self.SCHEMA:
+                conn.execute(ddl)
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=STORE_TIMEOUT_SECONDS, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # losing recent bucket state in a crash is harmless
+            self._local.conn = conn
+        return conn
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    def take(self, buckets, now):
+        with self._transaction() as conn:
+            states = {}
+            for _, key, _ in buckets:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                if row:
+                    states[key] = row
+            updated, wait, scope = _take(buckets, states, now)
+            if updated:
+                conn.executemany("""
+                    INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated
+                """, [(key, tokens, stamp) for key, (tokens, stamp) in updated.items()])
+                self._takes += 1
+                if self._takes % self.PRUNE_EVERY == 0:
+                    conn.execute("DELETE FROM buckets WHERE updated < ?", (now - IDLE_BUCKET_SECONDS,))
+            return wait, scope
+
+    def acquire_slot(self, name, limit, now):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM slots WHERE expires < ?", (now,))
+            (running,) = conn.execute("SELECT COUNT(*) FROM slots WHERE name = ?", (name,)).fetchone()
+            if running >= limit:
+                return None
+            token = uuid.uuid4().hex
+            conn.execute("INSERT INTO slots (token, name, expires) VALUES (?, ?, ?)",
+                         (token, name, now + LLM_SLOT_TTL_SECONDS))
+            return token
+
+    def release_slot(self, name, token):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM slots WHERE token = ?", (token,))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The process-wide store, opened on first use (after gunicorn has forked)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SharedBucketStore(ADMISSION_STORE) if ADMISSION_STORE else LocalBucketStore()
+    return _store
+
+
+class _Average:
+    """Moving average of LLM route durations, used to estimate Retry-After when shedding."""
+
+    def __init__(self, initial, weight=0.2):
+        self.value = initial
+        self.weight = weight
+
+    def add(self, sample):
+        self.value += self.weight * (sample - self.value)
+
+
+llm_duration = _Average(initial=20.0)
+
+
+def _client_ip():
+    # Behind a proxy this is the proxy unless the app is wrapped in werkzeug's ProxyFix
+    return request.remote_addr or "unknown"
+
+
+def _user_key(policy):
+    if policy == LOGIN:
+        body = request.get_json(silent=True) or {}
+        username = body.get("username") if isinstance(body, dict) else None
+        return str(username or "").strip().lower() or None
+    return session.get("patient_id") or (request.view_args or {}).get("patient_id")
+
+
+def _buckets(policy):
+    limits = LIMITS[policy]
+    buckets = [("global", f"{policy}:global", limits["global"]),
+               ("ip", f"{policy}:ip:{_client_ip()}", limits["ip"])]
+    user = _user_key(policy)
+    if user:
+        buckets.append(("user", f"{policy}:user:{user}", limits["user"]))
+    return buckets
+
+
+def _reject(policy, reason, retry_after):
+    seconds = max(1, math.ceil(retry_after))
+    metrics.observe_admission_rejection(policy, reason)
+    log.warning("admission_rejected", policy=policy, reason=reason, retry_after=seconds,
+                endpoint=request.endpoint, ip=_client_ip())
+    message = f"Too many requests, please try again in {seconds} seconds"
+    body = {"success": False, "message": message} if policy == LOGIN else {"error": message}
+    response = jsonify(body)
+    response.status_code = 429
+    response.headers["Retry-After"] = str(seconds)
+    return response
+
+
+def admit(policy):
+    """Route decorator applying the ``policy`` buckets (and LLM slots) before the view runs."""
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not ADMISSION_ENABLED:
+                return view(*args, **kwargs)
+            store = get_store()
+            slot = None
+            try:
+                wait, scope = store.take(_buckets(policy), time.time())
+                if scope:
+                    return _reject(policy, scope, wait)
+                if policy == LLM:
+                    slot = store.acquire_slot(LLM, LLM_MAX_IN_FLIGHT, time.time())
+                    if slot is None:
+                        return _reject(policy, "queue", llm_duration.value)
+            except sqlite3.Error:
+                log.warning("admission_store_unavailable", policy=policy, exc_info=True)
+                return view(*args, **kwargs)
+            if slot is None:
+                return view(*args, **kwargs)
+
+            start = time.perf_counter()
+            metrics.track_llm_in_flight(1)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                metrics.track_llm_in_flight(-1)
+                llm_duration.add(time.perf_counter() - start)
+                try:
+                    store.release_slot(LLM, slot)
+                except sqlite3.Error:
+                    log.warning("admission_slot_release_failed", exc_info=True)
+        return wrapper
+    return decorator
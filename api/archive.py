@@ -0,0 +1,250 @@
+"""Cold storage for old meal and exercise tracking rows.
+
+``python -m scripts.archive_tracking`` moves rows older than
+``ARCHIVE_HORIZON_DAYS`` (default 365) out of ``PatientMealTracking`` and
+``PatientExerciseTracking``. They go into zstd-compressed Parquet segments,
+one per patient and month:
+``<ARCHIVE_DIR>/<dataset>/<patient_id>/<YYYY-MM>.parquet``. The hot tables
+and their indexes then only hold the recent rows that tracking writes and
+existence checks touch.
+
+A segment is written completely (temp file + rename) before its rows are
+deleted, and deleted by id, so an interrupted run leaves rows in both places
+and the next run merges them again. A month that receives more old rows
+later is rewritten with the new rows merged in.
+
+Reads merge both tiers in key order (``merge_sorted``). When a key is in
+both (an archived day edited later), the hot row wins. Exercise keys repeat
+in older data, so its segments also keep the row id (``tiebreak``), which
+orders the repeats. ``patient_rows``
+serves the per-patient range reads and ``iter_cold`` the exports. A read
+only touches segment files when the patient has some. pandas and the
+Parquet engine (pyarrow) load on first use.
+"""
+import collections
+import datetime
+import functools
+import heapq
+import itertools
+import os
+import re
+
+from api.logs import get_logger
+
+log = get_logger(__name__)
+
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+ARCHIVE_HORIZON_DAYS = int(os.getenv("ARCHIVE_HORIZON_DAYS", "365"))
+COMPRESSION = "zstd"
+# Ids per DELETE statement (SQL Server allows 2100 parameters)
+DELETE_CHUNK = 500
+
+Dataset = collections.namedtuple("Dataset", "table date_column key columns tiebreak")
+
+# Stored column order (columns, then the tiebreak) matches api/exports.py, so archived rows can be
+# exported as they are
+DATASETS = {
+    "meals": Dataset("PatientMealTracking", "meal_date", ("patient_id", "meal_date"),
+                     ("patient_id", "meal_date", "breakfast", "lunch", "dinner", "snacks"), None),
+    # The key repeats in older data; the row id orders the repeats
+    "exercise": Dataset("PatientExerciseTracking", "exercise_date", ("patient_id", "exercise_date", "exercise_name"),
+                        ("patient_id", "exercise_date", "exercise_name", "duration_minutes"), "id"),
+}
+
+INTEGER_COLUMNS = {"duration_minutes", "id"}
+
+_SAFE_ID = re.compile(r"[A-Za-z0-9_-]+")
+
+
+def cutoff_date(horizon_days=None, today=None):
+    """First day that stays hot: rows dated before it are archived."""
+    today = today or datetime.date.today()
+    return today - datetime.timedelta(days=ARCHIVE_HORIZON_DAYS if horizon_days is None else horizon_days)
+
+
+def day(value):
+    """ISO ``YYYY-MM-DD`` for a date, datetime or date string."""
+    return value.isoformat()[:10] if hasattr(value, "isoformat") else str(value)[:10]
+
+
+def _patient_dir(dataset, patient_id):
+    if not _SAFE_ID.fullmatch(str(patient_id)):
+        return None
+    return os.path.join(ARCHIVE_DIR, dataset, str(patient_id))
+
+
+def segment_path(dataset, patient_id, month):
+    """Path of the segment holding ``patient_id``'s rows for ``month`` (``YYYY-MM``)."""
+    return os.path.join(_patient_dir(dataset, patient_id), f"{month}.parquet")
+
+
+def _segment_months(dataset, patient_id):
+    directory = _patient_dir(dataset, patient_id)
+    if directory is None or not os.path.isdir(directory):
+        return []
+    return sorted(name[:-len(".parquet")] for name in os.listdir(directory) if name.endswith(".parquet"))
+
+
+def has_segments(dataset):
+    return os.path.isdir(os.path.join(ARCHIVE_DIR, dataset))
+
+
+def stored_columns(dataset):
+    """Columns of an archived row: the dataset's columns, then its tiebreak if it has one."""
+    spec = DATASETS[dataset]
+    return spec.columns + ((spec.tiebreak,) if spec.tiebreak else ())
+
+
+def row_key(dataset, row):
+    """Identity key of a full row (a hot row replaces archived rows with the same key); dates as ISO strings."""
+    columns = DATASETS[dataset].columns
+    return tuple(day(row[columns.index(k)]) if k == DATASETS[dataset].date_column else str(row[columns.index(k)])
+                 for k in DATASETS[dataset].key)
+
+
+def row_order(dataset, row):
+    """Unique sort key of a full stored row: ``row_key``, then the tiebreak id (-1 if unknown)."""
+    spec = DATASETS[dataset]
+    if not spec.tiebreak:
+        return row_key(dataset, row)
+    value = row[len(spec.columns)] if len(row) > len(spec.columns) else None
+    return row_key(dataset, row) + (-1 if value is None else int(value),)
+
+
+def _read_segment(dataset, path):
+    stat = os.stat(path)
+    return _read_segment_cached(path, stat.st_mtime_ns, stat.st_size, stored_columns(dataset))
+
+
+@functools.lru_cache(maxsize=256)
+def _read_segment_cached(path, mtime_ns, size, columns):
+    import pandas as pd
+
+    frame = pd.read_parquet(path).reindex(columns=list(columns))  # segments written before a tiebreak: None
+    frame = frame.astype(object).where(frame.notna(), None)
+    return tuple(tuple(row) for row in frame.itertuples(index=False, name=None))
+
+
+def _write_segment(dataset, path, rows):
+    import pandas as pd
+
+    frame = pd.DataFrame(list(rows), columns=stored_columns(dataset))
+    for column in INTEGER_COLUMNS.intersection(frame.columns):
+        frame[column] = frame[column].astype("Int64")  # nullable, so a NULL doesn't turn the column into floats
+    tmp = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    frame.to_parquet(tmp, compression=COMPRESSION, index=False)
+    os.replace(tmp, path)
+
+
+def cold_rows(dataset, patient_id, start=None, end=None):
+    """Archived stored rows of one patient dated ``start``..``end`` (inclusive, either open), in ``row_order``."""
+    first = start and day(start)
+    last = end and day(end)
+    date_index = DATASETS[dataset].columns.index(DATASETS[dataset].date_column)
+    rows = []
+    for month in _segment_months(dataset, patient_id):
+        if (first and month < first[:7]) or (last and month > last[:7]):
+            continue
+        rows.extend(row for row in _read_segment(dataset, segment_path(dataset, patient_id, month))
+                    if (not first or row[date_index] >= first) and (not last or row[date_index] <= last))
+    return sorted(rows, key=lambda row: row_order(dataset, row))
+
+
+def merge_sorted(hot, cold, key, order=None):
+    """Merge two row streams sorted by ``order`` (default ``key``, which it must start with);
+    cold rows whose ``key`` has a hot row are dropped."""
+    order = order or key
+    merged = heapq.merge(((order(r), 0, r) for r in hot), ((order(r), 1, r) for r in cold),
+                         key=lambda item: item[:2])
+    for _, group in itertools.groupby(merged, key=lambda item: key(item[2])):
+        group = list(group)
+        hot_rows = [row for _, source, row in group if source == 0]
+        yield from hot_rows or [row for _, _, row in group]
+
+
+def patient_rows(dataset, patient_id, hot_rows, start=None, end=None):
+    """One patient's rows from both tiers.
+
+    ``hot_rows`` are in the dataset's column order without ``patient_id``.
+    Without archived rows they are returned as they are; otherwise the
+    result is sorted by key.
+    """
+    cold = cold_rows(dataset, patient_id, start, end)
+    if not cold:
+        return hot_rows
+    date_index = DATASETS[dataset].columns.index(DATASETS[dataset].date_column) - 1
+    key_indexes = [DATASETS[dataset].columns.index(k) - 1 for k in DATASETS[dataset].key[1:]]
+
+    def key(row):
+        return tuple(day(row[i]) if i == date_index else str(row[i]) for i in key_indexes)
+
+    return list(merge_sorted(sorted(hot_rows, key=key), [row[1:len(DATASETS[dataset].columns)] for row in cold], key))
+
+
+def archived_patients(dataset):
+    """Sorted ids of the patients with segments for ``dataset``."""
+    root = os.path.join(ARCHIVE_DIR, dataset)
+    if not os.path.isdir(root):
+        return []
+    return sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+
+
+def iter_cold(dataset, patient_id=None, after=None):
+    """Archived stored rows in ``row_order``, for every patient or one, strictly after the order key ``after``."""
+    spec = DATASETS[dataset]
+    patients = [patient_id] if patient_id is not None else archived_patients(dataset)
+    names = spec.key + ((spec.tiebreak,) if spec.tiebreak else ())
+    after = tuple(day(v) if k == spec.date_column else int(v) if k == spec.tiebreak else str(v)
+                  for k, v in zip(names, after)) if after else None
+    for patient in patients:
+        if after and patient < after[0]:
+            continue
+        for row in cold_rows(dataset, patient):
+            if after is None or row_order(dataset, row) > after:
+                yield row
+
+
+def _delete_ids(cursor, table, ids):
+    for i in range(0, len(ids), DELETE_CHUNK):
+        chunk = ids[i:i + DELETE_CHUNK]
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({', '.join('?' * len(chunk))})", chunk)
+
+
+def archive_patient(conn, dataset, patient_id, cutoff):
+    """Move one patient's rows dated before ``cutoff`` into segments; returns (segments, rows)."""
+    spec = DATASETS[dataset]
+    if _patient_dir(dataset, patient_id) is None:
+        raise ValueError(f"patient id {patient_id!r} can't be used as a directory name")
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT id, {', '.join(spec.columns)} FROM {spec.table}
+        WHERE patient_id = ? AND {spec.date_column} < ?
+    """, (patient_id, cutoff.isoformat()))
+    date_index = spec.columns.index(spec.date_column)
+    by_month = collections.defaultdict(list)
+    for row in cursor.fetchall():
+        row = tuple(row)
+        values = row[1:date_index + 1] + (day(row[date_index + 1]),) + row[date_index + 2:]
+        if spec.tiebreak:
+            values += (row[0],)
+        by_month[values[date_index][:7]].append((row[0], values))
+
+    moved = 0
+    for month, entries in sorted(by_month.items()):
+        path = segment_path(dataset, patient_id, month)
+        new = [values for _, values in entries]
+        old = _read_segment(dataset, path) if os.path.exists(path) else ()
+        key, order = functools.partial(row_key, dataset), functools.partial(row_order, dataset)
+        _write_segment(dataset, path, merge_sorted(sorted(new, key=order), sorted(old, key=order), key, order))
+        _delete_ids(cursor, spec.table, [row_id for row_id, _ in entries])
+        conn.commit()
+        moved += len(entries)
+    return len(by_month), moved
+
+
+def patients_with_old_rows(cursor, dataset, cutoff):
+    spec = DATASETS[dataset]
+    cursor.execute(f"SELECT DISTINCT patient_id FROM {spec.table} WHERE {spec.date_column} < ?",
+                   (cutoff.isoformat(),))
+    return sorted(row[0] for row in cursor.fetchall())
@@ -0,0 +1,165 @@
+"""Blog content rendered once, when it is written.
+
+``Write_BlogsPage.html`` posts the Quill editor's HTML and the manage page's
+edit prompt posts plain text (content that doesn't start with a tag).
+``create_blog`` and ``update_blog`` pass either to ``render`` and store the
+result in ``BlogRenditions`` (migration 5):
+
+- ``html``: sanitized HTML. Only the tags in ``ALLOWED_TAGS`` are kept,
+  links only with http(s)/mailto targets, and classes only Quill's
+  ``ql-*`` ones. ``<script>``, ``<style>`` and the like are dropped with
+  their content. Plain text becomes ``<p>`` paragraphs.
+- ``text``: the plain text, for search and the excerpt.
+- ``excerpt``: the first ``EXCERPT_CHARS`` characters of text, cut at a word.
+- ``reading_minutes``: words / ``WORDS_PER_MINUTE``, at least 1.
+
+``GET /doctor_blogs`` serves these fields as stored. Bump ``RENDER_VERSION``
+whenever the output of ``render`` changes and run
+``python -m scripts.rerender_blogs`` to update the stored rows.
+"""
+import collections
+import html
+import html.parser
+import math
+import re
+
+RENDER_VERSION = 1
+EXCERPT_CHARS = 200
+WORDS_PER_MINUTE = 200
+
+ALLOWED_TAGS = frozenset({
+    "a", "b", "blockquote", "br", "code", "em", "h1", "h2", "h3", "h4", "h5", "h6", "i", "li", "ol", "p",
+    "pre", "s", "span", "strong", "sub", "sup", "u", "ul",
+})
+VOID_TAGS = frozenset({"br"})
+# Dropped together with everything inside them
+DROPPED_TAGS = frozenset({"iframe", "noscript", "object", "script", "select", "style", "template", "textarea"})
+BLOCK_TAGS = frozenset({
+    "blockquote", "br", "div", "h1", "h2", "h3", "h4", "h5", "h6", "li", "ol", "p", "pre", "table", "tr", "ul",
+})
+# Opening one of these closes an open one directly around it, as in browsers (<li>one<li>two)
+SELF_CLOSING_SIBLINGS = frozenset({"li", "p"})
+LINK_SCHEMES = ("http://", "https://", "mailto:")
+
+_QUILL_CLASS = re.compile(r"ql-[a-z0-9-]+")
+_SPACES = re.compile(r"\s+")
+
+Rendition = collections.namedtuple("Rendition", "html text excerpt reading_minutes")
+
+
+class _Sanitizer(html.parser.HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.html = []
+        self.text = []
+        self.open = []  # allowed tags still open, innermost last
+        self.dropping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in DROPPED_TAGS:
+            self.dropping += 1
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append("\n")
+        if tag not in ALLOWED_TAGS:
+            return
+        if tag in SELF_CLOSING_SIBLINGS and self.open and self.open[-1] == tag:
+            self.handle_endtag(tag)
+        kept = []
+        for name, value in attrs:
+            value = (value or "").strip()
+            if name == "class":
+                classes = " ".join(c for c in value.split() if _QUILL_CLASS.fullmatch(c))
+                if classes:
+                    kept.append(("class", classes))
+            elif tag == "a" and name == "href" and value.lower().startswith(LINK_SCHEMES):
+                kept.append(("href", value))
+        if tag == "a" and kept and kept[-1][0] == "href":
+            kept += [("target", "_blank"), ("rel", "noopener noreferrer nofollow")]
+        self.html.append(f"<{tag}" + "".join(f' {name}="{html.escape(value)}"' for name, value in kept) + ">")
+        if tag not in VOID_TAGS:
+            self.open.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.open and self.open[-1] == tag:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self, tag):
+        if tag in DROPPED_TAGS:
+            self.dropping = max(0, self.dropping - 1)
+            return
+        if self.dropping:
+            return
+        if tag in BLOCK_TAGS:
+            self.text.append("\n")
+        if tag not in self.open:
+            return  # stray closing tag
+        while self.open:
+            inner = self.open.pop()
+            self.html.append(f"</{inner}>")
+            if inner == tag:
+                break
+
+    def handle_data(self, data):
+        if not self.dropping:
+            self.html.append(html.escape(data, quote=False))
+            self.text.append(data)
+
+    def close(self):
+        super().close()
+        self.html.extend(f"</{tag}>" for tag in reversed(self.open))
+        self.open = []
+
+
+def _plain_to_html(content):
+    paragraphs = [p.strip() for p in re.split(r"\n\s*\n", content.replace("\r\n", "\n")) if p.strip()]
+    return "".join("<p>" + "<br>".join(html.escape(line) for line in p.split("\n")) + "</p>" for p in paragraphs)
+
+
+def excerpt(text, limit=EXCERPT_CHARS):
+    if len(text) <= limit:
+        return text
+    cut = text[:limit + 1].rsplit(" ", 1)[0] if " " in text[:limit + 1] else text[:limit]
+    return cut.rstrip(" ,.;:-") + "…"
+
+
+def render(content):
+    """``Rendition`` of blog ``content`` (editor HTML or plain text)."""
+    content = content or ""
+    if not content.lstrip().startswith("<"):  # the editor's HTML always starts with a tag
+        content = _plain_to_html(content)
+    parser = _Sanitizer()
+    parser.feed(content)
+    parser.close()
+    lines = (_SPACES.sub(" ", line).strip() for line in "".join(parser.text).split("\n"))
+    text = "\n".join(line for line in lines if line)
+    words = len(text.split())
+    return Rendition(
+        html="".join(parser.html),
+        text=text,
+        excerpt=excerpt(_SPACES.sub(" ", text)),
+        reading_minutes=max(1, math.ceil(words / WORDS_PER_MINUTE)),
+    )
+
+
+def save_rendition(cursor, blog_id, rendition):
+    """Insert or replace the stored rendition of one blog (caller commits)."""
+    values = (rendition.html, rendition.text, rendition.excerpt, rendition.reading_minutes, RENDER_VERSION)
+    cursor.execute("""
+        UPDATE BlogRenditions
+        SET content_html = ?, content_text = ?, excerpt = ?, reading_minutes = ?, render_version = ?,
+            rendered_at = SYSUTCDATETIME()
+        WHERE blog_id = ?
+    """, values + (blog_id,))
+    if cursor.rowcount == 0:
+        cursor.execute("""
+            INSERT INTO BlogRenditions (blog_id, content_html, content_text, excerpt, reading_minutes, render_version)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (blog_id,) + values)
+
+
+def delete_rendition(cursor, blog_id):
+    cursor.execute("DELETE FROM BlogRenditions WHERE blog_id = ?", (blog_id,))
@@ -0,0 +1,317 @@
+"""Full-text search over ``DoctorBlogs`` with an inverted index and BM25.
+
+Titles and the plain text of the contents (``BlogRenditions.content_text``,
+see ``api/blog_render.py``) are tokenized (lowercase words, stop words dropped) and
+stemmed with a small suffix stripper (``stem``), so "recipes", "recipe" and
+"Recipe" match each other. The index maps every term to the blogs that
+contain it and how often (title words count ``TITLE_WEIGHT`` times).
+``search`` ranks the blogs by BM25 (``K1``, ``B``) and only loads the page
+of hits from the database, for the title, date and a highlighted snippet.
+
+The index lives in memory and in ``BLOG_INDEX_PATH`` (gzipped JSON, under
+``APP_DATA_DIR`` by default), so a new worker loads it instead of scanning
+every blog. ``create_blog``, ``update_blog`` and ``delete_blog`` apply their
+change with ``index_blog`` / ``remove_blog``. The file is rewritten under an
+exclusive lock (``flock``, or ``msvcrt.locking`` on Windows), and each
+worker reloads it when another worker has written a newer one. Without a
+file the index is built from the table on first use. Run
+``python -m scripts.rebuild_blog_index`` after changing blogs outside the
+API.
+"""
+import collections
+import contextlib
+import gzip
+import html
+import json
+import math
+import os
+import re
+import threading
+
+from api import blog_render
+from api.logs import get_logger
+
+log = get_logger(__name__)
+
+# Per-user data directory, so the index doesn't depend on the working directory the app started in
+APP_DATA_DIR = os.getenv("APP_DATA_DIR") or os.path.join(
+    os.getenv("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".local", "share"), "MasterYourHealth")
+BLOG_INDEX_PATH = os.getenv("BLOG_INDEX_PATH") or os.path.join(APP_DATA_DIR, "blog_index.json.gz")
+INDEX_FORMAT = 2
+K1 = 1.2
+B = 0.75
+TITLE_WEIGHT = 3
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 50
+SNIPPET_WORDS = 30
+
+STOP_WORDS = frozenset("""
+a an and are as at be but by for from has have i in is it its of on or our so that the their this to was
+were what when which who will with you your
+""".split())
+
+_WORD = re.compile(r"[^\W_]+")
+
+
+def stem(word):
+    """Strip common English suffixes: "recipes", "recipe" -> "recip"; "running" -> "run"."""
+    if len(word) <= 3 or word.isdigit():
+        return word
+    if word.endswith("ies"):
+        word = word[:-2]
+    else:
+        for suffix in ("ingly", "edly", "ing", "ed", "ly", "s"):
+            if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+                word = word[:-len(suffix)]
+                if suffix in ("ing", "ed") and word[-1] == word[-2] and word[-1] not in "lsz":
+                    word = word[:-1]  # running -> run
+                break
+    if word.endswith("e") and len(word) > 3:
+        word = word[:-1]
+    if word.endswith("y") and len(word) > 3:
+        word = word[:-1] + "i"  # calorie, calories, calory -> calori
+    return word
+
+
+def terms(text):
+    """Index terms of ``text`` in order, stop words removed."""
+    return [stem(word) for word in _WORD.findall((text or "").lower()) if word not in STOP_WORDS]
+
+
+class BlogIndex:
+    """Inverted index: ``postings[term][blog_id]`` = weighted term frequency."""
+
+    def __init__(self):
+        self.postings = collections.defaultdict(dict)
+        self.lengths = {}  # blog id -> weighted number of terms
+        self.total_length = 0
+
+    def add(self, blog_id, title, text):
+        self.remove(blog_id)
+        counts = collections.Counter(terms(text))
+        for term in terms(title):
+            counts[term] += TITLE_WEIGHT
+        for term, count in counts.items():
+            self.postings[term][blog_id] = count
+        self.lengths[blog_id] = sum(counts.values())
+        self.total_length += self.lengths[blog_id]
+
+    def remove(self, blog_id):
+        length = self.lengths.pop(blog_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in [t for t, docs in self.postings.items() if blog_id in docs]:
+            del self.postings[term][blog_id]
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def score(self, query_terms):
+        """BM25 score per blog id matching at least one of ``query_terms``."""
+        count = len(self.lengths)
+        if not count:
+            return {}
+        average = self.total_length / count
+        scores = collections.defaultdict(float)
+        for term in set(query_terms):
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for blog_id, tf in docs.items():
+                norm = K1 * (1 - B + B * self.lengths[blog_id] / average)
+                scores[blog_id] += idf * tf * (K1 + 1) / (tf + norm)
+        return scores
+
+    def to_json(self):
+        return {"format": INDEX_FORMAT, "lengths": self.lengths, "postings": self.postings}
+
+    @classmethod
+    def from_json(cls, data):
+        index = cls()
+        index.lengths = {int(blog_id): length for blog_id, length in data["lengths"].items()}
+        index.total_length = sum(index.lengths.values())
+        for term, docs in data["postings"].items():
+            index.postings[term] = {int(blog_id): tf for blog_id, tf in docs.items()}
+        return index
+
+
+_lock = threading.Lock()
+_index = None
+_loaded_mtime = None
+
+
+def _mtime():
+    try:
+        return os.stat(BLOG_INDEX_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+@contextlib.contextmanager
+def _file_lock():
+    """Exclusive lock across workers while the index file is read, changed and rewritten."""
+    directory = os.path.dirname(BLOG_INDEX_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{BLOG_INDEX_PATH}.lock", "a+") as handle:
+        if os.name == "nt":
+            import msvcrt
+
+            handle.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue  # LK_LOCK gives up after ~10 s of retries; keep waiting
+            try:
+                yield
+            finally:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _load():
+    global _index, _loaded_mtime
+    mtime = _mtime()
+    with gzip.open(BLOG_INDEX_PATH, "rt", encoding="utf-8") as handle:
+        data = json.load(handle)
+    if data.get("format") != INDEX_FORMAT:
+        # Written by an older version; the next search rebuilds it from the table
+        log.warning("blog_index_format_changed", found=data.get("format"), expected=INDEX_FORMAT)
+        _index, _loaded_mtime = None, mtime
+        return
+    _index, _loaded_mtime = BlogIndex.from_json(data), mtime
+
+
+def _save(index):
+    global _loaded_mtime
+    tmp = f"{BLOG_INDEX_PATH}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8") as handle:
+        json.dump(index.to_json(), handle, separators=(",", ":"))
+    os.replace(tmp, BLOG_INDEX_PATH)
+    _loaded_mtime = _mtime()
+
+
+# Raw content only comes back for blogs without a rendition (saved before BlogRenditions).
+# Reads expect the table from migration 5 and never create it.
+_BLOGS = "DoctorBlogs b LEFT JOIN BlogRenditions r ON r.blog_id = b.id"
+_TEXT = "r.content_text, CASE WHEN r.blog_id IS NULL THEN b.content END"
+
+
+def _plain_text(text, content):
+    return text if text is not None else blog_render.render(content).text
+
+
+def rebuild(cursor):
+    """Index every blog from the table and persist it; returns the number of blogs."""
+    global _index
+    cursor.execute(f"SELECT b.id, b.title, {_TEXT} FROM {_BLOGS}")
+    index = BlogIndex()
+    for blog_id, title, text, content in cursor.fetchall():
+        index.add(blog_id, title, _plain_text(text, content))
+    with _lock, _file_lock():
+        _save(index)
+        _index = index
+    log.info("blog_index_rebuilt", blogs=len(index.lengths), terms=len(index.postings))
+    return len(index.lengths)
+
+
+def _current():
+    """The index, reloaded if another worker rewrote the file (call with ``_lock`` held)."""
+    mtime = _mtime()
+    if mtime is not None and mtime != _loaded_mtime:
+        _load()
+    return _index
+
+
+def _scores(cursor, query_terms):
+    # Scored under the lock: index_blog/remove_blog change the postings in place
+    with _lock:
+        index = _current()
+        if index is not None:
+            return index.score(query_terms)
+    rebuild(cursor)
+    with _lock:
+        return _index.score(query_terms)
+
+
+def _apply(change, **context):
+    # Runs after the blog write committed, so a failure is logged, not raised
+    try:
+        with _lock, _file_lock():
+            index = _current()
+            if index is None:
+                return  # no index yet; the first search builds it from the table, change included
+            change(index)
+            _save(index)
+    except Exception:
+        log.exception("blog_index_update_failed", **context)
+
+
+def index_blog(blog_id, title, text):
+    """Add or replace one blog in the index (``text``: the rendered plain text)."""
+    _apply(lambda index: index.add(blog_id, title, text), blog_id=blog_id)
+
+
+def remove_blog(blog_id):
+    _apply(lambda index: index.remove(blog_id), blog_id=blog_id)
+
+
+def _highlight(text, query_terms, words=None):
+    """HTML-escaped ``text`` with query term matches in ``<mark>``; cut to the
+    ``words``-word window with the most matches when ``words`` is given."""
+    spans = [(m.start(), m.end(), stem(m.group().lower()) in query_terms) for m in _WORD.finditer(text or "")]
+    start, end = 0, len(spans)
+    if words and len(spans) > words:
+        hits = [int(hit) for _, _, hit in spans]
+        window = best = sum(hits[:words])
+        start = 0
+        for i in range(1, len(spans) - words + 1):
+            window += hits[i + words - 1] - hits[i - 1]
+            if window > best:
+                best, start = window, i
+        first_hit = next((i for i in range(start, start + words) if hits[i]), start)
+        start = max(0, min(first_hit - 3, len(spans) - words))  # a little context before the first hit
+        end = start + words
+    if not spans:
+        return html.escape(text or "")
+    out, position = [], spans[start][0]
+    for first, last, hit in spans[start:end]:
+        out.append(html.escape(text[position:first]))
+        word = html.escape(text[first:last])
+        out.append(f"<mark>{word}</mark>" if hit else word)
+        position = last
+    tail = html.escape(text[position:]) if end == len(spans) else ""
+    return ("…" if start else "") + "".join(out) + tail + ("…" if end < len(spans) else "")
+
+
+def search(cursor, query, page=1, per_page=DEFAULT_PAGE_SIZE):
+    """One page of blogs matching ``query``, best first, with highlighted title and snippet."""
+    query_terms = set(terms(query))
+    scores = _scores(cursor, query_terms) if query_terms else {}
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+    hits = ranked[(page - 1) * per_page:page * per_page]
+    rows = {}
+    if hits:
+        cursor.execute(f"SELECT b.id, b.title, {_TEXT}, b.date_written FROM {_BLOGS} "
+                       f"WHERE b.id IN ({', '.join('?' * len(hits))})", [blog_id for blog_id, _ in hits])
+        rows = {row[0]: (row[1], _plain_text(row[2], row[3]), row[4]) for row in cursor.fetchall()}
+    results = [{
+        "id": blog_id,
+        "title": rows[blog_id][0],
+        "title_highlighted": _highlight(rows[blog_id][0], query_terms),
+        "snippet": _highlight(rows[blog_id][1], query_terms, SNIPPET_WORDS),
+        "date_written": rows[blog_id][2],
+        "score": round(score, 4),
+    } for blog_id, score in hits if blog_id in rows]  # a blog deleted outside the API is skipped
+    return {"query": query, "total": len(ranked), "page": page, "per_page": per_page, "results": results}
@@ -0,0 +1,174 @@
+"""Population view for doctors: BMI, IPAQ category, goal and habit distributions.
+
+All patients are read with one query and analysed as a pandas frame: BMI
+bands from ``weight``/``height``, counts per column and a few cross-tabs,
+optionally narrowed by filters (``bmi_band``, ``ipaQ_category``,
+``fitness_goal``, ``smoking``, ``drinking``, ``location``, ``min_age``,
+``max_age``).
+
+Both the frame and each filtered result are memoized per worker for
+``COHORT_CACHE_TTL_SECONDS`` (default 300). Routes that change the inputs
+call ``invalidate()``, so this worker's next read rebuilds. Other workers
+pick the change up when their TTL runs out.
+"""
+import datetime
+import os
+import threading
+import time
+
+COHORT_CACHE_TTL_SECONDS = float(os.getenv("COHORT_CACHE_TTL_SECONDS", "300"))
+MAX_CACHED_RESULTS = 128
+
+# WHO adult BMI bands (upper bound exclusive)
+BMI_BANDS = (("Underweight", 18.5), ("Normal", 25.0), ("Overweight", 30.0), ("Obese", float("inf")))
+UNKNOWN = "Unknown"
+CATEGORICAL_COLUMNS = ("bmi_band", "ipaQ_category", "fitness_goal", "smoking", "drinking")
+CROSSTABS = (("bmi_band", "ipaQ_category"), ("fitness_goal", "bmi_band"), ("smoking", "drinking"))
+FILTERS = CATEGORICAL_COLUMNS + ("location",)
+
+
+def load_pandas():
+    """Import pandas on first use; only the analytics need it."""
+    import numpy as np
+    import pandas as pd
+    return np, pd
+
+
+def fetch_cohort_frame(cursor):
+    """One row per patient with the columns the analytics use."""
+    np, pd = load_pandas()
+    cursor.execute("""
+        SELECT u.patient_id, u.DOB, u.Location, i.weight, i.height, i.fitness_goal, i.smoking, i.drinking,
+               a.ipaQ_category
+        FROM Users u
+        LEFT JOIN PatientInformation i ON i.patient_id = u.patient_id
+        LEFT JOIN PatientActivityData a ON a.patient_id = u.patient_id
+    """)
+    columns = ["patient_id", "dob", "location", "weight", "height", "fitness_goal", "smoking", "drinking",
+               "ipaQ_category"]
+    frame = pd.DataFrame.from_records([tuple(row) for row in cursor.fetchall()], columns=columns)
+
+    weight = pd.to_numeric(frame["weight"], errors="coerce")
+    height = pd.to_numeric(frame["height"], errors="coerce")
+    height_m = np.where(height > 3, height / 100, height)  # stored in cm by the app, metres by some imports
+    bmi = weight / np.square(height_m)
+    frame["bmi"] = bmi.where((bmi > 8) & (bmi < 80))
+    edges = [0] + [upper for _, upper in BMI_BANDS]
+    frame["bmi_band"] = pd.cut(frame["bmi"], edges, right=False, labels=[name for name, _ in BMI_BANDS]) \
+        .astype(object).fillna(UNKNOWN)
+
+    dob = pd.to_datetime(frame["dob"], errors="coerce")
+    frame["age"] = ((pd.Timestamp(datetime.date.today()) - dob).dt.days // 365.25)
+
+    for column in ("ipaQ_category", "fitness_goal", "smoking", "drinking", "location"):
+        values = frame[column].astype(object).where(frame[column].notna(), "").astype(str).str.strip()
+        frame[column] = values.str.capitalize().where(values != "", UNKNOWN)
+    return frame
+
+
+def summarize(frame):
+    """Distributions, cross-tabs and BMI statistics of ``frame``."""
+    _, pd = load_pandas()
+    bmi = frame["bmi"].dropna()
+    return {
+        "patients": int(len(frame)),
+        "distributions": {column: {str(k): int(v) for k, v in frame[column].value_counts().items()}
+                          for column in CATEGORICAL_COLUMNS},
+        "crosstabs": {
+            f"{rows}_by_{columns}": {str(r): {str(c): int(v) for c, v in counts.items() if v}
+                                     for r, counts in pd.crosstab(frame[rows], frame[columns]).iterrows()}
+            for rows, columns in CROSSTABS
+        },
+        "bmi": {
+            "known": int(len(bmi)),
+            "mean": round(float(bmi.mean()), 1) if len(bmi) else None,
+            "median": round(float(bmi.median()), 1) if len(bmi) else None,
+        },
+    }
+
+
+def normalize_filters(args):
+    """Pick the supported filters out of request args; raises ValueError on bad ages."""
+    filters = {}
+    for name in FILTERS:
+        value = (args.get(name) or "").strip()
+        if value:
+            filters[name] = value.capitalize()
+    for name in ("min_age", "max_age"):
+        if args.get(name):
+            try:
+                filters[name] = int(args[name])
+            except ValueError:
+                raise ValueError(f"{name} must be a whole number") from None
+    return filters
+
+
+def apply_filters(frame, filters):
+    mask = None
+    for name, value in filters.items():
+        if name == "min_age":
+            condition = frame["age"] >= value
+        elif name == "max_age":
+            condition = frame["age"] <= value
+        else:
+            condition = frame[name] == value
+        mask = condition if mask is None else mask & condition
+    return frame if mask is None else frame[mask]
+
+
+class CohortCache:
+    """Per-worker memo of the cohort frame and of filtered summaries."""
+
+    def __init__(self, ttl=COHORT_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._generation = 0
+        self._frame = None          # (generation, expires_at, frame)
+        self._results = {}          # key -> (expires_at, result)
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._frame = None
+            self._results.clear()
+
+    def _get_frame(self, load):
+        with self._build_lock:  # one rebuild at a time; waiting requests reuse it
+            with self._lock:
+                cached, generation = self._frame, self._generation
+            if cached and cached[0] == generation and cached[1] > time.monotonic():
+                return cached[2]
+            frame = load()
+            with self._lock:
+                if generation == self._generation:
+                    self._frame = (generation, time.monotonic() + self.ttl, frame)
+            return frame
+
+    def summary(self, filters, load):
+        """Summary for ``filters``; ``load()`` returns a fresh frame when the cache is cold."""
+        key = tuple(sorted(filters.items()))
+        now = time.monotonic()
+        with self._lock:
+            cached = self._results.get(key)
+            generation = self._generation
+        if cached and cached[0] > now:
+            return cached[1], True
+
+        result = summarize(apply_filters(self._get_frame(load), filters))
+        result["filters"] = filters
+        result["generated_at"] = datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds")
+        with self._lock:
+            if generation == self._generation:
+                if len(self._results) >= MAX_CACHED_RESULTS:
+                    self._results.pop(next(iter(self._results)))
+                self._results[key] = (now + self.ttl, result)
+        return result, False
+
+
+cache = CohortCache()
+
+
+def invalidate():
+    """Call after writes to Users, PatientInformation or PatientActivityData."""
+    cache.invalidate()
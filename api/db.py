@@ -0,0 +1,354 @@
+"""Database connection layer shared by the API routes.
+
+Connections are plain pyodbc connections wrapped so every statement can be
+observed (timings for /metrics, per-statement profile in ``api/profiler.py``).
+Listeners are registered with ``on_connect`` / ``on_query`` and must be
+cheap: they run inline on the request thread.
+
+Each connection and statement goes through the ``database`` circuit breaker
+and is bounded by the request deadline (``api/resilience.py``): the pyodbc
+login timeout is ``DB_LOGIN_TIMEOUT_SECONDS`` and the query timeout
+``DB_QUERY_TIMEOUT_SECONDS``, both cut to the time the request has left.
+While the circuit is open ``get_db_connection`` returns None at once.
+
+With a read replica configured (``DB_REPLICA_CONN_STR``, or
+``SQLITE_REPLICA_PATH`` for the embedded backend) connections opened by
+GET/HEAD requests go to the replica. Reads stay on the primary when:
+
+- the session wrote within ``REPLICA_STICKY_SECONDS``, so users see their own writes
+  (a non-GET request that committed and answered below 400; ``init_replica_routing``);
+- the replica lags more than ``REPLICA_MAX_LAG_SECONDS``;
+- the replica is down (its own ``database_replica`` circuit breaker).
+
+Lag is the age of the newest ``ReplicaHeartbeat`` row visible on the
+replica. Each worker writes the heartbeat on the primary and reads it back
+from the replica at most every ``REPLICA_CHECK_SECONDS``, and only while it
+routes reads. ``get_db_connection(readonly=False)`` forces the primary and
+``readonly=True`` asks for the replica outside a GET request.
+
+``DB_BACKEND=sqlite`` switches to the embedded backend in
+``api/embedded_db.py`` (database file from ``SQLITE_PATH``), used by the
+benchmarks and for running without SQL Server.
+"""
+import math
+import os
+import threading
+import time
+
+from flask import g, has_request_context, request, session
+
+from api import profiler, resilience
+from api.logs import get_logger
+
+log = get_logger(__name__)
+
+# "mssql" (default) or "sqlite" for the embedded backend
+DB_BACKEND = os.getenv("DB_BACKEND", "mssql").lower()
+SQLITE_PATH = os.getenv("SQLITE_PATH", "myh.sqlite3")
+DB_LOGIN_TIMEOUT_SECONDS = float(os.getenv("DB_LOGIN_TIMEOUT_SECONDS", "5"))
+DB_QUERY_TIMEOUT_SECONDS = float(os.getenv("DB_QUERY_TIMEOUT_SECONDS", "30"))
+# Read replica: ODBC connection string (Azure SQL read scale-out: conn_str + "ApplicationIntent=ReadOnly;")
+DB_REPLICA_CONN_STR = os.getenv("DB_REPLICA_CONN_STR", "")
+SQLITE_REPLICA_PATH = os.getenv("SQLITE_REPLICA_PATH", "")
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_CHECK_SECONDS = float(os.getenv("REPLICA_CHECK_SECONDS", "2"))
+# Longer than the lag we tolerate plus one check, so a session never reads from before its own write
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "10"))
+REPLICA_ENABLED = bool(SQLITE_REPLICA_PATH if DB_BACKEND == "sqlite" else DB_REPLICA_CONN_STR)
+READ_METHODS = frozenset({"GET", "HEAD"})
+STICKY_SESSION_KEY = "_db_wrote_at"
+
+# Detect environment (LOCAL or AZURE)
+ENV = os.getenv("ENVIRONMENT", "LOCAL")
+
+if ENV == "LOCAL":
+    # Local SQL Server using Windows Auth
+    DB_SERVER = r'localhost\SQLEXPRESS'
+    DB_DATABASE = 'UserDatabase'
+    conn_str = (
+        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+        f"SERVER={DB_SERVER};DATABASE={DB_DATABASE};Trusted_Connection=yes;"
+    )
+else:
+    # Azure SQL Server - use full credentials from environment
+    DB_SERVER = os.getenv("AZURE_SQL_SERVER")  # e.g. my-sqlserver.database.windows.net
+    DB_DATABASE = os.getenv("AZURE_SQL_DB")    # e.g. HealthPackageDB
+    DB_USER = os.getenv("AZURE_SQL_USER")      # e.g. sqladmin
+    DB_PASS = os.getenv("AZURE_SQL_PASS")      # Strong password
+
+    conn_str = (
+        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
+        f"SERVER={DB_SERVER};DATABASE={DB_DATABASE};"
+        f"UID={DB_USER};PWD={DB_PASS};Encrypt=yes;TrustServerCertificate=no;"
+    )
+
+_connect_listeners = []
+_query_listeners = []
+_route_listeners = []
+
+
+def on_connect(listener):
+    """Register ``listener(seconds, ok)`` called after every connection attempt."""
+    _connect_listeners.append(listener)
+    return listener
+
+
+def on_query(listener):
+    """Register ``listener(sql, params, seconds, ok)`` called after every statement."""
+    _query_listeners.append(listener)
+    return listener
+
+
+def on_route(listener):
+    """Register ``listener(target, reason)`` called for every connection while a replica is configured."""
+    _route_listeners.append(listener)
+    return listener
+
+
+class InstrumentedCursor:
+    """Cursor proxy that times ``execute``/``executemany``, counts fetched rows and notifies listeners."""
+
+    def __init__(self, cursor, breaker):
+        self._cursor = cursor
+        self._breaker = breaker
+        self._statement = None
+
+    def _run(self, method, sql, params):
+        resilience.check_deadline("database")
+        start = time.perf_counter()
+        ok = outage = False
+        try:
+            method(sql, *params)
+            ok = True
+        except Exception as e:
+            outage = _is_outage(e)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self._statement = profiler.record(sql, params, elapsed, ok, self._cursor.rowcount if ok else 0)
+            for listener in _query_listeners:
+                listener(sql, params, elapsed, ok)
+            if ok or outage:  # constraint violations and bad SQL say nothing about the server
+                self._breaker.record(ok, elapsed)
+        return self
+
+    def execute(self, sql, *params):
+        return self._run(self._cursor.execute, sql, params)
+
+    def executemany(self, sql, *params):
+        return self._run(self._cursor.executemany, sql, params)
+
+    def _fetched(self, rows):
+        if self._statement is not None and rows:
+            self._statement.rows += rows
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._fetched(row is not None)
+        return row
+
+    def fetchmany(self, *size):
+        rows = self._cursor.fetchmany(*size)
+        self._fetched(len(rows))
+        return rows
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._fetched(len(rows))
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._fetched(1)
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Connection proxy whose cursors are instrumented; ``replica`` tells where it points."""
+
+    def __init__(self, conn, replica=False):
+        self._conn = conn
+        self.replica = replica
+        self._breaker = resilience.replica if replica else resilience.database
+
+    def cursor(self):
+        if DB_BACKEND != "sqlite":
+            # pyodbc applies the connection's timeout to cursors created after it is set
+            self._conn.timeout = _timeout(DB_QUERY_TIMEOUT_SECONDS)
+        return InstrumentedCursor(self._conn.cursor(), self._breaker)
+
+    def commit(self):
+        self._conn.commit()
+        if not self.replica and has_request_context():
+            g.db_committed = True  # read by _stamp_write once the response is known
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _is_outage(error):
+    """Errors that mean the server is unreachable, overloaded or timing out."""
+    if type(error).__name__ not in ("OperationalError", "InterfaceError"):
+        return False
+    message = str(error).lower()
+    return "no such" not in message and "syntax error" not in message
+
+
+def is_unique_violation(error):
+    """A duplicate key in a unique index (pyodbc and sqlite3 both raise IntegrityError)."""
+    return type(error).__name__ == "IntegrityError"
+
+
+def _timeout(cap):
+    """Whole seconds (at least 1) for a driver timeout, bounded by the request deadline."""
+    return max(1, math.ceil(resilience.remaining(cap)))
+
+
+def _connect(replica=False):
+    if DB_BACKEND == "sqlite":
+        from api import embedded_db
+        return embedded_db.connect(SQLITE_REPLICA_PATH if replica else SQLITE_PATH)
+    import pyodbc
+    return pyodbc.connect(DB_REPLICA_CONN_STR if replica else conn_str, autocommit=True,
+                          timeout=_timeout(DB_LOGIN_TIMEOUT_SECONDS))
+
+
+class ReplicaLag:
+    """Seconds the replica is behind, re-measured at most every ``REPLICA_CHECK_SECONDS``.
+
+    None until the first measurement and after a failed one, which keeps reads on the primary.
+    """
+
+    def __init__(self):
+        self.seconds = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        due = self._checked_at is None or time.monotonic() - self._checked_at >= REPLICA_CHECK_SECONDS
+        # One thread measures; the others use the previous value meanwhile
+        if due and self._lock.acquire(blocking=False):
+            try:
+                self.seconds = self._measure()
+            finally:
+                self._checked_at = time.monotonic()
+                self._lock.release()
+        return self.seconds
+
+    def _measure(self):
+        # Plain connections: the heartbeat is not application traffic
+        try:
+            primary = _connect()
+            try:
+                cursor = primary.cursor()
+                cursor.execute("UPDATE ReplicaHeartbeat SET beat_at = ? WHERE id = 1", (time.time(),))
+                if cursor.rowcount == 0:
+                    cursor.execute("INSERT INTO ReplicaHeartbeat (id, beat_at) VALUES (1, ?)", (time.time(),))
+                primary.commit()
+            finally:
+                primary.close()
+            replica = _connect(replica=True)
+            try:
+                cursor = replica.cursor()
+                cursor.execute("SELECT beat_at FROM ReplicaHeartbeat WHERE id = 1")
+                row = cursor.fetchone()
+            finally:
+                replica.close()
+        except Exception as e:
+            log.warning("replica_lag_check_failed", error=str(e))
+            return None
+        lag = max(0.0, time.time() - row[0]) if row else None
+        if lag is None or lag > REPLICA_MAX_LAG_SECONDS:
+            log.warning("replica_lagging", lag_seconds=lag, max_lag_seconds=REPLICA_MAX_LAG_SECONDS)
+        return lag
+
+
+replica_lag = ReplicaLag()
+
+
+def _wants_replica(readonly):
+    if not REPLICA_ENABLED or readonly is False:
+        return False
+    if readonly is None:
+        if not has_request_context():
+            return False
+        if request.method not in READ_METHODS:
+            _notify_route("primary", "write")
+            return False
+        wrote_at = session.get(STICKY_SESSION_KEY)
+        if wrote_at and time.time() - wrote_at < REPLICA_STICKY_SECONDS:
+            _notify_route("primary", "sticky")
+            return False
+    lag = replica_lag.current()
+    if lag is None or lag > REPLICA_MAX_LAG_SECONDS:
+        _notify_route("primary", "lag_unknown" if lag is None else "lagging")
+        return False
+    return True
+
+
+def _stamp_write(response):
+    # Only a write that committed and succeeded pins the session to the primary (and sets a cookie)
+    if (REPLICA_ENABLED and request.method not in READ_METHODS and g.get("db_committed")
+            and response.status_code < 400):
+        session[STICKY_SESSION_KEY] = time.time()
+    return response
+
+
+def init_replica_routing(app):
+    """Record successful writes in the session so the following reads stay on the primary."""
+    app.after_request(_stamp_write)
+
+
+def _open(replica):
+    """Connection through the target's circuit breaker, or None if refused or failed."""
+    breaker = resilience.replica if replica else resilience.database
+    try:
+        breaker.before_call()
+    except resilience.DependencyUnavailable as e:
+        log.warning("db_connection_refused", reason=e.reason, replica=replica)
+        return None
+    start = time.perf_counter()
+    try:
+        conn = _connect(replica)
+    except Exception as e:
+        elapsed = time.perf_counter() - start
+        _notify_connect(elapsed, False)
+        breaker.record(False, elapsed)
+        log.error("db_connection_failed", error=str(e), replica=replica)
+        return None
+    elapsed = time.perf_counter() - start
+    _notify_connect(elapsed, True)
+    # Statement outcomes are what the window counts; a good connect only ends a half-open trial
+    breaker.record(True, elapsed, sample=False)
+    return InstrumentedConnection(conn, replica)
+
+
+# Function to connect to SQL Server
+def get_db_connection(readonly=None):
+    """Connection to the primary, or to the replica for reads (see module docstring); None on failure."""
+    try:
+        resilience.check_deadline("database")
+    except resilience.DependencyUnavailable as e:
+        log.warning("db_connection_refused", reason=e.reason)
+        return None
+    if _wants_replica(readonly):
+        conn = _open(replica=True)
+        if conn is not None:
+            _notify_route("replica", "read")
+            return conn
+        _notify_route("primary", "replica_down")
+    return _open(replica=False)
+
+
+def _notify_route(target, reason):
+    for listener in _route_listeners:
+        listener(target, reason)
+
+
+def _notify_connect(seconds, ok):
+    for listener in _connect_listeners:
+        listener(seconds, ok)
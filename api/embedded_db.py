@@ -0,0 +1,174 @@
+"""Embedded SQLite backend with a pyodbc-compatible surface.
+
+Selected with ``DB_BACKEND=sqlite`` (file from ``SQLITE_PATH``). It lets the
+benchmarks, the batch runner and local development run the unchanged
+``api/routes.py`` SQL without SQL Server:
+
+- rows support index, unpacking and attribute access (``row.patient_id``)
+  like ``pyodbc.Row``;
+- the few T-SQL constructs the app uses are rewritten on the fly
+  (``SELECT TOP n``, ``IF OBJECT_ID(...) IS NULL CREATE ...``, ``IF NOT
+  EXISTS (... sys.indexes ...) CREATE INDEX``, ``INCLUDE (...)``,
+  ``INT IDENTITY(1,1) PRIMARY KEY``, ``(MAX)`` types,
+  ``SYSUTCDATETIME()``/``GETDATE()`` in queries and defaults,
+  ``INSERT ... OUTPUT INSERTED.col VALUES (...)``, ``COLLATE
+  Latin1_General_BIN2``).
+
+It is not meant to be a general T-SQL translator; keep SQL in the app to
+that subset.
+
+``faults`` injects latency and errors for resilience tests, configured with
+``SQLITE_FAULTS`` (``"query_latency=0.5,query_error_rate=0.2"``) or
+``faults.configure(...)`` at runtime. A delay that would outlast the request
+deadline fails the way a pyodbc query timeout does.
+"""
+import datetime
+import functools
+import os
+import random
+import re
+import sqlite3
+import time
+
+from api import resilience
+
+_TOP = re.compile(r"^(\s*SELECT\s+)TOP\s*\(?\s*(\d+)\s*\)?\s+(.*?)(\s*;?\s*)$", re.IGNORECASE | re.DOTALL)
+_IF_MISSING_TABLE = re.compile(
+    r"^\s*IF\s+OBJECT_ID\(\s*'([^']+)'\s*,\s*'U'\s*\)\s+IS\s+NULL\s+CREATE\s+TABLE\s+", re.IGNORECASE)
+_IF_MISSING_INDEX = re.compile(
+    r"^\s*IF\s+NOT\s+EXISTS\s*\(\s*SELECT\s.*?\bsys\.indexes\b.*?\)\s*CREATE\s+(UNIQUE\s+)?(?:NONCLUSTERED\s+)?INDEX\s+",
+    re.IGNORECASE | re.DOTALL)
+_INCLUDE = re.compile(r"\s+INCLUDE\s*\([^)]*\)", re.IGNORECASE)  # SQLite indexes can't carry extra columns
+_IDENTITY_KEY = re.compile(r"\bINT\s+IDENTITY\s*\(\s*1\s*,\s*1\s*\)\s+PRIMARY\s+KEY\b", re.IGNORECASE)
+_MAX_TYPE = re.compile(r"\b(N?VARCHAR|VARBINARY)\s*\(\s*MAX\s*\)", re.IGNORECASE)
+_OUTPUT_INSERTED = re.compile(r"\s+OUTPUT\s+INSERTED\.(\w+)\s+(VALUES\s*\(.*\))(\s*;?\s*)$", re.IGNORECASE | re.DOTALL)
+_NOW_DEFAULT = re.compile(r"\bDEFAULT\s+(SYSUTCDATETIME|GETDATE)\(\s*\)", re.IGNORECASE)
+_BINARY_COLLATION = re.compile(r"\bCOLLATE\s+Latin1_General_BIN2\b", re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=512)
+def translate(sql):
+    """Rewrite the supported T-SQL constructs into SQLite syntax."""
+    match = _TOP.match(sql)
+    if match:
+        sql = f"{match.group(1)}{match.group(3)} LIMIT {match.group(2)}{match.group(4)}"
+    sql = _IF_MISSING_TABLE.sub("CREATE TABLE IF NOT EXISTS ", sql)
+    if _IF_MISSING_INDEX.match(sql):
+        sql = _IF_MISSING_INDEX.sub(lambda m: f"CREATE {m.group(1) or ''}INDEX IF NOT EXISTS ", sql)
+        sql = _INCLUDE.sub("", sql)
+    sql = _IDENTITY_KEY.sub("INTEGER PRIMARY KEY AUTOINCREMENT", sql)
+    sql = _MAX_TYPE.sub(lambda m: "BLOB" if m.group(1).upper() == "VARBINARY" else "TEXT", sql)
+    sql = _NOW_DEFAULT.sub("DEFAULT CURRENT_TIMESTAMP", sql)
+    sql = _BINARY_COLLATION.sub("COLLATE BINARY", sql)
+    sql = _OUTPUT_INSERTED.sub(lambda m: f" {m.group(2)} RETURNING {m.group(1)}{m.group(3)}", sql)
+    return sql
+
+
+class Row(tuple):
+    """Tuple row that also exposes columns as attributes, like ``pyodbc.Row``."""
+
+    __slots__ = ()
+    _columns = {}
+
+    def __getattr__(self, name):
+        try:
+            return self[self._columns[name]]
+        except KeyError:
+            raise AttributeError(name) from None
+
+
+@functools.lru_cache(maxsize=256)
+def _row_class(columns):
+    return type("Row", (Row,), {"__slots__": (), "_columns": {name: i for i, name in enumerate(columns)}})
+
+
+def _row_factory(cursor, values):
+    return _row_class(tuple(d[0] for d in cursor.description))(values)
+
+
+class Faults:
+    """Injected connect/query latency (seconds) and error rates (0..1)."""
+
+    FIELDS = ("connect_latency", "connect_error_rate", "query_latency", "query_error_rate")
+
+    def __init__(self, spec="", seed=None):
+        self.random = random.Random(seed)
+        self.configure(**{field: 0.0 for field in self.FIELDS})
+        for part in filter(None, (p.strip() for p in spec.split(","))):
+            name, _, value = part.partition("=")
+            if name not in self.FIELDS:
+                raise ValueError(f"unknown SQLITE_FAULTS field {name!r}; expected one of {', '.join(self.FIELDS)}")
+            self.configure(**{name: float(value)})
+
+    def configure(self, **values):
+        for name, value in values.items():
+            if name not in self.FIELDS:
+                raise TypeError(f"unknown fault {name!r}")
+            setattr(self, name, value)
+
+    def inject(self, latency, error_rate, what):
+        if latency:
+            left = resilience.remaining()
+            if left is not None and latency >= left:
+                time.sleep(max(0.0, left))
+                raise sqlite3.OperationalError(f"injected {what} timeout expired")
+            time.sleep(latency)
+        if error_rate and self.random.random() < error_rate:
+            raise sqlite3.OperationalError(f"injected {what} failure")
+
+
+faults = Faults(os.getenv("SQLITE_FAULTS", ""))
+
+
+class Cursor:
+    """pyodbc-style cursor over ``sqlite3``."""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def execute(self, sql, *params):
+        if len(params) == 1 and isinstance(params[0], (list, tuple)):
+            params = params[0]
+        faults.inject(faults.query_latency, faults.query_error_rate, "query")
+        self._cursor.execute(translate(sql), params)
+        return self
+
+    def executemany(self, sql, params):
+        faults.inject(faults.query_latency, faults.query_error_rate, "query")
+        self._cursor.executemany(translate(sql), params)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class Connection:
+    """pyodbc-style connection; autocommit mode, so ``commit`` is cheap."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def cursor(self):
+        return Cursor(self._conn.cursor())
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def _utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def connect(path, timeout=5.0):
+    """Open ``path`` in autocommit mode with WAL so readers don't block the writer."""
+    faults.inject(faults.connect_latency, faults.connect_error_rate, "connect")
+    conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+    conn.row_factory = _row_factory
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.create_function("SYSUTCDATETIME", 0, _utcnow)
+    conn.create_function("GETDATE", 0, _utcnow)
+    return Connection(conn)
@@ -0,0 +1,157 @@
+"""Streaming CSV/NDJSON extracts of patient and tracking tables.
+
+Rows are read in key order with ``fetchmany`` and turned into text one batch
+at a time, so memory stays flat whatever the table size. Every dataset is
+ordered by a unique key; ``after`` (the key of the last row received)
+resumes an interrupted export exactly where it stopped. Text key columns
+are ordered and compared with a binary collation, the way Python compares
+strings, not with the database's case-insensitive default. Meals and
+exercise include rows moved to cold storage (``api/archive.py``), merged in
+key order, and the merge needs both tiers sorted the same way. Used by ``GET /exports/<dataset>.<fmt>`` and
+``python -m scripts.export_data``. The endpoint serves patient data in bulk,
+so it needs ``Authorization: Bearer <EXPORT_TOKEN>`` and is disabled while
+``EXPORT_TOKEN`` is unset.
+"""
+import csv
+import datetime
+import functools
+import hmac
+import io
+import json
+import os
+
+from api import archive
+
+# Bearer token required by GET /exports/...; without one configured the endpoint is off
+EXPORT_TOKEN = os.getenv("EXPORT_TOKEN")
+BATCH_SIZE = 1000
+# Text key columns, ordered and compared in binary (code point) order like archive.row_order
+TEXT_KEYS = {"patient_id", "exercise_name"}
+BINARY_COLLATION = "Latin1_General_BIN2"
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+# name -> (table, key columns, exported columns); Users.Password is never exported
+DATASETS = {
+    "users": ("Users", ("patient_id",),
+              ("patient_id", "Name", "PhoneNumber", "Email", "DOB", "Location", "Occupation", "Username")),
+    "visits": ("PatientVisits", ("visit_id",),
+               ("visit_id", "patient_id", "visit_date", "weight", "height", "blood_pressure",
+                "medical_prescription", "diet_prescription", "exercise_prescription", "notes")),
+    "meals": ("PatientMealTracking", ("patient_id", "meal_date"),
+              ("patient_id", "meal_date", "breakfast", "lunch", "dinner", "snacks")),
+    # (patient, date, exercise) repeats in older data, so the row id completes the key
+    "exercise": ("PatientExerciseTracking", ("patient_id", "exercise_date", "exercise_name", "id"),
+                 ("patient_id", "exercise_date", "exercise_name", "duration_minutes", "id")),
+}
+
+
+def authorized(authorization):
+    """Whether an ``Authorization`` header carries ``EXPORT_TOKEN``."""
+    if not EXPORT_TOKEN:
+        return False
+    scheme, _, token = (authorization or "").partition(" ")
+    return scheme.lower() == "bearer" and hmac.compare_digest(token.strip().encode(), EXPORT_TOKEN.encode())
+
+
+def parse_after(dataset, value):
+    """Decode an ``after`` key: a JSON array of key values, or a bare value for single-column keys."""
+    if value in (None, ""):
+        return None
+    keys = DATASETS[dataset][1]
+    try:
+        after = json.loads(value)
+    except ValueError:
+        after = value
+    if not isinstance(after, list):
+        after = [after]
+    if len(after) != len(keys):
+        raise ValueError(f"after must have {len(keys)} value(s): {', '.join(keys)}")
+    return after
+
+
+def _ordered(key):
+    return f"{key} COLLATE {BINARY_COLLATION}" if key in TEXT_KEYS else key
+
+
+def _keyset_condition(keys):
+    # (k1 > ?) OR (k1 = ? AND k2 > ?) OR ... for rows strictly after the given key
+    clauses, params_index = [], []
+    for i, key in enumerate(keys):
+        clauses.append("(" + " AND ".join([f"{_ordered(k)} = ?" for k in keys[:i]] + [f"{_ordered(key)} > ?"]) + ")")
+        params_index.extend(range(i + 1))
+    return "(" + " OR ".join(clauses) + ")", params_index
+
+
+def iter_batches(cursor, dataset, after=None, patient_id=None, batch_size=BATCH_SIZE):
+    """Yield lists of rows (tuples) from ``dataset`` in key order, starting after ``after``."""
+    table, keys, columns = DATASETS[dataset]
+    conditions, params = [], []
+    if patient_id:
+        conditions.append("patient_id = ?")
+        params.append(patient_id)
+    if after:
+        condition, index = _keyset_condition(keys)
+        conditions.append(condition)
+        params.extend(after[i] for i in index)
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY {', '.join(map(_ordered, keys))}"
+    cursor.execute(sql, params)
+    if dataset not in archive.DATASETS or not archive.has_segments(dataset):
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [tuple(row) for row in rows]
+
+    key, order = functools.partial(archive.row_key, dataset), functools.partial(archive.row_order, dataset)
+    rows = archive.merge_sorted(_fetch_rows(cursor, batch_size),
+                                archive.iter_cold(dataset, patient_id, after), key, order)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _fetch_rows(cursor, batch_size):
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from (tuple(row) for row in rows)
+
+
+def _plain(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    return value
+
+
+def row_key(dataset, row):
+    """The ``after`` value that resumes right after ``row``."""
+    _, keys, columns = DATASETS[dataset]
+    return [_plain(row[columns.index(k)]) for k in keys]
+
+
+def csv_header(dataset):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(DATASETS[dataset][2])
+    return buffer.getvalue()
+
+
+def format_batch(dataset, rows, fmt):
+    """Serialize one batch of rows as CSV lines or NDJSON."""
+    columns = DATASETS[dataset][2]
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerows([[_plain(v) for v in row] for row in rows])
+        return buffer.getvalue()
+    return "".join(json.dumps(dict(zip(columns, map(_plain, row))), default=str) + "\n" for row in rows)
@@ -0,0 +1,165 @@
+"""IPAQ (long form) scoring from raw questionnaire answers.
+
+``IpaqPage.html`` posts the answers as form field ids (``"vigorous-job-days"``,
+``"vigorous-job-hours"``, ``"vigorous-job-minutes"``, ... and ``"job"``);
+``store_ipaq_data`` keeps them in ``IpaqResponses`` (migration 2) and stores
+the scores computed here in ``PatientActivityData``. ``score_answers`` works
+on arrays with one row per questionnaire, so ``scripts/rescore_ipaq.py``
+rescores every stored response in one call after a rule change. Bump ``RULES_VERSION``
+whenever the rules below change.
+
+Rules (IPAQ scoring protocol): MET-minutes per item are days × minutes per
+day × the item's MET value; days are capped at 7, minutes per day at 180 and
+bouts under 10 minutes are ignored. High: vigorous on 3+ days with total
+physical activity reaching 1500 MET-min/week, or 7+ activity days reaching
+3000. Moderate: 3+ days of at least 20 minutes of vigorous activity per day,
+5+ days reaching 150 minutes of moderate/walking, or 5+ activity days
+reaching 600 MET-min. Otherwise Low.
+"""
+import json
+
+RULES_VERSION = 3
+
+VIGOROUS, MODERATE, WALKING = "vigorous", "moderate", "walking"
+
+# (form id prefix, intensity, MET value, only counted for people with a job)
+ITEMS = (
+    ("vigorous-job", VIGOROUS, 8.0, True),
+    ("moderate-job", MODERATE, 4.0, True),
+    ("walking-job", WALKING, 3.3, True),
+    ("bicycle", MODERATE, 6.0, False),
+    ("walking-transport", WALKING, 3.3, False),
+    ("vigorous-garden", VIGOROUS, 5.5, False),
+    ("moderate-garden", MODERATE, 4.0, False),
+    ("moderate-home", MODERATE, 3.0, False),
+    ("walking-leisure", WALKING, 3.3, False),
+    ("vigorous-leisure", VIGOROUS, 8.0, False),
+    ("moderate-leisure", MODERATE, 4.0, False),
+)
+
+MAX_DAYS = 7
+MAX_MINUTES_PER_DAY = 180
+MIN_BOUT_MINUTES = 10
+CATEGORIES = ("Low", "Moderate", "High")
+
+
+def load_numpy():
+    """Import NumPy on first use so API workers don't pay for it at startup."""
+    import numpy as np
+    return np
+
+
+def _number(answers, field, low, high):
+    value = answers.get(field)
+    if value in (None, ""):
+        return 0
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number") from None
+    if not low <= value <= high:
+        raise ValueError(f"{field} must be between {low} and {high}")
+    return value
+
+
+def normalize_answers(answers):
+    """Validate raw answers; returns a dict of every answer field with numbers filled in."""
+    if not isinstance(answers, dict):
+        raise ValueError("answers must be an object")
+    job = answers.get("job")
+    normalized = {"job": job in (True, "yes", "Yes", "1", 1)}
+    for item, *_ in ITEMS:
+        normalized[f"{item}-days"] = _number(answers, f"{item}-days", 0, 7)
+        normalized[f"{item}-hours"] = _number(answers, f"{item}-hours", 0, 24)
+        normalized[f"{item}-minutes"] = _number(answers, f"{item}-minutes", 0, 59)
+    return normalized
+
+
+def answers_to_arrays(answer_list):
+    """Stack normalized answers into (job, days, minutes_per_day) arrays, one row per questionnaire."""
+    np = load_numpy()
+    n = len(answer_list)
+    job = np.zeros(n, dtype=bool)
+    days = np.zeros((n, len(ITEMS)))
+    minutes = np.zeros((n, len(ITEMS)))
+    for row, answers in enumerate(answer_list):
+        job[row] = answers["job"]
+        for col, (item, *_) in enumerate(ITEMS):
+            days[row, col] = answers[f"{item}-days"]
+            minutes[row, col] = answers[f"{item}-hours"] * 60 + answers[f"{item}-minutes"]
+    return job, days, minutes
+
+
+def score_arrays(job, days, minutes):
+    """Vectorized scoring; returns a dict of arrays (vigorous/moderate/walking/total MET-min, category)."""
+    np = load_numpy()
+    met_values = np.array([met for _, _, met, _ in ITEMS])
+    job_items = np.array([job_only for *_, job_only in ITEMS])
+    intensities = {level: np.array([intensity == level for _, intensity, _, _ in ITEMS])
+                   for level in (VIGOROUS, MODERATE, WALKING)}
+
+    minutes = np.minimum(minutes, MAX_MINUTES_PER_DAY)
+    counted = (minutes >= MIN_BOUT_MINUTES) & (days > 0) & (job[:, None] | ~job_items)
+    days = np.where(counted, np.minimum(days, MAX_DAYS), 0)
+    minutes = np.where(counted, minutes, 0)
+    met_minutes = days * minutes * met_values
+
+    scores, weekly_minutes, active_days = {}, {}, {}
+    for level, mask in intensities.items():
+        scores[level] = met_minutes[:, mask].sum(axis=1)
+        weekly_minutes[level] = (days * minutes)[:, mask].sum(axis=1)
+        active_days[level] = np.minimum(days[:, mask].sum(axis=1), MAX_DAYS)
+    total = scores[VIGOROUS] + scores[MODERATE] + scores[WALKING]
+    total_days = np.minimum(days.sum(axis=1), MAX_DAYS)
+    moderate_walking_days = np.minimum(active_days[MODERATE] + active_days[WALKING], MAX_DAYS)
+
+    # Days with at least 20 minutes of vigorous activity (per item, as days are summed elsewhere)
+    vigorous_20_days = np.minimum(np.where(minutes >= 20, days, 0)[:, intensities[VIGOROUS]].sum(axis=1), MAX_DAYS)
+
+    high = ((active_days[VIGOROUS] >= 3) & (total >= 1500)) | ((total_days >= 7) & (total >= 3000))
+    moderate = ((vigorous_20_days >= 3)
+                | ((moderate_walking_days >= 5) & (weekly_minutes[MODERATE] + weekly_minutes[WALKING] >= 150))
+                | ((total_days >= 5) & (total >= 600)))
+    category = np.array(CATEGORIES)[np.where(high, 2, np.where(moderate, 1, 0))]
+    return {
+        "ipaQ_vigorous_met": np.round(scores[VIGOROUS]),
+        "ipaQ_moderate_met": np.round(scores[MODERATE]),
+        "ipaQ_walking_met": np.round(scores[WALKING]),
+        "ipaQ_total_met": np.round(total),
+        "ipaQ_category": category,
+    }
+
+
+def score_answers(answer_list):
+    """Score many normalized answer dicts at once; returns one result dict per questionnaire."""
+    if not answer_list:
+        return []
+    scores = score_arrays(*answers_to_arrays(answer_list))
+    return [{key: (str(values[i]) if key == "ipaQ_category" else float(values[i])) for key, values in scores.items()}
+            for i in range(len(answer_list))]
+
+
+def score_one(answers):
+    """Validate and score one questionnaire; returns (normalized answers, scores)."""
+    normalized = normalize_answers(answers)
+    return normalized, score_answers([normalized])[0]
+
+
+def save_answers(cursor, patient_id, answers):
+    """Insert or replace the patient's raw answers (caller commits)."""
+    payload = json.dumps(answers, sort_keys=True)
+    cursor.execute("""
+        UPDATE IpaqResponses
+        SET answers = ?, rules_version = ?, submitted_at = SYSUTCDATETIME()
+        WHERE patient_id = ?
+    """, (payload, RULES_VERSION, patient_id))
+    if cursor.rowcount == 0:
+        cursor.execute("""
+            INSERT INTO IpaqResponses (patient_id, answers, rules_version)
+            VALUES (?, ?, ?)
+        """, (patient_id, payload, RULES_VERSION))
+
+
+def delete_answers(cursor, patient_id):
+    """Drop stored answers when scores arrive precomputed, so a rescore can't revive them."""
+    cursor.execute("DELETE FROM IpaqResponses WHERE patient_id = ?", (patient_id,))
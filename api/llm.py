@@ -0,0 +1,153 @@
+"""OpenAI access shared by the API routes.
+
+The ``openai`` package is imported on first use and one client is kept per
+worker. Every call is timed and its token usage recorded in /metrics.
+Calls can be recorded to and replayed from a cassette file for offline,
+reproducible runs (``api/llm_cassette.py``).
+
+Live calls go through the ``openai`` circuit breaker and time out after
+``OPENAI_TIMEOUT_SECONDS`` per attempt or when the request deadline runs
+out, whichever is sooner (``api/resilience.py``).
+"""
+import json
+import os
+import time
+
+from api import metrics, resilience
+from api.llm_cassette import get_cassette
+from api.logs import get_logger
+
+log = get_logger(__name__)
+
+OPENAI_MODEL = "gpt-4o"
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "60"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "1"))
+# Not worth starting a completion with less time than this left
+MIN_CALL_SECONDS = 2.0
+# Kept back from the request deadline to store the result or serve a fallback
+RESERVE_SECONDS = 2.0
+SYSTEM_PROMPT = "You are a medical expert."
+_openai_clients = {}
+
+
+class StructuredOutputError(Exception):
+    """The model's JSON did not pass the schema parser, even after repair attempts."""
+
+
+def get_openai_client(api_key):
+    """Return a cached OpenAI client for this worker (imports openai on first use)."""
+    client = _openai_clients.get(api_key)
+    if client is None:
+        import openai
+        client = _openai_clients[api_key] = openai.OpenAI(api_key=api_key, max_retries=OPENAI_MAX_RETRIES)
+    return client
+
+
+def _is_outage(error):
+    """Timeouts, connection errors, 429 and 5xx count against the circuit; other 4xx do not."""
+    status = getattr(error, "status_code", None)
+    return status is None or status == 429 or status >= 500
+
+
+def create_chat_completion(prompt, **options):
+    """Send one chat completion (system prompt + ``prompt``) and record its metrics.
+
+    Extra keyword arguments (e.g. ``response_format``) are passed to the API.
+    Raises on API errors. With ``LLM_CASSETTE`` set the call is recorded or
+    replayed (see ``api/llm_cassette.py``).
+    """
+    request = {
+        "model": OPENAI_MODEL,
+        "messages": [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        **options
+    }
+    cassette = get_cassette()
+
+    # Send request
+    log.debug("openai_request_sent", prompt_chars=len(prompt))
+    start = time.perf_counter()
+    try:
+        if cassette and cassette.replaying:
+            response = cassette.replay(request)
+        else:
+            # Get API key
+            api_key = os.getenv("OPENAI_API_KEY")
+            if not api_key:
+                raise ValueError("❌ API key not found. Please check .env file.")
+
+            resilience.check_deadline("openai", minimum=RESERVE_SECONDS + MIN_CALL_SECONDS)
+            # Split what is left of the request between the first attempt and its retries
+            left = resilience.remaining()
+            timeout = OPENAI_TIMEOUT_SECONDS if left is None else min(
+                OPENAI_TIMEOUT_SECONDS, (left - RESERVE_SECONDS) / (OPENAI_MAX_RETRIES + 1))
+            resilience.openai.before_call()
+            try:
+                # Reuse the worker's client instead of building a new one per call
+                response = get_openai_client(api_key).chat.completions.create(**request, timeout=timeout)
+            except Exception as e:
+                resilience.openai.record(not _is_outage(e), time.perf_counter() - start)
+                raise
+            resilience.openai.record(True, time.perf_counter() - start)
+            if cassette:
+                response = cassette.record(request, response, start)
+    except Exception:
+        metrics.observe_llm_call(OPENAI_MODEL, time.perf_counter() - start, ok=False)
+        raise
+    metrics.observe_llm_call(OPENAI_MODEL, time.perf_counter() - start, getattr(response, "usage", None))
+    log.debug("openai_response_received")
+    return response
+
+
+#function get openai response
+def get_openai_response(prompt):
+    """Fetch response from OpenAI API (Safe version with logging)."""
+    try:
+        response = create_chat_completion(prompt)
+        return response.choices[0].message.content
+
+    except resilience.DependencyUnavailable:
+        raise
+    except Exception as e:
+        # The desktop build sends this to log.txt (see api/logs.py)
+        log.exception("openai_error", error=str(e))
+        resilience.check_deadline("openai", minimum=RESERVE_SECONDS)  # the request ran out of time
+        return None
+
+
+def get_structured_response(prompt, schema_name, schema, parse, repair_attempts=1):
+    """Ask for JSON matching ``schema`` (strict structured output) and return ``parse(data)``.
+
+    ``parse`` must raise ``ValueError`` when the data does not fit. Malformed
+    output triggers up to ``repair_attempts`` follow-up calls that show the
+    model its previous answer and the error; after that
+    ``StructuredOutputError`` is raised. API errors propagate unchanged.
+    """
+    response_format = {
+        "type": "json_schema",
+        "json_schema": {"name": schema_name, "strict": True, "schema": schema},
+    }
+    request_prompt = prompt
+    for attempt in range(repair_attempts + 1):
+        message = create_chat_completion(request_prompt, response_format=response_format).choices[0].message
+        content = message.content or ""
+        try:
+            if getattr(message, "refusal", None):
+                raise ValueError(f"model refused: {message.refusal}")
+            return parse(json.loads(content))
+        except ValueError as e:  # json.JSONDecodeError is a ValueError too
+            error = str(e)
+            log.warning("structured_output_invalid", schema=schema_name, attempt=attempt, error=error)
+        request_prompt = f"""
+        {prompt}
+
+        Your previous answer was rejected because it did not match the required JSON schema.
+        Error: {error}
+        Previous answer:
+        {content}
+
+        Return the corrected JSON only.
+        """
+    raise StructuredOutputError(f"{schema_name}: {error}")
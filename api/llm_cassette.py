@@ -0,0 +1,185 @@
+"""Record/replay of OpenAI calls for reproducible offline runs.
+
+Set ``LLM_CASSETTE`` to a file and ``LLM_CASSETTE_MODE`` to:
+
+- ``record``: calls go to OpenAI as usual and each answer is appended to
+  the cassette (content, usage, latency and, for ``stream=True``, the
+  offset of every chunk);
+- ``replay``: answers come from the cassette and nothing is sent. A
+  request that was never recorded raises ``CassetteMiss``.
+
+Requests are matched by a SHA-256 of the model, messages and options;
+prompts themselves are not stored since they contain patient data. The
+same request recorded several times is replayed in recorded order.
+Replay is instant unless ``LLM_REPLAY_LATENCY`` is set: ``1`` sleeps for
+the recorded latency (and chunk timing), ``0.5`` for half of it. A path
+ending in ``.gz`` is gzip-compressed.
+
+    LLM_CASSETTE=runs/analysis.jsonl.gz LLM_CASSETTE_MODE=record python -m scripts.batch_regenerate ...
+    LLM_CASSETTE=runs/analysis.jsonl.gz LLM_CASSETTE_MODE=replay LLM_REPLAY_LATENCY=1 python -m benchmarks.load ...
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+RECORD = "record"
+REPLAY = "replay"
+
+LLM_CASSETTE = os.getenv("LLM_CASSETTE")
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", REPLAY if LLM_CASSETTE else "off").lower()
+LLM_REPLAY_LATENCY = float(os.getenv("LLM_REPLAY_LATENCY", "0"))
+
+
+class CassetteMiss(LookupError):
+    """Replay mode got a request that the cassette does not contain."""
+
+
+def request_key(request):
+    """Stable fingerprint of a chat completion request (model, messages, options)."""
+    blob = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def _open(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def _usage(usage):
+    if usage is None:
+        return None
+    return {"prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+            "completion_tokens": getattr(usage, "completion_tokens", 0) or 0}
+
+
+def _response(entry):
+    """Rebuild the attributes of a ChatCompletion that the app reads."""
+    message = SimpleNamespace(role="assistant", content=entry["content"], refusal=entry.get("refusal"))
+    usage = entry.get("usage")
+    return SimpleNamespace(
+        model=entry.get("model"),
+        choices=[SimpleNamespace(index=0, message=message, finish_reason=entry.get("finish_reason", "stop"))],
+        usage=SimpleNamespace(**usage, total_tokens=sum(usage.values())) if usage else None,
+    )
+
+
+def _chunk(model, content, finish_reason=None):
+    delta = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(model=model, usage=None,
+                           choices=[SimpleNamespace(index=0, delta=delta, finish_reason=finish_reason)])
+
+
+class Cassette:
+    """One cassette file in ``record`` or ``replay`` mode; safe to share between threads."""
+
+    def __init__(self, path, mode, latency_scale=0.0):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"unknown cassette mode {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._entries = {}   # key -> recorded entries, in order
+        self._played = {}    # key -> how many were replayed
+        if mode == REPLAY:
+            self._load()
+
+    @property
+    def replaying(self):
+        return self.mode == REPLAY
+
+    def _load(self):
+        with _open(self.path, "r") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries.setdefault(entry["key"], []).append(entry)
+
+    def _append(self, entry):
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock, _open(self.path, "a") as f:
+            f.write(line)
+
+    def _sleep(self, seconds):
+        if self.latency_scale and seconds > 0:
+            time.sleep(seconds * self.latency_scale)
+
+    def record(self, request, response, started):
+        """Store ``response`` for ``request`` and return it (or a recording wrapper for streams)."""
+        entry = {"key": request_key(request), "model": request.get("model")}
+        if request.get("stream"):
+            return self._record_stream(entry, response, started)
+        choice = response.choices[0]
+        entry.update({
+            "seconds": round(time.perf_counter() - started, 4),
+            "content": choice.message.content,
+            "refusal": getattr(choice.message, "refusal", None),
+            "finish_reason": choice.finish_reason,
+            "usage": _usage(getattr(response, "usage", None)),
+        })
+        self._append(entry)
+        return response
+
+    def _record_stream(self, entry, stream, started):
+        chunks, finish_reason = [], None
+        for chunk in stream:
+            if chunk.choices:
+                choice = chunk.choices[0]
+                if choice.delta.content:
+                    chunks.append([round(time.perf_counter() - started, 4), choice.delta.content])
+                finish_reason = choice.finish_reason or finish_reason
+            yield chunk
+        entry.update({
+            "seconds": round(time.perf_counter() - started, 4),
+            "content": "".join(text for _, text in chunks),
+            "finish_reason": finish_reason,
+            "chunks": chunks,
+            "usage": None,
+        })
+        self._append(entry)
+
+    def replay(self, request):
+        """Return the next recorded answer for ``request``; raises CassetteMiss if there is none."""
+        key = request_key(request)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                raise CassetteMiss(f"no recorded response for request {key[:12]} in {self.path}")
+            index = self._played.get(key, 0)
+            self._played[key] = index + 1
+        entry = entries[index % len(entries)]
+        if request.get("stream"):
+            return self._replay_stream(entry)
+        self._sleep(entry.get("seconds", 0))
+        return _response(entry)
+
+    def _replay_stream(self, entry):
+        chunks = entry.get("chunks") or [[entry.get("seconds", 0), entry["content"]]]
+        previous = 0.0
+        for offset, text in chunks:
+            self._sleep(offset - previous)
+            previous = offset
+            yield _chunk(entry.get("model"), text)
+        self._sleep(entry.get("seconds", previous) - previous)
+        yield _chunk(entry.get("model"), None, entry.get("finish_reason", "stop"))
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette():
+    """The process-wide cassette from the environment, or None when record/replay is off."""
+    global _cassette
+    if LLM_CASSETTE_MODE not in (RECORD, REPLAY) or not LLM_CASSETTE:
+        return None
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette(LLM_CASSETTE, LLM_CASSETTE_MODE, LLM_REPLAY_LATENCY)
+    return _cassette
@@ -0,0 +1,218 @@
+"""Structured, non-blocking logging.
+
+Request threads only put records on a bounded in-memory queue; a background
+``QueueListener`` formats them as JSON lines and writes them to stdout and/or
+a size-rotated file. When the queue is full the record is dropped (and
+counted) instead of blocking the request.
+
+    from api.logs import get_logger
+    log = get_logger(__name__)
+    log.info("ipaq_stored", patient_id=patient_id)
+    log.exception("diet_generation_failed", patient_id=patient_id)
+
+Fields listed in ``PHI_FIELDS`` are redacted at any depth and long strings
+are truncated, so request bodies can be passed as fields without leaking
+patient data. Configuration (env):
+
+- ``LOG_LEVEL`` (INFO), ``LOG_FILE`` (unset; ``log.txt`` in the desktop build)
+- ``LOG_MAX_BYTES`` (10 MB) / ``LOG_BACKUP_COUNT`` (5) for rotation
+- ``LOG_STDOUT`` (1), ``LOG_QUEUE_SIZE`` (10000), ``LOG_MAX_FIELD_CHARS`` (500)
+- ``LOG_SAMPLE_<LEVEL>`` e.g. ``LOG_SAMPLE_DEBUG=0.05`` keeps 5% of DEBUG records
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+
+PHI_FIELDS = frozenset({
+    "name", "email", "dob", "phone", "phone_number", "phonenumber", "location", "occupation",
+    "password", "username", "weight", "height", "blood_group", "blood_pressure",
+    "medical_history", "medical_prescription", "current_health_conditions", "treatment_details",
+    "allergies", "smoking", "drinking", "sleep_pattern", "notes", "fitness_goal",
+    "diet_prescription", "structured_diet_chart", "exercise_prescription", "analytics",
+    "breakfast", "lunch", "dinner", "snacks",
+    # IPAQ: raw answers (api/ipaq.py) and the scores older clients post
+    "answers", "job", "ipaq_vigorous_met", "ipaq_moderate_met", "ipaq_walking_met", "ipaq_total_met",
+    "ipaq_category",
+})
+REDACTED = "[REDACTED]"
+
+_STANDARD_KWARGS = ("exc_info", "stack_info", "stacklevel", "extra")
+_listener = None
+_handler = None
+_lock = threading.Lock()
+
+
+def redact(value, max_chars=500):
+    """Return a copy of ``value`` with PHI keys masked and long strings truncated."""
+    if isinstance(value, dict):
+        return {k: REDACTED if str(k).lower() in PHI_FIELDS else redact(v, max_chars)
+                for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v, max_chars) for v in value]
+    if isinstance(value, str) and len(value) > max_chars:
+        return value[:max_chars] + f"...[{len(value) - max_chars} more chars]"
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, event, request info and fields."""
+
+    def __init__(self, max_field_chars=500):
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        for key in ("method", "path"):
+            if hasattr(record, key):
+                entry[key] = getattr(record, key)
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(redact(fields, self.max_field_chars))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class LevelSampler(logging.Filter):
+    """Keeps a fraction of records per level; levels without a rate are always kept."""
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+class RequestContextFilter(logging.Filter):
+    """Tags records emitted inside a Flask request with its method and path."""
+
+    def filter(self, record):
+        try:
+            from flask import has_request_context, request
+            if has_request_context():
+                record.method = request.method
+                record.path = request.path
+        except ImportError:
+            pass
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that never blocks: records are dropped when the queue is full."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def prepare(self, record):
+        # Only resolve the message and traceback here; JSON formatting and
+        # redaction happen on the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class StructuredLogger(logging.LoggerAdapter):
+    """``log.info("event", key=value)``: keyword arguments become JSON fields."""
+
+    def process(self, msg, kwargs):
+        fields = {k: kwargs.pop(k) for k in list(kwargs) if k not in _STANDARD_KWARGS}
+        if fields:
+            extra = dict(kwargs.get("extra") or {})
+            extra["fields"] = {**extra.get("fields", {}), **fields}
+            kwargs["extra"] = extra
+        return msg, kwargs
+
+
+def get_logger(name):
+    return StructuredLogger(logging.getLogger(name), {})
+
+
+def _sample_rates():
+    rates = {}
+    for level_name in ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"):
+        value = os.getenv(f"LOG_SAMPLE_{level_name}")
+        if value is not None:
+            rates[logging.getLevelName(level_name)] = float(value)
+    return rates
+
+
+def init_logging(level=None, log_file=None):
+    """Install the queue handler on the root logger and start the writer thread (idempotent)."""
+    global _listener, _handler
+    with _lock:
+        if _listener is not None:
+            return _handler
+
+        if log_file is None:
+            # The windowed desktop build has no console, so it logs to a file
+            log_file = os.getenv("LOG_FILE") or ("log.txt" if getattr(sys, "frozen", False) else None)
+        formatter = JsonFormatter(int(os.getenv("LOG_MAX_FIELD_CHARS", "500")))
+
+        writers = []
+        if log_file:
+            file_handler = logging.handlers.RotatingFileHandler(
+                log_file,
+                maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+                backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+                encoding="utf-8",
+            )
+            writers.append(file_handler)
+        if os.getenv("LOG_STDOUT", "1") != "0" or not writers:
+            writers.append(logging.StreamHandler(sys.stdout))
+        for writer in writers:
+            writer.setFormatter(formatter)
+
+        _handler = DroppingQueueHandler(queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", "10000"))))
+        _handler.addFilter(LevelSampler(_sample_rates()))
+        _handler.addFilter(RequestContextFilter())
+
+        root = logging.getLogger()
+        root.addHandler(_handler)
+        root.setLevel(level or os.getenv("LOG_LEVEL", "INFO"))
+
+        _listener = logging.handlers.QueueListener(_handler.queue, *writers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _handler
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener, _handler
+    with _lock:
+        if _listener is None:
+            return
+        _listener.stop()
+        logging.getLogger().removeHandler(_handler)
+        _listener = _handler = None
@@ -0,0 +1,251 @@
+"""Meal-vs-prescription analysis used by ``analyze_meals`` and batch runs.
+
+The model returns the narrative analysis, the nutrient series for the bar
+chart and the comparison table in one JSON document; ``parse_meal_analysis``
+checks it field by field and converts it to the shapes the frontend already
+uses (``graph_data`` as columns, ``table_data`` as rows of five values).
+``analyze_patient_meals`` runs the whole pipeline for one patient.
+"""
+import io
+import math
+
+from api import archive, plan_items
+from api.llm import get_structured_response
+
+TABLE_COLUMNS = ["Nutrient", "Prescribed", "Actual", "Deviation", "Analysis"]
+
+MEAL_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "additionalProperties": False,
+    "required": ["analysis", "graph", "table"],
+    "properties": {
+        "analysis": {"type": "string"},
+        "graph": {
+            "type": "object",
+            "additionalProperties": False,
+            "required": ["Nutrient", "Prescribed", "Actual"],
+            "properties": {
+                "Nutrient": {"type": "array", "items": {"type": "string"}},
+                "Prescribed": {"type": "array", "items": {"type": "number"}},
+                "Actual": {"type": "array", "items": {"type": "number"}},
+            },
+        },
+        "table": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "additionalProperties": False,
+                "required": ["nutrient", "prescribed", "actual", "deviation", "analysis"],
+                "properties": {
+                    "nutrient": {"type": "string"},
+                    "prescribed": {"type": "number"},
+                    "actual": {"type": "number"},
+                    "deviation": {"type": "number"},
+                    "analysis": {"type": "string"},
+                },
+            },
+        },
+    },
+}
+
+
+def _require_keys(obj, keys, where):
+    if not isinstance(obj, dict):
+        raise ValueError(f"{where} must be an object")
+    missing = [k for k in keys if k not in obj]
+    extra = [k for k in obj if k not in keys]
+    if missing:
+        raise ValueError(f"{where} is missing {', '.join(missing)}")
+    if extra:
+        raise ValueError(f"{where} has unexpected {', '.join(extra)}")
+
+
+def _number(value, where):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise ValueError(f"{where} must be a finite number")
+    return value
+
+
+def _text(value, where, allow_empty=False):
+    if not isinstance(value, str) or (not allow_empty and not value.strip()):
+        raise ValueError(f"{where} must be a non-empty string")
+    return value
+
+
+def parse_meal_analysis(data):
+    """Validate decoded model output; return (analysis, graph_data, table_data) or raise ValueError."""
+    _require_keys(data, ["analysis", "graph", "table"], "root")
+    analysis = _text(data["analysis"], "analysis")
+
+    graph = data["graph"]
+    _require_keys(graph, ["Nutrient", "Prescribed", "Actual"], "graph")
+    columns = {}
+    for key in ("Nutrient", "Prescribed", "Actual"):
+        if not isinstance(graph[key], list) or not graph[key]:
+            raise ValueError(f"graph.{key} must be a non-empty array")
+        columns[key] = graph[key]
+    if not len(columns["Nutrient"]) == len(columns["Prescribed"]) == len(columns["Actual"]):
+        raise ValueError("graph arrays must have the same length")
+    graph_data = {
+        "Nutrient": [_text(v, f"graph.Nutrient[{i}]") for i, v in enumerate(columns["Nutrient"])],
+        "Prescribed": [_number(v, f"graph.Prescribed[{i}]") for i, v in enumerate(columns["Prescribed"])],
+        "Actual": [_number(v, f"graph.Actual[{i}]") for i, v in enumerate(columns["Actual"])],
+    }
+
+    table = data["table"]
+    if not isinstance(table, list) or not table:
+        raise ValueError("table must be a non-empty array")
+    table_data = []
+    for i, row in enumerate(table):
+        where = f"table[{i}]"
+        _require_keys(row, ["nutrient", "prescribed", "actual", "deviation", "analysis"], where)
+        table_data.append([
+            _text(row["nutrient"], f"{where}.nutrient"),
+            _number(row["prescribed"], f"{where}.prescribed"),
+            _number(row["actual"], f"{where}.actual"),
+            _number(row["deviation"], f"{where}.deviation"),
+            _text(row["analysis"], f"{where}.analysis", allow_empty=True),
+        ])
+
+    return analysis, graph_data, table_data
+
+
+class MealAnalysisUnavailable(LookupError):
+    """The patient has no diet prescription or no tracked meals; the message is user-facing."""
+
+
+def load_plotting():
+    """Import the plotting stack on first use; only the meal analysis needs it."""
+    import matplotlib
+    matplotlib.use('Agg')  # Ensure the use of a non-GUI backend for Matplotlib
+    import matplotlib.pyplot as plt
+    import pandas as pd
+    return plt, pd
+
+
+def fetch_meal_analysis_inputs(cursor, patient_id):
+    """Return (diet_prescription, meal_data) or raise MealAnalysisUnavailable.
+
+    When the diet chart has been parsed (``api/plan_items.py``) the
+    prescription is its ``compact_diet`` form, a few lines per day, instead
+    of the prose.
+    """
+    # 1. Fetch diet prescription (first row) and the parsed chart (migration 6 creates DietPlanItems)
+    cursor.execute("""
+        SELECT 0, diet_prescription, NULL, NULL, NULL, NULL, NULL, NULL, NULL
+        FROM PatientInformation WHERE patient_id = ?
+        UNION ALL
+        SELECT 1, NULL, day_number, meal, position, item, quantity, calories, alternative
+        FROM DietPlanItems WHERE patient_id = ?
+        ORDER BY 1, 3, 5
+    """, (patient_id, patient_id))
+    rows = cursor.fetchall()
+
+    if not rows or rows[0][0] != 0:
+        raise MealAnalysisUnavailable("No diet prescription found for this patient.")
+
+    diet_prescription = rows[0][1]
+    if len(rows) > 1:
+        diet_prescription = "Planned meals per day:\n" + plan_items.compact_diet(
+            [plan_items.DietItem(*row[2:]) for row in rows[1:]])
+
+    # 2. Fetch meal tracking data
+    cursor.execute("SELECT meal_date, breakfast, lunch, dinner, snacks FROM PatientMealTracking WHERE patient_id = ?", (patient_id,))
+    meal_logs = archive.patient_rows("meals", patient_id, cursor.fetchall())
+
+    if not meal_logs:
+        raise MealAnalysisUnavailable("No meal tracking data found for this patient.")
+
+    meal_data = []
+    for meal in meal_logs:
+        meal_date, breakfast, lunch, dinner, snacks = meal
+        meal_data.append({
+            "meal_date": meal_date,
+            "breakfast": breakfast,
+            "lunch": lunch,
+            "dinner": dinner,
+            "snacks": snacks
+        })
+    return diet_prescription, meal_data
+
+
+def run_meal_analysis(diet_prescription, meal_data):
+    """One structured-output call; returns (analysis, graph_data, table_data)."""
+    analysis_prompt = f"""
+        The patient has a diet prescription as follows:
+        {diet_prescription}
+
+        The patient ate the following meals on different days:
+        {meal_data}
+
+        Also based on the {meal_data} first understand what kind of food the patient eats , like understand the cuisine first. Once you understand that then generate the analysis.
+        Analyze the meals compared to the diet prescription and determine if the patient ate appropriately.
+        Highlight if they consumed too much, too little, or the right amount. Suggest necessary dietary changes.
+
+        Return JSON with:
+        - "analysis": the full written analysis described above.
+        - "graph": daily nutritional summary for a bar chart, prescribed vs actual, for Calories, Carbs, Protein, Fats, e.g.
+          {{"Nutrient": ["Calories", "Carbs", "Protein", "Fats"], "Prescribed": [2000, 300, 100, 70], "Actual": [2500, 400, 90, 110]}}
+        - "table": one row per nutrient with nutrient, prescribed, actual, deviation (actual - prescribed) and a short analysis, e.g.
+          {{"nutrient": "Calories", "prescribed": 2000, "actual": 2500, "deviation": 500, "analysis": "Too much"}}
+        The graph and table values must agree with the written analysis.
+        """
+    return get_structured_response(analysis_prompt, "meal_analysis", MEAL_ANALYSIS_SCHEMA, parse_meal_analysis)
+
+
+def render_meal_charts(graph_data, table_data):
+    """Render the bar chart and the comparison table; returns (graph_png, table_png)."""
+    plt, pd = load_plotting()
+
+    # Generate graph image
+    df_graph = pd.DataFrame(graph_data)
+    fig1, ax1 = plt.subplots()
+    df_graph.set_index('Nutrient').plot(kind='bar', ax=ax1)
+    ax1.set_title("Prescribed vs Actual Nutrient Intake")
+    ax1.set_ylabel("Grams / Calories")
+    ax1.legend()
+
+    buf1 = io.BytesIO()
+    plt.savefig(buf1, format='png')
+    buf1.seek(0)
+    graph_image = buf1.read()
+    plt.close(fig1)
+
+    # Generate table image
+    df_table = pd.DataFrame(table_data, columns=TABLE_COLUMNS)
+    fig2, ax2 = plt.subplots(figsize=(6, 4))
+    ax2.axis('off')
+    tbl = ax2.table(cellText=df_table.values, colLabels=df_table.columns, loc='center')
+    tbl.auto_set_font_size(False)
+    tbl.set_fontsize(10)
+    tbl.scale(1.2, 1.5)
+
+    buf2 = io.BytesIO()
+    plt.savefig(buf2, format='png')
+    buf2.seek(0)
+    table_image = buf2.read()
+    plt.close(fig2)
+
+    return graph_image, table_image
+
+
+def analyze_patient_meals(cursor, patient_id):
+    """Fetch inputs, analyse, render and store (caller commits); returns the results dict."""
+    diet_prescription, meal_data = fetch_meal_analysis_inputs(cursor, patient_id)
+    analysis, graph_data, table_data = run_meal_analysis(diet_prescription, meal_data)
+    graph_image, table_image = render_meal_charts(graph_data, table_data)
+
+    # Store everything in DB
+    cursor.execute("""
+        UPDATE PatientInformation
+        SET analytics = ?, graph_image = ?, table_image = ?
+        WHERE patient_id = ?
+    """, (analysis, graph_image, table_image, patient_id))
+
+    return {
+        "analysis": analysis,
+        "graph_data": graph_data,
+        "table_data": table_data,
+        "graph_image": graph_image,
+        "table_image": table_image,
+    }
@@ -0,0 +1,113 @@
+"""Bulk meal logging and date-range reads for ``PatientMealTracking``.
+
+``upsert_meals`` writes any number of dated entries for one patient with a
+single set-based statement (``MERGE`` on SQL Server, ``INSERT ... ON
+CONFLICT`` on the embedded backend) instead of a check-then-write round trip
+per day. ``fetch_meals`` returns a date range in columnar form, one list per
+column, which is what the tracking page renders, including days already
+moved to cold storage (``api/archive.py``).
+"""
+import datetime
+
+from api import archive, db
+
+MEAL_FIELDS = ("breakfast", "lunch", "dinner", "snacks")
+MEAL_COLUMNS = ("meal_date",) + MEAL_FIELDS
+
+# SQL Server allows 2100 parameters per statement; 5 per entry plus 2
+MAX_BATCH_ENTRIES = 366
+MAX_RANGE_DAYS = 366
+DEFAULT_RANGE_DAYS = 7
+
+
+def parse_date(value, field):
+    """``YYYY-MM-DD`` string to a date; raises ValueError with a user-facing message."""
+    try:
+        return datetime.date.fromisoformat(str(value).strip())
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a date in YYYY-MM-DD format") from None
+
+
+def _meal_text(entry, field, where):
+    value = entry.get(field)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise ValueError(f"{f'{where}.{field}' if where else field} must be a string")
+    return value.strip()
+
+
+def normalize_entry(entry, where=""):
+    """Validate one meal entry; returns a (meal_date, breakfast, lunch, dinner, snacks) tuple."""
+    if not isinstance(entry, dict):
+        raise ValueError(f"{where or 'entry'} must be an object")
+    meal_date = parse_date(entry.get("meal_date"), f"{where}.meal_date" if where else "meal_date")
+    return (meal_date.isoformat(),) + tuple(_meal_text(entry, field, where) for field in MEAL_FIELDS)
+
+
+def normalize_entries(entries):
+    """Validate a batch of meal entries; later entries for the same date replace earlier ones."""
+    if not isinstance(entries, list) or not entries:
+        raise ValueError("entries must be a non-empty list")
+    if len(entries) > MAX_BATCH_ENTRIES:
+        raise ValueError(f"At most {MAX_BATCH_ENTRIES} entries per request")
+    rows = {}
+    for i, entry in enumerate(entries):
+        row = normalize_entry(entry, f"entries[{i}]")
+        rows[row[0]] = row
+    return [rows[day] for day in sorted(rows)]
+
+
+def _merge_sql(count):
+    values = ", ".join(["(CAST(? AS DATE), ?, ?, ?, ?)"] * count)
+    return f"""
+        MERGE PatientMealTracking WITH (HOLDLOCK) AS t
+        USING (VALUES {values}) AS s (meal_date, breakfast, lunch, dinner, snacks)
+        ON t.patient_id = ? AND t.meal_date = s.meal_date
+        WHEN MATCHED THEN
+            UPDATE SET breakfast = s.breakfast, lunch = s.lunch, dinner = s.dinner, snacks = s.snacks
+        WHEN NOT MATCHED THEN
+            INSERT (patient_id, meal_date, breakfast, lunch, dinner, snacks)
+            VALUES (?, s.meal_date, s.breakfast, s.lunch, s.dinner, s.snacks);
+    """
+
+
+def _sqlite_upsert_sql(count):
+    values = ", ".join(["(?, ?, ?, ?, ?, ?)"] * count)
+    return f"""
+        INSERT INTO PatientMealTracking (patient_id, meal_date, breakfast, lunch, dinner, snacks)
+        VALUES {values}
+        ON CONFLICT (patient_id, meal_date) DO UPDATE SET
+            breakfast = excluded.breakfast, lunch = excluded.lunch,
+            dinner = excluded.dinner, snacks = excluded.snacks
+    """
+
+
+def upsert_meals(cursor, patient_id, rows):
+    """Insert or update normalized ``rows`` in one statement (caller commits)."""
+    if db.DB_BACKEND == "sqlite":
+        params = [value for row in rows for value in (patient_id,) + row]
+        cursor.execute(_sqlite_upsert_sql(len(rows)), params)
+    else:
+        params = [value for row in rows for value in row] + [patient_id, patient_id]
+        cursor.execute(_merge_sql(len(rows)), params)
+
+
+def _iso(value):
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def fetch_meals(cursor, patient_id, start, end):
+    """Meals between ``start`` and ``end`` (inclusive) as ``{column: [values]}`` ordered by date."""
+    cursor.execute("""
+        SELECT meal_date, breakfast, lunch, dinner, snacks
+        FROM PatientMealTracking
+        WHERE patient_id = ? AND meal_date BETWEEN ? AND ?
+        ORDER BY meal_date
+    """, (patient_id, start.isoformat(), end.isoformat()))
+    columns = {name: [] for name in MEAL_COLUMNS}
+    for row in archive.patient_rows("meals", patient_id, cursor.fetchall(), start, end):
+        columns["meal_date"].append(_iso(row[0])[:10])
+        for name, value in zip(MEAL_FIELDS, row[1:]):
+            columns[name].append(value or "")
+    return columns
@@ -0,0 +1,304 @@
+"""In-process metrics with a Prometheus text endpoint.
+
+``init_metrics(app)`` hooks the Flask app and exposes ``GET /metrics``:
+
+- ``http_requests_total`` / ``http_request_duration_seconds`` per route
+- ``db_queries_per_request`` and ``db_query_seconds_per_request`` per route
+- ``db_connection_acquire_seconds`` for every ``get_db_connection`` call
+- ``db_connections_routed_total`` (primary or replica, and why) when a read replica is configured
+- ``openai_request_duration_seconds`` and token counters per model
+- ``admission_rejections_total`` and ``llm_requests_in_flight`` from ``api/admission.py``
+- ``circuit_state`` and ``dependency_unavailable_total`` from ``api/resilience.py``
+
+Recording is a dict lookup plus a few additions under a lock, cheap enough
+to leave on in production. Values are per process: with several gunicorn
+workers each one reports its own numbers, so scrape every worker or rely on
+the per-instance series. Set ``METRICS_ENABLED=0`` to turn collection off.
+"""
+import bisect
+import os
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+
+from api import db, resilience
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs.extend(f'{n}="{v}"' for n, v in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, *labels):
+        series = self._series.get(labels)
+        return series[-1] if series else 0
+
+    def collect(self):
+        with self._lock:
+            items = sorted((labels, list(series)) for labels, series in self._series.items())
+        for labels, series in items:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, series):
+                cumulative += hits
+                yield (f"{self.name}_bucket"
+                       f"{_format_labels(self.labelnames, labels, [('le', _format_value(bound))])} {cumulative}")
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', '+Inf')])} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(series[-2])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, labels)} {series[-1]}"
+
+
+class Gauge:
+    """Value that goes up and down, with optional labels."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[labels] = value
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def collect(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"
+
+
+class Registry:
+    """Ordered collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+http_requests_total = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests handled.", ("endpoint", "method", "status")))
+http_request_duration_seconds = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency.", ("endpoint", "method")))
+db_queries_per_request = REGISTRY.register(Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request.", ("endpoint",), COUNT_BUCKETS))
+db_query_seconds_per_request = REGISTRY.register(Histogram(
+    "db_query_seconds_per_request", "Cumulative SQL time per HTTP request.", ("endpoint",), DB_LATENCY_BUCKETS))
+db_queries_total = REGISTRY.register(Counter(
+    "db_queries_total", "SQL statements executed.", ("outcome",)))
+db_connection_acquire_seconds = REGISTRY.register(Histogram(
+    "db_connection_acquire_seconds", "Time to open a database connection.", ("outcome",), DB_LATENCY_BUCKETS))
+db_connections_routed_total = REGISTRY.register(Counter(
+    "db_connections_routed_total", "Connections by target (primary/replica) and routing reason.",
+    ("target", "reason")))
+openai_request_duration_seconds = REGISTRY.register(Histogram(
+    "openai_request_duration_seconds", "OpenAI chat completion latency.", ("model", "outcome")))
+openai_prompt_tokens_total = REGISTRY.register(Counter(
+    "openai_prompt_tokens_total", "Prompt tokens reported by OpenAI.", ("model",)))
+openai_completion_tokens_total = REGISTRY.register(Counter(
+    "openai_completion_tokens_total", "Completion tokens reported by OpenAI.", ("model",)))
+openai_tokens_per_call = REGISTRY.register(Histogram(
+    "openai_tokens_per_call", "Prompt and completion tokens per OpenAI call.", ("model", "kind"), TOKEN_BUCKETS))
+admission_rejections_total = REGISTRY.register(Counter(
+    "admission_rejections_total", "Requests refused with 429 by admission control.", ("policy", "reason")))
+llm_requests_in_flight = REGISTRY.register(Gauge(
+    "llm_requests_in_flight", "LLM-backed requests currently running in this worker."))
+circuit_state = REGISTRY.register(Gauge(
+    "circuit_state", "Circuit breaker state per dependency (0 closed, 1 half-open, 2 open).", ("dependency",)))
+dependency_unavailable_total = REGISTRY.register(Counter(
+    "dependency_unavailable_total", "Calls refused by an open circuit or an exhausted deadline.",
+    ("dependency", "reason")))
+
+CIRCUIT_STATES = {resilience.CircuitBreaker.CLOSED: 0, resilience.CircuitBreaker.HALF_OPEN: 1,
+                  resilience.CircuitBreaker.OPEN: 2}
+
+
+def _outcome(ok):
+    return "ok" if ok else "error"
+
+
+@db.on_connect
+def _record_connect(seconds, ok):
+    if METRICS_ENABLED:
+        db_connection_acquire_seconds.observe(seconds, _outcome(ok))
+
+
+@db.on_query
+def _record_query(sql, params, seconds, ok):
+    if not METRICS_ENABLED:
+        return
+    db_queries_total.inc(_outcome(ok))
+    if has_request_context():
+        g._metrics_db_queries = g.get("_metrics_db_queries", 0) + 1
+        g._metrics_db_seconds = g.get("_metrics_db_seconds", 0.0) + seconds
+
+
+@db.on_route
+def _record_route(target, reason):
+    if METRICS_ENABLED:
+        db_connections_routed_total.inc(target, reason)
+
+
+@resilience.on_state_change
+def _record_circuit_state(dependency, state):
+    if METRICS_ENABLED:
+        circuit_state.set(dependency, value=CIRCUIT_STATES[state])
+
+
+@resilience.on_unavailable
+def _record_unavailable(dependency, reason):
+    if METRICS_ENABLED:
+        dependency_unavailable_total.inc(dependency, reason)
+
+
+def observe_llm_call(model, seconds, usage=None, ok=True):
+    """Record one OpenAI call; ``usage`` is the response's usage object (or None)."""
+    if not METRICS_ENABLED:
+        return
+    openai_request_duration_seconds.observe(seconds, model, _outcome(ok))
+    if usage is None:
+        return
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    openai_prompt_tokens_total.inc(model, amount=prompt_tokens)
+    openai_completion_tokens_total.inc(model, amount=completion_tokens)
+    openai_tokens_per_call.observe(prompt_tokens, model, "prompt")
+    openai_tokens_per_call.observe(completion_tokens, model, "completion")
+
+
+def _endpoint():
+    """Route template (e.g. /patients/<string:patient_id>/info) to keep label cardinality bounded."""
+    return request.url_rule.rule if request.url_rule else "unmatched"
+
+
+def _before_request():
+    g._metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.pop("_metrics_start", None)
+    if start is None:
+        return response
+    endpoint = _endpoint()
+    if endpoint == "/metrics":
+        return response
+    http_request_duration_seconds.observe(time.perf_counter() - start, endpoint, request.method)
+    http_requests_total.inc(endpoint, request.method, str(response.status_code))
+    db_queries_per_request.observe(g.pop("_metrics_db_queries", 0), endpoint)
+    db_query_seconds_per_request.observe(g.pop("_metrics_db_seconds", 0.0), endpoint)
+    return response
+
+
+def metrics_view():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4")
+
+
+def init_metrics(app):
+    """Register request hooks and the /metrics endpoint on the Flask app."""
+    if METRICS_ENABLED:
+        app.before_request(_before_request)
+        app.after_request(_after_request)
+    app.add_url_rule("/metrics", "metrics", metrics_view, methods=["GET"])
+
+
+def observe_admission_rejection(policy, reason):
+    """Count one request refused by admission control (``reason`` is the bucket scope or ``queue``)."""
+    if METRICS_ENABLED:
+        admission_rejections_total.inc(policy, reason)
+
+
+def track_llm_in_flight(delta):
+    if METRICS_ENABLED:
+        llm_requests_in_flight.inc(amount=delta)
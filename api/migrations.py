@@ -0,0 +1,384 @@
+"""Versioned schema migrations for SQL Server and the embedded backend.
+
+``MIGRATIONS`` is an ordered list of (version, name, statements). The
+statements are T-SQL in the subset ``api/embedded_db.py`` translates, so
+the same list builds both backends. Applied versions are recorded in
+``SchemaMigrations``. Every statement is guarded (``IF OBJECT_ID(...) IS
+NULL``, ``IF NOT EXISTS (... sys.indexes ...)``), so a migration that
+failed halfway can simply be run again. Never edit a migration that has
+shipped; append a new one.
+
+``INDEXES`` declares the indexes behind the per-request lookups (login by
+username, search, meals and exercise by patient and day, visits, blogs).
+``check_indexes`` verifies them against the live database by key columns,
+whatever the index is called, so indexes created by hand also count.
+
+Apply with ``python init_db.py`` or ``python -m scripts.migrate``. Check
+with ``python -m scripts.migrate --check``.
+"""
+import collections
+
+from api.logs import get_logger
+
+log = get_logger(__name__)
+
+Migration = collections.namedtuple("Migration", "version name statements")
+Index = collections.namedtuple("Index", "name table columns unique include where")
+
+SCHEMA_MIGRATIONS_DDL = """
+IF OBJECT_ID('SchemaMigrations', 'U') IS NULL
+CREATE TABLE SchemaMigrations (
+    version INT NOT NULL PRIMARY KEY,
+    name NVARCHAR(100) NOT NULL,
+    applied_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+)
+"""
+
+BASE_TABLES = ("""
+IF OBJECT_ID('Users', 'U') IS NULL
+CREATE TABLE Users (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    patient_id NVARCHAR(20) NOT NULL,
+    Name NVARCHAR(100),
+    PhoneNumber NVARCHAR(20),
+    Email NVARCHAR(255),
+    DOB DATE,
+    Location NVARCHAR(100),
+    Occupation NVARCHAR(100),
+    Username NVARCHAR(100),
+    Password NVARCHAR(255)
+)
+""", """
+IF OBJECT_ID('PatientInformation', 'U') IS NULL
+CREATE TABLE PatientInformation (
+    patient_id NVARCHAR(20) NOT NULL PRIMARY KEY,
+    weight FLOAT,
+    height FLOAT,
+    blood_group NVARCHAR(10),
+    medical_history NVARCHAR(MAX),
+    medical_prescription NVARCHAR(MAX),
+    diet_prescription NVARCHAR(MAX),
+    structured_diet_chart NVARCHAR(MAX),
+    exercise_prescription NVARCHAR(MAX),
+    current_health_conditions NVARCHAR(MAX),
+    treatment_details NVARCHAR(MAX),
+    fitness_goal NVARCHAR(MAX),
+    allergies NVARCHAR(MAX),
+    smoking NVARCHAR(50),
+    drinking NVARCHAR(50),
+    sleep_pattern NVARCHAR(100),
+    analytics NVARCHAR(MAX),
+    graph_image VARBINARY(MAX),
+    table_image VARBINARY(MAX)
+)
+""", """
+IF OBJECT_ID('PatientVisits', 'U') IS NULL
+CREATE TABLE PatientVisits (
+    visit_id INT IDENTITY(1,1) PRIMARY KEY,
+    patient_id NVARCHAR(20) NOT NULL,
+    visit_date DATETIME2 DEFAULT SYSUTCDATETIME(),
+    weight FLOAT,
+    height FLOAT,
+    blood_pressure NVARCHAR(20),
+    medical_prescription NVARCHAR(MAX),
+    diet_prescription NVARCHAR(MAX),
+    exercise_prescription NVARCHAR(MAX),
+    notes NVARCHAR(MAX)
+)
+""", """
+IF OBJECT_ID('PatientActivityData', 'U') IS NULL
+CREATE TABLE PatientActivityData (
+    patient_id NVARCHAR(20) NOT NULL PRIMARY KEY,
+    day1_meal NVARCHAR(MAX),
+    day2_meal NVARCHAR(MAX),
+    day3_meal NVARCHAR(MAX),
+    ipaQ_vigorous_met FLOAT,
+    ipaQ_moderate_met FLOAT,
+    ipaQ_walking_met FLOAT,
+    ipaQ_total_met FLOAT,
+    ipaQ_category NVARCHAR(20)
+)
+""", """
+IF OBJECT_ID('PatientMealTracking', 'U') IS NULL
+CREATE TABLE PatientMealTracking (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    patient_id NVARCHAR(20) NOT NULL,
+    meal_date DATE NOT NULL,
+    breakfast NVARCHAR(MAX),
+    lunch NVARCHAR(MAX),
+    dinner NVARCHAR(MAX),
+    snacks NVARCHAR(MAX)
+)
+""", """
+IF OBJECT_ID('PatientExerciseTracking', 'U') IS NULL
+CREATE TABLE PatientExerciseTracking (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    patient_id NVARCHAR(20) NOT NULL,
+    exercise_name NVARCHAR(100) NOT NULL,
+    duration_minutes INT,
+    exercise_date DATE NOT NULL
+)
+""", """
+IF OBJECT_ID('DoctorBlogs', 'U') IS NULL
+CREATE TABLE DoctorBlogs (
+    id INT IDENTITY(1,1) PRIMARY KEY,
+    title NVARCHAR(255) NOT NULL,
+    content NVARCHAR(MAX) NOT NULL,
+    date_written DATE NOT NULL
+)
+""")
+
+# Tables owned by API modules; their ensure_* helpers run the same DDL for
+# databases that haven't been migrated yet
+DRAFTS_DDL = """
+IF OBJECT_ID('PlanDrafts', 'U') IS NULL
+CREATE TABLE PlanDrafts (
+    patient_id NVARCHAR(20) NOT NULL,
+    plan_type NVARCHAR(20) NOT NULL,
+    input_fingerprint CHAR(64) NOT NULL,
+    payload NVARCHAR(MAX) NOT NULL,
+    created_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+    PRIMARY KEY (patient_id, plan_type)
+)
+"""
+
+ROLLUP_DDL = ("""
+IF OBJECT_ID('ExerciseDailyRollup', 'U') IS NULL
+CREATE TABLE ExerciseDailyRollup (
+    patient_id NVARCHAR(20) NOT NULL,
+    activity_date DATE NOT NULL,
+    total_minutes FLOAT NOT NULL,
+    met_minutes FLOAT NOT NULL,
+    entries INT NOT NULL,
+    PRIMARY KEY (patient_id, activity_date)
+)
+""", """
+IF OBJECT_ID('ExerciseWeeklyRollup', 'U') IS NULL
+CREATE TABLE ExerciseWeeklyRollup (
+    patient_id NVARCHAR(20) NOT NULL,
+    week_start DATE NOT NULL,
+    exercise_name NVARCHAR(100) NOT NULL,
+    total_minutes FLOAT NOT NULL,
+    met_minutes FLOAT NOT NULL,
+    entries INT NOT NULL,
+    PRIMARY KEY (patient_id, week_start, exercise_name)
+)
+""")
+
+RESPONSES_DDL = """
+IF OBJECT_ID('IpaqResponses', 'U') IS NULL
+CREATE TABLE IpaqResponses (
+    patient_id NVARCHAR(20) NOT NULL PRIMARY KEY,
+    answers NVARCHAR(MAX) NOT NULL,
+    rules_version INT NOT NULL,
+    submitted_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+)
+"""
+
+LOCKS_DDL = """
+IF OBJECT_ID('SingleFlightLocks', 'U') IS NULL
+CREATE TABLE SingleFlightLocks (
+    lock_key NVARCHAR(200) NOT NULL PRIMARY KEY,
+    owner NVARCHAR(32) NOT NULL,
+    expires_at FLOAT NOT NULL
+)
+"""
+
+# A finished single-flight result, kept briefly for the callers waiting in other workers (api/singleflight.py)
+RESULTS_DDL = """
+IF OBJECT_ID('SingleFlightResults', 'U') IS NULL
+CREATE TABLE SingleFlightResults (
+    lock_key NVARCHAR(200) NOT NULL PRIMARY KEY,
+    payload NVARCHAR(MAX) NOT NULL,
+    expires_at FLOAT NOT NULL
+)
+"""
+
+# Sanitized HTML, plain text and reading time of each blog, rendered at write time (api/blog_render.py)
+RENDITIONS_DDL = """
+IF OBJECT_ID('BlogRenditions', 'U') IS NULL
+CREATE TABLE BlogRenditions (
+    blog_id INT NOT NULL PRIMARY KEY,
+    content_html NVARCHAR(MAX) NOT NULL,
+    content_text NVARCHAR(MAX) NOT NULL,
+    excerpt NVARCHAR(400) NOT NULL,
+    reading_minutes INT NOT NULL,
+    render_version INT NOT NULL,
+    rendered_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME()
+)
+"""
+
+# Generated plans parsed into rows (api/plan_items.py)
+PLAN_ITEMS_DDL = ("""
+IF OBJECT_ID('DietPlanItems', 'U') IS NULL
+CREATE TABLE DietPlanItems (
+    patient_id NVARCHAR(20) NOT NULL,
+    day_number INT NOT NULL,
+    meal NVARCHAR(30) NOT NULL,
+    position INT NOT NULL,
+    item NVARCHAR(400) NOT NULL,
+    quantity NVARCHAR(100) NULL,
+    calories FLOAT NULL,
+    alternative BIT NOT NULL,
+    PRIMARY KEY (patient_id, day_number, position)
+)
+""", """
+IF OBJECT_ID('ExercisePlanItems', 'U') IS NULL
+CREATE TABLE ExercisePlanItems (
+    patient_id NVARCHAR(20) NOT NULL,
+    day_number INT NOT NULL,
+    position INT NOT NULL,
+    category NVARCHAR(50) NULL,
+    exercise NVARCHAR(200) NOT NULL,
+    sets INT NULL,
+    reps INT NULL,
+    duration_minutes FLOAT NULL,
+    days_per_week INT NULL,
+    PRIMARY KEY (patient_id, day_number, position)
+)
+""", """
+IF OBJECT_ID('PlanParses', 'U') IS NULL
+CREATE TABLE PlanParses (
+    patient_id NVARCHAR(20) NOT NULL,
+    plan_type NVARCHAR(20) NOT NULL,
+    parser_version INT NOT NULL,
+    items INT NOT NULL,
+    parsed_at DATETIME2 NOT NULL DEFAULT SYSUTCDATETIME(),
+    PRIMARY KEY (patient_id, plan_type)
+)
+""")
+
+# Written on the primary and read back from the read replica to measure its lag (api/db.py)
+HEARTBEAT_DDL = """
+IF OBJECT_ID('ReplicaHeartbeat', 'U') IS NULL
+CREATE TABLE ReplicaHeartbeat (
+    id INT NOT NULL PRIMARY KEY,
+    beat_at FLOAT NOT NULL
+)
+"""
+
+INDEXES = (
+    Index("UX_Users_patient_id", "Users", ("patient_id",), True, (), None),
+    # Login: the password hash and patient id come from the index alone
+    Index("UX_Users_Username", "Users", ("Username",), True, ("patient_id", "Password"), "Username IS NOT NULL"),
+    # Search scans names with LIKE '%...%'; a narrow covering index is far cheaper to scan than the table
+    Index("IX_Users_Name_Email", "Users", ("Name", "Email"), False, ("patient_id", "PhoneNumber"), None),
+    Index("UX_PatientMealTracking_patient_date", "PatientMealTracking", ("patient_id", "meal_date"), True,
+          ("breakfast", "lunch", "dinner", "snacks"), None),
+    # Not unique: older data has repeated (patient, exercise, day) rows, which track_exercise tolerates
+    Index("IX_PatientExerciseTracking_patient_name_date", "PatientExerciseTracking",
+          ("patient_id", "exercise_name", "exercise_date"), False, ("duration_minutes",), None),
+    Index("IX_PatientVisits_patient_date", "PatientVisits", ("patient_id", "visit_date"), False, (), None),
+    Index("IX_DoctorBlogs_date_written", "DoctorBlogs", ("date_written",), False, (), None),
+)
+
+
+def create_index_sql(index):
+    """Guarded ``CREATE INDEX`` for ``index``."""
+    sql = (f"IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = '{index.name}' "
+           f"AND object_id = OBJECT_ID('{index.table}'))\n"
+           f"CREATE {'UNIQUE ' if index.unique else ''}NONCLUSTERED INDEX {index.name} "
+           f"ON {index.table} ({', '.join(index.columns)})")
+    if index.include:
+        sql += f" INCLUDE ({', '.join(index.include)})"
+    if index.where:
+        sql += f" WHERE {index.where}"
+    return sql
+
+
+MIGRATIONS = (
+    Migration(1, "base_tables", BASE_TABLES),
+    Migration(2, "app_tables", (DRAFTS_DDL,) + ROLLUP_DDL + (RESPONSES_DDL, LOCKS_DDL)),
+    Migration(3, "lookup_indexes", tuple(create_index_sql(index) for index in INDEXES)),
+    Migration(4, "replica_heartbeat", (HEARTBEAT_DDL,)),
+    Migration(5, "blog_renditions", (RENDITIONS_DDL,)),
+    Migration(6, "plan_items", PLAN_ITEMS_DDL),
+    Migration(7, "singleflight_results", (RESULTS_DDL,)),
+)
+
+
+def applied_versions(cursor):
+    cursor.execute(SCHEMA_MIGRATIONS_DDL)
+    cursor.execute("SELECT version FROM SchemaMigrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def pending_migrations(cursor):
+    applied = applied_versions(cursor)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def migrate(conn, target=None):
+    """Apply pending migrations up to ``target`` (default: all) in order; returns those applied.
+
+    Run from a single process (deploy step or ``init_db.py``), not from every worker.
+    """
+    cursor = conn.cursor()
+    applied = []
+    for migration in pending_migrations(cursor):
+        if target is not None and migration.version > target:
+            break
+        for statement in migration.statements:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO SchemaMigrations (version, name) VALUES (?, ?)",
+                       (migration.version, migration.name))
+        conn.commit()
+        log.info("migration_applied", version=migration.version, name=migration.name)
+        applied.append(migration)
+    return applied
+
+
+def _live_indexes(cursor, table, backend):
+    """{index name: (unique, key columns, included columns)} for ``table``."""
+    indexes = {}
+    if backend == "sqlite":
+        cursor.execute(f"PRAGMA index_list('{table}')")
+        for row in cursor.fetchall():
+            name, unique = row[1], bool(row[2])
+            cursor.execute(f"PRAGMA index_info('{name}')")
+            columns = tuple(info[2] for info in sorted(cursor.fetchall()))
+            indexes[name] = (unique, columns, ())
+        return indexes
+    cursor.execute("""
+        SELECT i.name, i.is_unique, c.name, ic.key_ordinal, ic.is_included_column
+        FROM sys.indexes i
+        JOIN sys.index_columns ic ON ic.object_id = i.object_id AND ic.index_id = i.index_id
+        JOIN sys.columns c ON c.object_id = ic.object_id AND c.column_id = ic.column_id
+        WHERE i.object_id = OBJECT_ID(?)
+        ORDER BY i.name, ic.key_ordinal
+    """, (table,))
+    found = {}
+    for name, unique, column, ordinal, included in cursor.fetchall():
+        entry = found.setdefault(name, [bool(unique), [], []])
+        (entry[2] if included else entry[1]).append((ordinal, column))
+    for name, (unique, keys, included) in found.items():
+        indexes[name] = (unique, tuple(c for _, c in sorted(keys)), tuple(c for _, c in included))
+    return indexes
+
+
+def _satisfies(live, index, backend):
+    unique, keys, included = live
+    if tuple(k.lower() for k in keys[:len(index.columns)]) != tuple(c.lower() for c in index.columns):
+        return False
+    if index.unique and (not unique or len(keys) != len(index.columns)):
+        return False
+    if backend != "sqlite":  # SQLite has no included columns
+        covered = {c.lower() for c in keys + included}
+        return all(c.lower() in covered for c in index.include)
+    return True
+
+
+def check_indexes(cursor, backend):
+    """One (index, name of the live index that satisfies it or None) pair per entry of ``INDEXES``.
+
+    ``backend`` is ``"mssql"`` or ``"sqlite"`` (``api.db.DB_BACKEND``).
+    """
+    live_by_table = {}
+    results = []
+    for index in INDEXES:
+        if index.table not in live_by_table:
+            live_by_table[index.table] = _live_indexes(cursor, index.table, backend)
+        match = next((name for name, live in sorted(live_by_table[index.table].items())
+                      if _satisfies(live, index, backend)), None)
+        results.append((index, match))
+    return results
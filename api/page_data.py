@@ -0,0 +1,116 @@
+"""Initial data for the patient pages, embedded in the HTML as a JSON island.
+
+The recall, IPAQ and tracking pages used to render with only the patient
+id and leave everything else to the browser. ``load(cursor, page,
+patient_id)`` now fetches what a page shows on first paint with one
+statement, joined from ``Users``. ``html_routes`` renders it into
+``<script type="application/json" id="initial-data">``
+(``templates/_initial_data.html``).
+
+When the island is empty (database unavailable while rendering) the page
+requests the same dict from ``GET /patients/<id>/page_data/<page>``.
+
+- ``recall``: saved 3-day recall split back into its six fields per day
+- ``ipaq``: the patient's last raw IPAQ answers
+- ``tracking_food``: meals of the last ``RECENT_DAYS`` days by date
+- ``tracking_exercise``: exercise entries of the last ``RECENT_DAYS`` days by date
+- ``tracking_options``: the patient's name only
+"""
+import datetime
+import json
+
+from api import archive
+
+RECENT_DAYS = 14
+RECALL_FIELDS = ("breakfast", "morning_snack", "lunch", "afternoon_snack", "dinner", "evening_snack")
+RECALL_SEPARATOR = " | "
+
+
+def _split_recall(value):
+    parts = (value or "").split(RECALL_SEPARATOR) if value else []
+    if len(parts) != len(RECALL_FIELDS):
+        return None  # saved before the six-field form, or empty
+    return dict(zip(RECALL_FIELDS, (part.strip() for part in parts)))
+
+
+def _recall(cursor, patient_id, today):
+    cursor.execute("""
+        SELECT u.Name, a.day1_meal, a.day2_meal, a.day3_meal
+        FROM Users u LEFT JOIN PatientActivityData a ON a.patient_id = u.patient_id
+        WHERE u.patient_id = ?
+    """, (patient_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return {"name": row[0], "recall": {f"day{i}": _split_recall(row[i]) for i in (1, 2, 3)}}
+
+
+def _ipaq(cursor, patient_id, today):
+    cursor.execute("""
+        SELECT u.Name, r.answers
+        FROM Users u LEFT JOIN IpaqResponses r ON r.patient_id = u.patient_id
+        WHERE u.patient_id = ?
+    """, (patient_id,))
+    row = cursor.fetchone()
+    if not row:
+        return None
+    return {"name": row[0], "answers": json.loads(row[1]) if row[1] else None}
+
+
+def _tracking_food(cursor, patient_id, today):
+    start = today - datetime.timedelta(days=RECENT_DAYS - 1)
+    cursor.execute("""
+        SELECT u.Name, m.meal_date, m.breakfast, m.lunch, m.dinner, m.snacks
+        FROM Users u LEFT JOIN PatientMealTracking m
+            ON m.patient_id = u.patient_id AND m.meal_date BETWEEN ? AND ?
+        WHERE u.patient_id = ?
+    """, (start.isoformat(), today.isoformat(), patient_id))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    hot = [tuple(row[1:]) for row in rows if row[1] is not None]
+    meals = {archive.day(row[0]): {"breakfast": row[1] or "", "lunch": row[2] or "", "dinner": row[3] or "",
+                            "snacks": row[4] or ""}
+             for row in archive.patient_rows("meals", patient_id, hot, start, today)}
+    return {"name": rows[0][0], "meals": meals}
+
+
+def _tracking_exercise(cursor, patient_id, today):
+    start = today - datetime.timedelta(days=RECENT_DAYS - 1)
+    cursor.execute("""
+        SELECT u.Name, e.exercise_date, e.exercise_name, e.duration_minutes
+        FROM Users u LEFT JOIN PatientExerciseTracking e
+            ON e.patient_id = u.patient_id AND e.exercise_date BETWEEN ? AND ?
+        WHERE u.patient_id = ?
+    """, (start.isoformat(), today.isoformat(), patient_id))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+    hot = [tuple(row[1:]) for row in rows if row[1] is not None]
+    exercise = {}
+    for exercise_date, name, minutes in archive.patient_rows("exercise", patient_id, hot, start, today):
+        exercise.setdefault(archive.day(exercise_date), []).append({"exercise_name": name, "duration_minutes": minutes})
+    return {"name": rows[0][0], "exercise": exercise}
+
+
+def _tracking_options(cursor, patient_id, today):
+    cursor.execute("SELECT Name FROM Users WHERE patient_id = ?", (patient_id,))
+    row = cursor.fetchone()
+    return {"name": row[0]} if row else None
+
+
+PAGES = {
+    "recall": _recall,
+    "ipaq": _ipaq,
+    "tracking_food": _tracking_food,
+    "tracking_exercise": _tracking_exercise,
+    "tracking_options": _tracking_options,
+}
+
+
+def load(cursor, page, patient_id, today=None):
+    """Initial data dict for ``page``, or None if the patient doesn't exist."""
+    data = PAGES[page](cursor, patient_id, today or datetime.date.today())
+    if data is not None:
+        data = {"page": page, "patient_id": patient_id, **data}
+    return data
@@ -0,0 +1,414 @@
+"""Generated plans as rows: diet day × meal × item, exercise day × exercise.
+
+``structured_diet_chart`` and ``exercise_prescription`` are markdown written
+by the model (``api/plans.py``). ``store_plan`` also runs ``parse_diet`` /
+``parse_exercise`` over them and keeps the result in ``DietPlanItems`` and
+``ExercisePlanItems`` (migration 6). ``PlanParses`` records the ``PARSER_VERSION`` each
+patient's plan was parsed with. ``GET /patients/<id>/plans/<type>?day=&meal=``
+serves one day or meal from these rows, and the meal analysis prompt gets
+the chart as ``compact_diet`` lines, a few per day, instead of the prose
+prescription.
+
+Parsing is line by line and forgiving. The text stays the source of truth;
+lines that aren't recognised are skipped.
+
+- ``Day N`` or a weekday name starts a day. A line naming several weekdays
+  ("Monday, Wednesday & Friday:") applies to each of them until the next
+  markdown heading. Exercise lines outside any day get day 0 (weekly routine).
+- A meal name (``MEAL_ORDER``) at the start of a line starts a meal. Text
+  after its colon is its first item, and the bullets below it are items.
+  "Alternative:" / "Or:" lines are kept as alternatives. Any other label
+  ("Total", "Exercise", "Note") ends the meal.
+- Markdown tables with Meal/Food/Quantity/Calories style headers are read
+  by column.
+- Numbers: "250 kcal" / "250 calories", the first amount with a unit as the
+  quantity, "3 sets", "12 reps", "3 x 12", "30 minutes", "1 hour", "4 days a
+  week". Ranges keep their lower end.
+- An exercise line needs sets, reps or a duration. The name is what is left
+  after the numbers are removed, or its label ("Squats: 3 sets of 12").
+
+Run ``python -m scripts.parse_plans`` for plans stored before this or after
+bumping ``PARSER_VERSION``.
+"""
+import collections
+import re
+
+PARSER_VERSION = 1
+
+DIET = "diet"
+EXERCISE = "exercise"
+
+# PatientInformation column each plan type is parsed from
+SOURCE_COLUMNS = {DIET: "structured_diet_chart", EXERCISE: "exercise_prescription"}
+
+MEAL_ORDER = ("early morning", "breakfast", "mid-morning snack", "lunch", "evening snack", "dinner",
+              "bedtime snack", "snack")
+_MEALS = (
+    ("mid-morning snack", r"mid[\s-]*morning(?:\s+snacks?)?"),
+    ("early morning", r"early[\s-]*morning(?:\s+drink)?"),
+    ("evening snack", r"(?:evening|afternoon)\s+(?:snacks?|tea)"),
+    ("bedtime snack", r"bed[\s-]*time(?:\s+snacks?)?|before\s+bed"),
+    ("breakfast", r"breakfast"),
+    ("lunch", r"lunch"),
+    ("dinner", r"dinner|supper"),
+    ("snack", r"snacks?"),
+)
+_MEAL = [(name, re.compile(rf"^(?:{pattern})\b", re.IGNORECASE)) for name, pattern in _MEALS]
+_WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+_BULLET = re.compile(r"^(?:[\s>#*+•·-]+|\d{1,2}[.)]\s+)+")
+_EMPHASIS = re.compile(r"\*\*|__|(?<!\w)\*|\*(?!\w)|`")
+_DAY = re.compile(r"^day\s*(\d{1,2})\b\s*(?:\([^)]*\))?\s*[:.\-–—)]?\s*", re.IGNORECASE)
+_WEEKDAY_LIST = re.compile(
+    r"^((?:(?:mon|tues|wednes|thurs|fri|satur|sun)day)(?:\s*(?:,|&|and|/)\s*(?:mon|tues|wednes|thurs|fri|satur|sun)day)*)"
+    r"\b\s*[:.\-–—]?\s*", re.IGNORECASE)
+_LABEL = re.compile(r"^([^\W\d][^:]{0,40}?)\s*(?::|\s[-–—]\s)\s*(.*)$")
+_ALTERNATIVE = re.compile(r"^(?:alternat\w*|or|option\s*2|swap)\b\s*(?:\([^)]*\))?\s*[:\-–—]?\s*", re.IGNORECASE)
+_TOTAL = re.compile(r"^total\b", re.IGNORECASE)
+
+_NUMBER = r"(\d+(?:\.\d+)?)(?:\s*(?:-|–|to)\s*\d+(?:\.\d+)?)?"
+_CALORIES = re.compile(rf"(?:~|≈|approx\.?|about|around)?\s*{_NUMBER}\s*(?:kcals?|cal(?:orie)?s?)\b", re.IGNORECASE)
+_QUANTITY = re.compile(
+    r"\b(?:\d+(?:\.\d+)?(?:\s*(?:-|–|/|to)\s*\d+(?:\.\d+)?)?|½|¼|¾|half|one|two|three)\s*"
+    r"(?:g|gm|gms|grams?|kg|ml|l|litres?|liters?|cups?|bowls?|katoris?|tbsp|tsp|tablespoons?|teaspoons?|"
+    r"pieces?|pcs|slices?|glass(?:es)?|plates?|servings?|handfuls?|scoops?|medium|small|large|oz|nos?)\b",
+    re.IGNORECASE)
+_SETS_BY_REPS = re.compile(rf"\b(\d+)\s*(?:sets?\s*)?[x×]\s*{_NUMBER}\b(?:\s*reps?\b)?", re.IGNORECASE)
+_SETS = re.compile(rf"\b{_NUMBER}\s*(?:sets?|rounds?|circuits?)\b", re.IGNORECASE)
+_REPS = re.compile(rf"\b{_NUMBER}\s*(?:reps?|repetitions?)\b", re.IGNORECASE)
+_MINUTES = re.compile(rf"\b{_NUMBER}\s*(?:minutes?|mins?)\b", re.IGNORECASE)
+_HOURS = re.compile(rf"\b{_NUMBER}\s*(?:hours?|hrs?)\b", re.IGNORECASE)
+_SECONDS = re.compile(rf"\b{_NUMBER}\s*(?:seconds?|secs?)\b", re.IGNORECASE)
+_PER_WEEK = re.compile(rf"\b{_NUMBER}\s*(?:times|days|x|sessions|days?/week)\s*(?:a|per|/|each|in\s+a)?\s*(?:week|wk)?\b",
+                       re.IGNORECASE)
+_FILLER = re.compile(r"\b(?:of|for|each|per\s+week|a\s+week|per\s+side|each\s+side|daily)\b", re.IGNORECASE)
+# A label naming one of these is the exercise's category ("Cardio: 30 minutes of brisk walking")
+_CATEGORY = re.compile(r"cardio|aerobic|strength|resistance|flexibility|stretch|warm|cool|balance|mobility|hiit|"
+                       r"interval|exercise|activity|workout|training", re.IGNORECASE)
+_HEADING = re.compile(r"^\s*(#+)")
+_EMPTY_PARENS = re.compile(r"\(\s*[,;:]*\s*\)|\[\s*\]")
+_EDGES = " ,;:.-–—~+/|"
+
+DietItem = collections.namedtuple("DietItem", "day meal position item quantity calories alternative")
+ExerciseItem = collections.namedtuple(
+    "ExerciseItem", "day position category exercise sets reps duration_minutes days_per_week")
+
+
+def _clean(line):
+    return _EMPHASIS.sub("", _BULLET.sub("", line.strip())).strip()
+
+
+def _number(match, group=1):
+    return float(match.group(group)) if match else None
+
+
+def _int(value):
+    return int(value) if value is not None else None
+
+
+def _tidy(text):
+    text = re.sub(r"\s+([,;])", r"\1", re.sub(r"\s{2,}", " ", _EMPTY_PARENS.sub("", text)))
+    return text.strip(_EDGES).strip()
+
+
+def meal_key(value):
+    """Canonical meal name for a label ("Mid-Morning Snack (10 AM)", "mid_morning_snack") or None."""
+    value = re.sub(r"[_\s]+", " ", (value or "").strip())
+    return next((name for name, pattern in _MEAL if pattern.match(value)), None)
+
+
+def _days(line):
+    """(day numbers, rest of the line) when the line starts a day, else ([], line)."""
+    match = _DAY.match(line)
+    if match:
+        return [int(match.group(1))], line[match.end():]
+    match = _WEEKDAY_LIST.match(line)
+    if match:
+        names = re.findall(r"(?:mon|tues|wednes|thurs|fri|satur|sun)day", match.group(1).lower())
+        return [_WEEKDAYS.index(name) + 1 for name in names], line[match.end():]
+    return [], line
+
+
+def _label(line):
+    match = _LABEL.match(line)
+    return (match.group(1).strip(), match.group(2).strip()) if match else (None, line)
+
+
+def _diet_item(text):
+    """(item, quantity, calories) of one item text."""
+    calories = _number(_CALORIES.search(text))
+    text = _CALORIES.sub("", text)
+    quantity = _QUANTITY.search(text)
+    if quantity:
+        group = re.search(rf"\([^()]*{re.escape(quantity.group())}[^()]*\)", text)
+        if group:  # "(1 bowl, ...)": the quantity was only said in brackets
+            text = text.replace(group.group(), "")
+    item = _tidy(text)
+    return item[:400], quantity.group()[:100] if quantity else None, calories
+
+
+def _table_roles(cells):
+    roles = {}
+    for i, cell in enumerate(c.lower() for c in cells):
+        for role, pattern in (("day", r"\bday\b"), ("meal", r"\bmeal|\btime\b"),
+                              ("item", r"food|item|dish|menu|option|what to eat"),
+                              ("quantity", r"quantit|qty|portion|amount|serving"),
+                              ("calories", r"calor|kcal|energy")):
+            if role not in roles and re.search(pattern, cell):
+                roles[role] = i
+                break
+    return roles if "item" in roles or "meal" in roles else {}
+
+
+def parse_diet(text):
+    """``DietItem`` rows of a day-wise diet chart, in the chart's order."""
+    rows = []
+    day = meal = None
+    positions = collections.Counter()
+    table = None
+
+    def add(item_text, alternative=False, quantity=None, calories=None):
+        item, found_quantity, found_calories = _diet_item(item_text)
+        if day is None or meal is None or not item:
+            return
+        positions[day] += 1
+        rows.append(DietItem(day, meal, positions[day], item, quantity or found_quantity,
+                             calories if calories is not None else found_calories, alternative))
+
+    for raw in (text or "").splitlines():
+        if raw.strip().startswith("|"):
+            cells = [_clean(c) for c in raw.strip().strip("|").split("|")]
+            if all(re.fullmatch(r":?-*:?", c) for c in cells):
+                continue
+            if table is None:
+                table = _table_roles(cells)
+                continue
+            if not table:
+                continue
+            cell = lambda role: cells[table[role]] if role in table and table[role] < len(cells) else ""
+            found = re.search(r"\d+", cell("day"))
+            if found:
+                day = int(found.group())
+            if "meal" in table:
+                meal = meal_key(cell("meal")) or meal
+            item_text = cell("item") if "item" in table else ""
+            if not item_text and "meal" in table and meal_key(cell("meal")) is None:
+                item_text = cell("meal")
+            add(item_text, quantity=cell("quantity")[:100] or None,
+                calories=_number(re.search(r"(\d+(?:\.\d+)?)", cell("calories"))))
+            continue
+        table = None
+
+        line = _clean(raw)
+        if not line:
+            continue
+        days, line = _days(line)
+        if days:
+            day, meal = days[0], None
+            line = line.strip()
+            if not line:
+                continue
+        alternative = _ALTERNATIVE.match(line)
+        if alternative and meal is not None:
+            add(line[alternative.end():], alternative=True)
+            continue
+        label, rest = _label(line)
+        found = meal_key(label) if label else meal_key(line)
+        if found and (label or len(_tidy(_CALORIES.sub("", line))) <= len(found) + 15):
+            meal = found
+            if label and rest:
+                add(rest)
+            continue
+        if (label and not _QUANTITY.match(label)) or _TOTAL.match(line):
+            meal = None  # "Total: ...", "Exercise: ...", "Note: ..."
+            continue
+        add(line)
+    return rows
+
+
+def _exercise_metrics(text):
+    """(sets, reps, minutes, per week, text without them)."""
+    sets = reps = minutes = per_week = None
+    match = _SETS_BY_REPS.search(text)
+    if match:
+        sets, reps = int(match.group(1)), _number(match, 2)
+        text = text.replace(match.group(), " ")
+    match = _SETS.search(text)
+    if match:
+        sets = sets or _number(match)
+        text = text.replace(match.group(), " ")
+    match = _REPS.search(text)
+    if match:
+        reps = reps or _number(match)
+        text = text.replace(match.group(), " ")
+    match = _PER_WEEK.search(text)
+    if match and re.search(r"week|wk", match.group(), re.IGNORECASE):
+        per_week = _number(match)
+        text = text.replace(match.group(), " ")
+    for pattern, factor in ((_HOURS, 60), (_MINUTES, 1), (_SECONDS, 1 / 60)):
+        match = pattern.search(text)
+        if match:
+            minutes = round(_number(match) * factor, 2)
+            text = text.replace(match.group(), " ")
+            break
+    return _int(sets), _int(reps), minutes, _int(per_week), _tidy(_FILLER.sub(" ", text))
+
+
+def parse_exercise(text):
+    """``ExerciseItem`` rows of an exercise prescription, in the text's order."""
+    rows = []
+    days, day_level = [0], 0
+    category = category_per_week = None
+    positions = collections.Counter()
+    for raw in (text or "").splitlines():
+        line = _clean(raw)
+        if not line:
+            continue
+        level = _HEADING.match(raw)
+        level = len(level.group(1)) if level else None
+        found_days, line = _days(line)
+        if found_days:
+            days, day_level = found_days, level or 7
+            line = line.strip()
+            if not line:
+                continue
+        elif level and level <= day_level:
+            days, day_level = [0], 0  # a new section after "Monday, Wednesday & Friday:"
+        sets, reps, minutes, per_week, name = _exercise_metrics(line)
+        heading = level or re.fullmatch(r"\s*\*\*[^*]+\*\*:?\s*", raw) or line.endswith(":")
+        if heading and sets is None and reps is None and minutes is None:
+            category, category_per_week = _tidy(re.sub(r"\([^)]*\)", "", line))[:50] or None, per_week
+            continue
+        label, rest = _label(line)
+        if not (label and rest):
+            label, rest = None, line
+        for part in re.split(r";|\s\+\s", rest):
+            sets, reps, minutes, per_week, name = _exercise_metrics(part)
+            if sets is None and reps is None and minutes is None:
+                continue
+            row_category = category
+            if label and _CATEGORY.search(label) and re.search(r"[^\W\d]", name):
+                row_category = label
+            elif label:
+                name = label  # "Squats: 3 sets of 12", "Plank – hold 30 seconds"
+            if not re.search(r"[^\W\d]", name or ""):
+                continue
+            for day in days:
+                positions[day] += 1
+                rows.append(ExerciseItem(day, positions[day], row_category and row_category[:50], name[:200],
+                                         sets, reps, minutes, per_week or category_per_week))
+    return rows
+
+
+PARSERS = {DIET: parse_diet, EXERCISE: parse_exercise}
+
+_TABLES = {
+    DIET: ("DietPlanItems", ("day_number", "meal", "position", "item", "quantity", "calories", "alternative")),
+    EXERCISE: ("ExercisePlanItems", ("day_number", "position", "category", "exercise", "sets", "reps",
+                                     "duration_minutes", "days_per_week")),
+}
+
+def store_items(cursor, patient_id, plan_type, text):
+    """Parse ``text`` and replace the patient's rows for ``plan_type`` (caller commits); returns the rows."""
+    rows = PARSERS[plan_type](text)
+    table, columns = _TABLES[plan_type]
+    cursor.execute(f"DELETE FROM {table} WHERE patient_id = ?", (patient_id,))
+    if rows:
+        cursor.executemany(f"INSERT INTO {table} (patient_id, {', '.join(columns)}) "
+                           f"VALUES (?, {', '.join('?' * len(columns))})",
+                           [(patient_id,) + tuple(int(v) if isinstance(v, bool) else v for v in row) for row in rows])
+    cursor.execute("""
+        UPDATE PlanParses SET parser_version = ?, items = ?, parsed_at = SYSUTCDATETIME()
+        WHERE patient_id = ? AND plan_type = ?
+    """, (PARSER_VERSION, len(rows), patient_id, plan_type))
+    if cursor.rowcount == 0:
+        cursor.execute("INSERT INTO PlanParses (patient_id, plan_type, parser_version, items) VALUES (?, ?, ?, ?)",
+                       (patient_id, plan_type, PARSER_VERSION, len(rows)))
+    return rows
+
+
+def fetch_items(cursor, patient_id, plan_type, day=None, meal=None):
+    """The patient's rows for ``plan_type``, optionally one day and (diet) one meal; None if there is no plan.
+
+    Plans not parsed yet are parsed from the stored text without storing.
+    """
+    cursor.execute(f"""
+        SELECT p.parser_version, CASE WHEN p.patient_id IS NULL THEN i.{SOURCE_COLUMNS[plan_type]} END
+        FROM PatientInformation i
+        LEFT JOIN PlanParses p ON p.patient_id = i.patient_id AND p.plan_type = ?
+        WHERE i.patient_id = ?
+    """, (plan_type, patient_id))
+    row = cursor.fetchone()
+    if not row or (row[0] is None and not row[1]):
+        return None
+    if row[0] is None:
+        rows = PARSERS[plan_type](row[1])
+    else:
+        table, columns = _TABLES[plan_type]
+        where, params = "patient_id = ?", [patient_id]
+        if day is not None:
+            where, params = where + " AND day_number = ?", params + [day]
+        if meal is not None and plan_type == DIET:
+            where, params = where + " AND meal = ?", params + [meal]
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {where} ORDER BY day_number, position",
+                       params)
+        item_type = DietItem if plan_type == DIET else ExerciseItem
+        rows = [item_type(*values) for values in cursor.fetchall()]
+    return [r for r in rows if (day is None or r.day == day)
+            and (meal is None or plan_type != DIET or r.meal == meal)]
+
+
+def _total(items):
+    values = [item.calories for item in items if not item.alternative and item.calories is not None]
+    return round(sum(values), 1) if values else None
+
+
+def group_diet(rows):
+    """[{"day", "calories", "meals": [{"meal", "calories", "items": [...]}]}] in chart order."""
+    days = []
+    for row in rows:
+        if not days or days[-1]["day"] != row.day:
+            days.append({"day": row.day, "meals": [], "_rows": []})
+        meals = days[-1]["meals"]
+        if not meals or meals[-1]["meal"] != row.meal:
+            meals.append({"meal": row.meal, "items": [], "_rows": []})
+        meals[-1]["items"].append({"item": row.item, "quantity": row.quantity, "calories": row.calories,
+                                   "alternative": bool(row.alternative)})
+        meals[-1]["_rows"].append(row)
+        days[-1]["_rows"].append(row)
+    for day in days:
+        day["calories"] = _total(day.pop("_rows"))
+        for meal in day["meals"]:
+            meal["calories"] = _total(meal.pop("_rows"))
+    return days
+
+
+def group_exercise(rows):
+    """[{"day", "exercises": [...]}]; day 0 holds the weekly routine not tied to a day."""
+    days = []
+    for row in rows:
+        if not days or days[-1]["day"] != row.day:
+            days.append({"day": row.day, "exercises": []})
+        days[-1]["exercises"].append({
+            "category": row.category, "exercise": row.exercise, "sets": row.sets, "reps": row.reps,
+            "duration_minutes": row.duration_minutes, "days_per_week": row.days_per_week,
+        })
+    return days
+
+
+def compact_diet(rows):
+    """The chart in a few lines per day, for prompts:
+    ``Day 1 (1500 kcal): breakfast: poha [1 bowl, 250 kcal] / alt upma; lunch: ...``"""
+    lines = []
+    for day in group_diet(rows):
+        meals = []
+        for meal in day["meals"]:
+            items = []
+            for item in meal["items"]:
+                facts = ", ".join(filter(None, (item["quantity"], item["calories"] is not None
+                                                and f"{item['calories']:g} kcal")))
+                items.append(("alt " if item["alternative"] else "") + item["item"] + (f" [{facts}]" if facts else ""))
+            meals.append(f"{meal['meal']}: " + " / ".join(items))
+        total = f" ({day['calories']:g} kcal)" if day["calories"] is not None else ""
+        lines.append(f"Day {day['day']}{total}: " + "; ".join(meals))
+    return "\n".join(lines)
@@ -0,0 +1,219 @@
+"""Diet and exercise plan generation shared by the API and background jobs.
+
+The prompts live here so the ``generate-diet`` / ``generate-exercise``
+endpoints and the precompute scheduler produce identical plans. Each plan
+type has a ``fetch_*_inputs`` query, a completeness check and a
+``generate_*`` function; ``input_fingerprint`` hashes the inputs together
+with ``PROMPT_VERSION`` so a stored plan can be matched to the data it was
+generated from.
+"""
+import hashlib
+import json
+
+from api import plan_items
+from api.llm import get_openai_response
+
+# Bump whenever a prompt below changes so older drafts stop matching
+PROMPT_VERSION = 1
+
+DIET = "diet"
+EXERCISE = "exercise"
+
+DIET_INPUT_COLUMNS = (
+    "weight", "height", "medical_history", "current_health_conditions", "treatment_details",
+    "fitness_goal", "allergies", "smoking", "drinking", "day1_meal", "day2_meal", "day3_meal",
+)
+EXERCISE_INPUT_COLUMNS = (
+    "weight", "height", "medical_history", "fitness_goal", "smoking", "drinking", "sleep_pattern",
+    "ipaQ_total_met", "ipaQ_category", "ipaQ_walking_met",
+)
+
+
+class PlanGenerationError(Exception):
+    """The model returned nothing for one of the prompts; the message is user-facing."""
+
+
+def _fetch_inputs(cursor, patient_id, columns):
+    cursor.execute(f"""
+        SELECT {", ".join(columns)}
+        FROM PatientInformation
+        JOIN PatientActivityData ON PatientInformation.patient_id = PatientActivityData.patient_id
+        WHERE PatientInformation.patient_id = ?
+    """, (patient_id,))
+    row = cursor.fetchone()
+    return dict(zip(columns, row)) if row else None
+
+
+def fetch_diet_inputs(cursor, patient_id):
+    """Patient details plus 3-day recall, or None when either record is missing."""
+    return _fetch_inputs(cursor, patient_id, DIET_INPUT_COLUMNS)
+
+
+def fetch_exercise_inputs(cursor, patient_id):
+    """Patient details plus IPAQ MET scores, or None when either record is missing."""
+    return _fetch_inputs(cursor, patient_id, EXERCISE_INPUT_COLUMNS)
+
+
+def _has_meals(value):
+    # store_3_day_recall joins the six meals with " | ", so an empty day is "|  |  | ..."
+    return bool(value and value.replace("|", "").strip())
+
+
+def diet_inputs_complete(inputs):
+    return bool(inputs) and any(_has_meals(inputs[f"day{day}_meal"]) for day in (1, 2, 3))
+
+
+def exercise_inputs_complete(inputs):
+    return bool(inputs) and inputs["ipaQ_total_met"] is not None and bool(inputs["ipaQ_category"])
+
+
+def input_fingerprint(plan_type, inputs):
+    """Stable hash of the prompt version, plan type and input values."""
+    blob = json.dumps([PROMPT_VERSION, plan_type, inputs], sort_keys=True, default=str)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+def generate_diet_plan(inputs):
+    """Run the two-step diet chain; returns {"diet_prescription", "structured_diet_chart"}."""
+    weight, height, medical_history, current_health_conditions, treatment_details, fitness_goal, \
+    allergies, smoking, drinking, day1_meal, day2_meal, day3_meal = (inputs[c] for c in DIET_INPUT_COLUMNS)
+
+    # Prompt for Diet Plan (Analyzing 3-Day Recall)
+    diet_prompt = f"""
+        Based on the patient's 3-day meal recall, analyze their **food preferences** and recommend a **healthy meal plan**.
+
+        **Patient Details:**
+        - Weight: {weight} kg
+        - Height: {height} cm
+        - Medical History: {medical_history}
+        - Current health conditions: {current_health_conditions}
+        - Treatment Details: {treatment_details}
+        - Fitness Goal: {fitness_goal}
+        - Allergies: {allergies}
+        - Smoking: {smoking}
+        - Drinking: {drinking}
+
+        **3-Day Meal Recall:**
+        - **Day 1:** {day1_meal}
+        - **Day 2:** {day2_meal}
+        - **Day 3:** {day3_meal}
+
+        **Analyze:**
+        - Identify **common patterns** (e.g., high carb, protein-rich, vegetarian, fast food, home-cooked meals).
+        - Consider the patient's **likes & dislikes**.
+        - Suggest **healthier alternatives** based on their preferences.
+        - Keep in mind their allergies and fitness goals.
+        - Analyze the amout of calories intake done by patient.
+
+        **Recommend:**
+        - **Breakfast:** Suggest meals that align with the patient's tastes but are healthier.
+        - **Lunch:** Suggest balanced meals that match their dietary habits.
+        - **Dinner:** Suggest meals that maintain variety while staying nutritious.
+        - **Snacks:** Recommend healthy snacks similar to what they already eat.
+
+        Keep the recommendations **realistic** and based on their existing eating habits.
+        And mention calories the patient consumed(approximate is fine).
+        And reccomend how much the patient should consume for accomplishing their fitness goal.
+        Take in note their medical history , health conditions etc.
+        """
+
+    # Get AI response for general diet p lan
+    diet_plan = get_openai_response(diet_prompt)
+    if not diet_plan:
+        raise PlanGenerationError("Failed to generate diet plan")
+
+    # SECOND PROMPT – Generate Day-wise diet plan from previous output
+    structured_diet_prompt = f"""
+        Based on the following diet plan generated for the patient, convert it into a clear **day-wise diet chart** for one week (Day 1 to Day 7).I want each day meal(no responses like day 1 - day 3 or anything like that). Ensure that the chart includes:
+
+        - **Breakfast**
+        - **Mid-morning snack**
+        - **Lunch**
+        - **Evening snack**
+        - **Dinner**
+        *Note: You can even reccomend alternates for each food you reccomend. And try to stay true to the patients general diet(based on what type of food patient likes)
+
+        The plan should be simple, practical, and in line with the recommendations. Include calories nutritional data and quantity too.
+        In the end also give total calories consumed per day. I want each day's separate plan.Not genereic and try not be repetitive. Based on what cuisine and regional food patient likes only reccomend that.
+        The point is to make the diet plan such that patient can eat healthy while not diverting from their normal eating habits.
+
+        **Reference Diet Plan:**
+        {diet_plan}
+        """
+
+    # Get AI response for structured, day-wise plan
+    structured_diet_chart = get_openai_response(structured_diet_prompt)
+    if not structured_diet_chart:
+        raise PlanGenerationError("Failed to generate structured diet chart")
+
+    return {"diet_prescription": diet_plan, "structured_diet_chart": structured_diet_chart}
+
+
+def generate_exercise_plan(inputs):
+    """Run the exercise prompt; returns {"exercise_prescription"}."""
+    weight, height, medical_history, fitness_goal, smoking, drinking, sleep_pattern, \
+    total_met, activity_category, walking_met = (inputs[c] for c in EXERCISE_INPUT_COLUMNS)
+
+    # Prompt for Exercise Plan
+    exercise_prompt = f"""
+        Generate a **personalized exercise plan** for a patient with the following details:
+        - Weight: {weight} kg
+        - Height: {height} cm
+        - Medical History: {medical_history}
+        - Physical Activity Level: {activity_category} (MET Score: {total_met})
+        - Walking MET : {walking_met}
+        - Fitness Goal : {fitness_goal}
+        - Smoking : {smoking}
+        - Drinking : {drinking}
+        - Sleep Pattern : {sleep_pattern}
+
+        Please suggest a **weekly exercise routine**, including:
+        - **Cardio Recommendations** (walking, jogging, cycling, etc.)
+        - **Strength Training** (weight lifting, resistance exercises)
+        - **Flexibility & Mobility Exercises**
+        - **Duration and Frequency per Week**
+        - Talk about reps and sets.
+
+        Ensure the plan is **safe and suitable** based on their health condition, fitness goal,met values, health history and their bmi(height and weight).
+        """
+
+    # Fetch AI-generated response
+    exercise_plan = get_openai_response(exercise_prompt)
+    if not exercise_plan:
+        raise PlanGenerationError("Failed to generate exercise plan")
+
+    return {"exercise_prescription": exercise_plan}
+
+
+# PatientInformation columns each plan type is stored in
+PLAN_COLUMNS = {
+    DIET: ("diet_prescription", "structured_diet_chart"),
+    EXERCISE: ("exercise_prescription",),
+}
+
+
+def store_plan(cursor, patient_id, plan_type, plan):
+    """Write a generated plan into PatientInformation and its parsed rows (``api/plan_items.py``; caller commits)."""
+    columns = PLAN_COLUMNS[plan_type]
+    cursor.execute(f"""
+        UPDATE PatientInformation
+        SET {", ".join(f"{c} = ?" for c in columns)}
+        WHERE patient_id = ?
+    """, (*(plan[c] for c in columns), patient_id))
+    plan_items.store_items(cursor, patient_id, plan_type, plan[plan_items.SOURCE_COLUMNS[plan_type]])
+
+
+def fetch_stored_plan(cursor, patient_id, plan_type):
+    """The plan last written by ``store_plan`` (or the routes), or None if there is none yet."""
+    columns = PLAN_COLUMNS[plan_type]
+    cursor.execute(f"SELECT {', '.join(columns)} FROM PatientInformation WHERE patient_id = ?", (patient_id,))
+    row = cursor.fetchone()
+    if not row or not row[0]:
+        return None
+    return {column: value or "" for column, value in zip(columns, row)}
+
+
+PLAN_TYPES = {
+    DIET: (fetch_diet_inputs, diet_inputs_complete, generate_diet_plan),
+    EXERCISE: (fetch_exercise_inputs, exercise_inputs_complete, generate_exercise_plan),
+}
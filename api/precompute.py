@@ -0,0 +1,175 @@
+"""Speculative background generation of diet and exercise plans.
+
+When ``store_patient_info``, ``store_3_day_recall`` or ``store_ipaq_data``
+commit, the affected plan types are scheduled for that patient. After a
+quiet period (``PRECOMPUTE_DELAY_SECONDS``, so a burst of edits produces one
+job) a background thread checks whether the inputs are complete, and if no
+draft exists for their fingerprint it generates one and stores it in
+``PlanDrafts`` (migration 2). ``generate-diet`` / ``generate-exercise`` then
+return a draft whose fingerprint matches the current inputs without calling
+OpenAI, and ``discard_draft`` deletes it once it is stored as the plan, so
+clicking again for unchanged inputs generates a new plan. Both go through
+``generate_draft``, so a click that arrives while the same draft is being
+generated waits for it instead of starting a second one.
+
+Work runs on ``PRECOMPUTE_WORKERS`` (default 1) daemon threads per process
+and never blocks the request that scheduled it. ``PRECOMPUTE_ENABLED=0``
+turns scheduling off; stored drafts are still used.
+"""
+import json
+import os
+import threading
+import time
+
+from api import singleflight
+from api.db import get_db_connection
+from api.logs import get_logger
+from api.plans import PLAN_TYPES, input_fingerprint
+
+log = get_logger(__name__)
+
+PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "1") != "0"
+PRECOMPUTE_DELAY_SECONDS = float(os.getenv("PRECOMPUTE_DELAY_SECONDS", "10"))
+PRECOMPUTE_WORKERS = int(os.getenv("PRECOMPUTE_WORKERS", "1"))
+
+def load_draft(cursor, patient_id, plan_type, fingerprint):
+    """Return the stored plan dict if its fingerprint matches, else None."""
+    cursor.execute("""
+        SELECT payload FROM PlanDrafts
+        WHERE patient_id = ? AND plan_type = ? AND input_fingerprint = ?
+    """, (patient_id, plan_type, fingerprint))
+    row = cursor.fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def discard_draft(cursor, patient_id, plan_type):
+    """Drop the patient's draft once it has been stored as their plan (caller commits)."""
+    cursor.execute("DELETE FROM PlanDrafts WHERE patient_id = ? AND plan_type = ?", (patient_id, plan_type))
+
+
+def save_draft(cursor, patient_id, plan_type, fingerprint, plan):
+    """Insert or replace the patient's draft for ``plan_type``."""
+    payload = json.dumps(plan)
+    cursor.execute("""
+        UPDATE PlanDrafts
+        SET input_fingerprint = ?, payload = ?, created_at = SYSUTCDATETIME()
+        WHERE patient_id = ? AND plan_type = ?
+    """, (fingerprint, payload, patient_id, plan_type))
+    if cursor.rowcount == 0:
+        cursor.execute("""
+            INSERT INTO PlanDrafts (patient_id, plan_type, input_fingerprint, payload)
+            VALUES (?, ?, ?, ?)
+        """, (patient_id, plan_type, fingerprint, payload))
+
+
+def precompute_plan(patient_id, plan_type):
+    """Generate and store a draft if the inputs are complete and no matching draft exists.
+
+    Returns True when a new draft was stored.
+    """
+    fetch_inputs, inputs_complete, generate = PLAN_TYPES[plan_type]
+
+    conn = get_db_connection()
+    if not conn:
+        return False
+    try:
+        cursor = conn.cursor()
+        inputs = fetch_inputs(cursor, patient_id)
+        if not inputs_complete(inputs):
+            return False
+        fingerprint = input_fingerprint(plan_type, inputs)
+        if load_draft(cursor, patient_id, plan_type, fingerprint) is not None:
+            return False
+    finally:
+        conn.close()
+
+    # Don't hold a connection while waiting on the model
+    _, shared = generate_draft(patient_id, plan_type, fingerprint, inputs)
+    if shared:
+        return False
+    log.info("plan_draft_stored", patient_id=patient_id, plan_type=plan_type)
+    return True
+
+
+def generate_draft(patient_id, plan_type, fingerprint, inputs):
+    """Generate and store the draft for ``inputs``, or wait for the identical generation already running.
+
+    Returns (plan, shared); ``shared`` is True when another request or worker produced the plan.
+    """
+    generate = PLAN_TYPES[plan_type][2]
+
+    def compute():
+        plan = generate(inputs)
+        conn = get_db_connection()
+        if conn:
+            try:
+                save_draft(conn.cursor(), patient_id, plan_type, fingerprint, plan)
+                conn.commit()
+            finally:
+                conn.close()
+        return plan
+
+    return singleflight.run(("plan", plan_type, patient_id, fingerprint), compute)
+
+
+class PrecomputeScheduler:
+    """Debounced queue of (patient_id, plan_type) jobs drained by daemon threads."""
+
+    def __init__(self, delay=PRECOMPUTE_DELAY_SECONDS, workers=PRECOMPUTE_WORKERS, job=precompute_plan):
+        self.delay = delay
+        self.workers = workers
+        self.job = job
+        self._due = {}       # (patient_id, plan_type) -> monotonic time it may run
+        self._running = set()
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def schedule(self, patient_id, plan_types):
+        with self._cond:
+            due = time.monotonic() + self.delay
+            for plan_type in plan_types:
+                self._due[(patient_id, plan_type)] = due  # a newer edit pushes the job back
+            # Threads start on first use so they are created after gunicorn forks
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._worker, name="precompute", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._cond.notify_all()
+
+    def pending(self):
+        with self._cond:
+            return len(self._due)
+
+    def _next_job(self):
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                ready = [key for key, due in self._due.items() if due <= now and key not in self._running]
+                if ready:
+                    key = min(ready, key=self._due.get)
+                    del self._due[key]
+                    self._running.add(key)
+                    return key
+                waits = [due - now for key, due in self._due.items() if key not in self._running]
+                self._cond.wait(timeout=min(waits) if waits else None)
+
+    def _worker(self):
+        while True:
+            key = self._next_job()
+            try:
+                self.job(*key)
+            except Exception:
+                log.exception("plan_precompute_failed", patient_id=key[0], plan_type=key[1])
+            finally:
+                with self._cond:
+                    self._running.discard(key)
+                    self._cond.notify_all()
+
+
+scheduler = PrecomputeScheduler()
+
+
+def schedule(patient_id, plan_types):
+    """Queue background drafts for ``patient_id`` after its inputs changed."""
+    if PRECOMPUTE_ENABLED:
+        scheduler.schedule(patient_id, plan_types)
@@ -0,0 +1,205 @@
+"""Per-statement SQL profiling: fingerprints, slow-query log, N+1 detection and query budgets.
+
+Every statement run through ``api/db.py`` becomes a ``Statement``: the SQL
+fingerprint (literals replaced by ``?`` and ``IN`` lists collapsed),
+parameter count, duration and rows. Rows are the affected rows for writes
+and the rows fetched so far for reads. Parameter values are never kept.
+
+Statements slower than ``SLOW_QUERY_SECONDS`` (default 0.5) are logged as
+``slow_query`` events. Inside a request this happens when the request ends,
+so the row count is final. ``init_profiler(app)`` collects the statements of
+each request. With ``PROFILE_QUERIES=1`` (development) it also logs
+``n_plus_one_suspected`` when one fingerprint runs more than
+``QUERY_REPEAT_LIMIT`` (default 5) times in a request. In that mode it adds
+``X-Query-Count`` and ``X-Query-Seconds`` response headers too.
+
+``query_budget(n)`` fails a block that runs more than ``n`` statements and
+lists what ran; ``capture()`` only collects them:
+
+    with query_budget(4, max_repeats=1):
+        client.post("/patients/MYH00240/track_exercise", json=body)
+
+``python -m benchmarks.queries`` checks the budgets of the main endpoints and
+``tests/test_query_budgets.py`` enforces them in the test suite.
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import os
+import re
+
+from flask import g, request
+
+from api.logs import get_logger
+
+log = get_logger(__name__)
+
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "0.5"))
+PROFILE_QUERIES = os.getenv("PROFILE_QUERIES", "0") == "1"
+QUERY_REPEAT_LIMIT = int(os.getenv("QUERY_REPEAT_LIMIT", "5"))
+# Statements kept per request; later ones are still counted
+MAX_STATEMENTS = 10000
+
+_STRING = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w@])[-+]?\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_VALUES_LIST = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_SPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def fingerprint(sql):
+    """Normalized form of ``sql``: one line, literals as ``?``, ``IN``/``VALUES`` lists collapsed."""
+    sql = _STRING.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _VALUES_LIST.sub(r"\1, ...", sql)
+    sql = _IN_LIST.sub("(...)", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def param_count(params):
+    """Number of bound values in ``cursor.execute(sql, *params)`` (first row for ``executemany``)."""
+    if len(params) == 1 and isinstance(params[0], (list, tuple)):
+        params = params[0]
+        if params and isinstance(params[0], (list, tuple)):
+            params = params[0]
+    return len(params)
+
+
+class Statement:
+    """One executed statement; ``rows`` grows as the cursor is fetched."""
+
+    __slots__ = ("sql", "params", "seconds", "ok", "rows")
+
+    def __init__(self, sql, params, seconds, ok, rows):
+        self.sql = sql
+        self.params = params
+        self.seconds = seconds
+        self.ok = ok
+        self.rows = rows
+
+    @property
+    def fingerprint(self):
+        return fingerprint(self.sql)
+
+    def fields(self):
+        return {"fingerprint": self.fingerprint, "params": self.params, "seconds": round(self.seconds, 4),
+                "rows": self.rows, "ok": self.ok}
+
+
+class QueryLog:
+    """Statements run while the log was active."""
+
+    def __init__(self):
+        self.statements = []
+        self.count = 0
+        self.seconds = 0.0
+
+    def add(self, statement):
+        self.count += 1
+        self.seconds += statement.seconds
+        if len(self.statements) < MAX_STATEMENTS:
+            self.statements.append(statement)
+
+    def by_fingerprint(self):
+        return collections.Counter(s.fingerprint for s in self.statements)
+
+    def repeats(self, limit):
+        """(fingerprint, count) for fingerprints run more than ``limit`` times, most frequent first."""
+        return [(fp, n) for fp, n in self.by_fingerprint().most_common() if n > limit]
+
+    def slow(self, threshold=None):
+        threshold = SLOW_QUERY_SECONDS if threshold is None else threshold
+        return [s for s in self.statements if s.seconds >= threshold]
+
+    def report(self):
+        """Multi-line summary: count and total time per fingerprint."""
+        totals = collections.defaultdict(lambda: [0, 0.0])
+        for s in self.statements:
+            totals[s.fingerprint][0] += 1
+            totals[s.fingerprint][1] += s.seconds
+        lines = [f"{self.count} statements, {self.seconds * 1000:.1f} ms"]
+        for fp, (n, seconds) in sorted(totals.items(), key=lambda item: -item[1][0]):
+            lines.append(f"  {n:>4}x {seconds * 1000:8.1f} ms  {fp[:160]}")
+        return "\n".join(lines)
+
+
+_request_log = contextvars.ContextVar("request_query_log", default=None)
+_captures = contextvars.ContextVar("query_captures", default=())
+
+
+def record(sql, params, seconds, ok, rowcount):
+    """Called by ``InstrumentedCursor`` after each statement; returns the ``Statement``."""
+    statement = Statement(sql, param_count(params), seconds, ok, max(rowcount, 0))
+    request_log = _request_log.get()
+    if request_log is not None:
+        request_log.add(statement)
+    elif seconds >= SLOW_QUERY_SECONDS:
+        log.warning("slow_query", **statement.fields())
+    for capture_log in _captures.get():
+        capture_log.add(statement)
+    return statement
+
+
+@contextlib.contextmanager
+def capture():
+    """Collect the statements run in this block (same thread/context) into a ``QueryLog``."""
+    query_log = QueryLog()
+    token = _captures.set(_captures.get() + (query_log,))
+    try:
+        yield query_log
+    finally:
+        _captures.reset(token)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextlib.contextmanager
+def query_budget(max_queries, max_repeats=None):
+    """Raise ``QueryBudgetExceeded`` if the block runs more than ``max_queries`` statements,
+    or any one fingerprint more than ``max_repeats`` times."""
+    with capture() as query_log:
+        yield query_log
+    problems = []
+    if query_log.count > max_queries:
+        problems.append(f"{query_log.count} statements, budget is {max_queries}")
+    if max_repeats is not None:
+        problems.extend(f"{n}x (limit {max_repeats}): {fp[:160]}" for fp, n in query_log.repeats(max_repeats))
+    if problems:
+        raise QueryBudgetExceeded("; ".join(problems) + "\n" + query_log.report())
+
+
+def _start_request():
+    g._query_log_token = _request_log.set(QueryLog())
+
+
+def _finish_request(response):
+    query_log = _request_log.get()
+    if query_log is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    for statement in query_log.slow():
+        log.warning("slow_query", endpoint=endpoint, **statement.fields())
+    if PROFILE_QUERIES:
+        for fp, n in query_log.repeats(QUERY_REPEAT_LIMIT):
+            log.warning("n_plus_one_suspected", endpoint=endpoint, fingerprint=fp, count=n,
+                        total_statements=query_log.count)
+        response.headers["X-Query-Count"] = str(query_log.count)
+        response.headers["X-Query-Seconds"] = f"{query_log.seconds:.4f}"
+    return response
+
+
+def _clear_request(exc=None):
+    token = g.pop("_query_log_token", None)
+    if token is not None:
+        _request_log.reset(token)
+
+
+def init_profiler(app):
+    """Collect each request's statements for the slow-query log and N+1 detection."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_clear_request)
@@ -0,0 +1,233 @@
+"""Request deadlines and circuit breakers for the database and OpenAI.
+
+Every request gets a deadline when it starts: ``REQUEST_DEADLINE_SECONDS``
+(default 30), ``LLM_DEADLINE_SECONDS`` (default 120) for views marked with
+``@deadline(...)``, or less if the caller sends ``X-Request-Timeout``
+(seconds). ``api/db.py`` derives login and query timeouts from what is left
+and ``api/llm.py`` the OpenAI timeout. Work that would start after the
+deadline raises ``DeadlineExceeded`` instead of queueing on a dependency.
+Background threads have no deadline and only get the fixed timeouts.
+
+``database``, ``replica`` and ``openai`` are per-worker circuit breakers. A breaker opens
+when, over at least ``min_calls`` calls in the last ``window`` seconds, too
+many calls failed or took longer than ``slow_seconds``. While it is open,
+calls are refused at once with ``CircuitOpen``. After ``open_seconds`` one
+trial call goes through; its outcome closes the circuit or opens it again.
+
+Both exceptions are ``DependencyUnavailable`` and are remembered for the
+current request. ``init_resilience(app)`` turns a 5xx response of such a
+request into ``503`` with ``Retry-After``. Handlers that have something
+better to return (a stored plan) catch ``DependencyUnavailable`` themselves.
+"""
+import collections
+import contextvars
+import functools
+import math
+import os
+import threading
+import time
+
+from flask import jsonify, request
+
+REQUEST_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "30"))
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "120"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+DEADLINE_HEADER = "X-Request-Timeout"
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)
+_unavailable = contextvars.ContextVar("dependency_unavailable", default=None)
+_state_listeners = []
+_unavailable_listeners = []
+
+
+class DependencyUnavailable(Exception):
+    """A dependency can't serve this request; ``retry_after`` is a hint in seconds."""
+
+    reason = "unavailable"
+
+    def __init__(self, dependency, message, retry_after=1.0):
+        super().__init__(message)
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class CircuitOpen(DependencyUnavailable):
+    reason = "circuit_open"
+
+
+class DeadlineExceeded(DependencyUnavailable):
+    reason = "deadline"
+
+
+def on_state_change(listener):
+    """Register ``listener(dependency, state)`` called when a breaker changes state."""
+    _state_listeners.append(listener)
+    return listener
+
+
+def on_unavailable(listener):
+    """Register ``listener(dependency, reason)`` called for every refused call."""
+    _unavailable_listeners.append(listener)
+    return listener
+
+
+def _refuse(error):
+    _unavailable.set(error)
+    for listener in _unavailable_listeners:
+        listener(error.dependency, error.reason)
+    raise error
+
+
+def unavailable_error():
+    """The ``DependencyUnavailable`` raised during this request, if any."""
+    return _unavailable.get()
+
+
+def remaining(cap=None):
+    """Seconds left before this request's deadline, at most ``cap``; ``cap`` if there is no deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return cap
+    left = deadline - time.monotonic()
+    return left if cap is None else min(cap, left)
+
+
+def check_deadline(dependency, minimum=0.0):
+    """Raise ``DeadlineExceeded`` if less than ``minimum`` seconds are left for a call to ``dependency``."""
+    left = remaining()
+    if left is not None and left <= minimum:
+        _refuse(DeadlineExceeded(dependency, f"request deadline reached before calling {dependency}"))
+
+
+def deadline(seconds):
+    """View decorator giving the request ``seconds`` instead of ``REQUEST_DEADLINE_SECONDS``."""
+    def decorator(view):
+        view.deadline_seconds = seconds
+        return view
+    return decorator
+
+
+class CircuitBreaker:
+    """Closed / open / half-open breaker over a rolling window of call outcomes."""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name, failure_rate=0.5, slow_seconds=10.0, slow_rate=0.8, min_calls=10, window=30.0,
+                 open_seconds=CIRCUIT_OPEN_SECONDS):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.slow_rate = slow_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.state = self.CLOSED
+        self._calls = collections.deque()  # (monotonic time, failed, slow)
+        self._opened_until = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def _set_state(self, state):
+        if state != self.state:
+            self.state = state
+            for listener in _state_listeners:
+                listener(self.name, state)
+
+    def before_call(self):
+        """Raise ``CircuitOpen`` unless a call may go ahead now."""
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.OPEN and now >= self._opened_until:
+                self._set_state(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+            if self.state == self.CLOSED:
+                return
+            retry_after = max(1.0, self._opened_until - now)
+        _refuse(CircuitOpen(self.name, f"{self.name} is unavailable (circuit open)", retry_after))
+
+    def record(self, ok, seconds, sample=True):
+        """Feed back the outcome of a call allowed by ``before_call``.
+
+        ``sample=False`` only settles a half-open trial and leaves the window alone.
+        """
+        failed, slow = not ok, seconds >= self.slow_seconds
+        with self._lock:
+            now = time.monotonic()
+            if self.state == self.HALF_OPEN:
+                self._trial_running = False
+                if failed or slow:
+                    self._open(now)
+                else:
+                    self._calls.clear()
+                    self._set_state(self.CLOSED)
+                return
+            if not sample:
+                return
+            self._calls.append((now, failed, slow))
+            while self._calls and self._calls[0][0] < now - self.window:
+                self._calls.popleft()
+            count = len(self._calls)
+            if self.state == self.CLOSED and count >= self.min_calls:
+                failures = sum(1 for _, f, _ in self._calls if f)
+                slow_calls = sum(1 for _, _, s in self._calls if s)
+                if failures >= self.failure_rate * count or slow_calls >= self.slow_rate * count:
+                    self._open(now)
+
+    def _open(self, now):
+        self._opened_until = now + self.open_seconds
+        self._calls.clear()
+        self._set_state(self.OPEN)
+
+
+database = CircuitBreaker("database", slow_seconds=float(os.getenv("DB_SLOW_CALL_SECONDS", "5")))
+# Only used when a read replica is configured; while open, reads go to the primary
+replica = CircuitBreaker("database_replica", slow_seconds=float(os.getenv("DB_SLOW_CALL_SECONDS", "5")))
+openai = CircuitBreaker("openai", min_calls=5, window=120.0,
+                        slow_seconds=float(os.getenv("OPENAI_SLOW_CALL_SECONDS", "45")))
+
+
+def service_unavailable(error, message=None):
+    """``503`` JSON response with ``Retry-After`` for ``error``."""
+    response = jsonify({"error": message or "Service temporarily unavailable, please try again shortly"})
+    response.status_code = 503
+    response.headers["Retry-After"] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+
+def _start_request_clock(app):
+    view = app.view_functions.get(request.endpoint)
+    budget = getattr(view, "deadline_seconds", REQUEST_DEADLINE_SECONDS)
+    try:
+        budget = min(budget, float(request.headers.get(DEADLINE_HEADER, budget)))
+    except ValueError:
+        pass
+    _deadline.set(time.monotonic() + budget)
+    _unavailable.set(None)
+
+
+def _to_service_unavailable(response):
+    error = _unavailable.get()
+    if error is None and remaining() is not None and remaining() <= 0:
+        error = DeadlineExceeded("request", "request deadline exceeded")
+    if error is not None and response.status_code >= 500 and response.status_code != 503:
+        response.status_code = 503
+        response.headers["Retry-After"] = str(max(1, math.ceil(error.retry_after)))
+    return response
+
+
+def _clear_request_clock(exc=None):
+    _deadline.set(None)
+    _unavailable.set(None)
+
+
+def init_resilience(app):
+    """Start a deadline for every request and answer dependency outages with 503.
+
+    Call after ``init_metrics`` so the metrics see the final status code.
+    """
+    app.before_request(functools.partial(_start_request_clock, app))
+    app.after_request(_to_service_unavailable)
+    app.teardown_request(_clear_request_clock)
+    app.register_error_handler(DependencyUnavailable, service_unavailable)
@@ -0,0 +1,172 @@
+"""Daily and weekly exercise rollups kept next to ``PatientExerciseTracking``.
+
+``ExerciseDailyRollup`` holds minutes, MET-minutes and entries per patient
+per day; ``ExerciseWeeklyRollup`` the same per patient, week (starting
+Monday) and exercise. ``track_or_update_exercise`` applies the change of
+each saved row as a delta (a new row adds, an edited duration adds the
+difference), so summaries read a handful of rows instead of grouping the
+whole history.
+
+MET values are looked up from the free-text exercise name by keyword
+(``met_value``). Changing ``MET_KEYWORDS`` or repairing drift after a failed
+request needs a rebuild: ``python -m scripts.rebuild_rollups``. Migration 2
+(``api/migrations.py``) creates both tables.
+"""
+import datetime
+
+from api import archive
+
+# Default window of the activity_summary endpoint
+SUMMARY_RANGE_DAYS = 28
+
+# Compendium of Physical Activities values; first matching keyword wins
+MET_KEYWORDS = (
+    ("run", 9.8), ("jog", 7.0), ("skip", 12.3), ("rope", 12.3), ("swim", 6.0), ("cycl", 7.5), ("bike", 7.5),
+    ("football", 7.0), ("badminton", 5.5), ("tennis", 7.3), ("cricket", 4.8), ("danc", 5.0), ("zumba", 6.5),
+    ("aerobic", 7.3), ("hiit", 8.0), ("squat", 5.0), ("push", 3.8), ("plank", 3.8), ("weight", 5.0),
+    ("gym", 5.0), ("strength", 5.0), ("stair", 8.0), ("brisk", 4.3), ("walk", 3.5), ("yoga", 2.5),
+    ("stretch", 2.3), ("pilates", 3.0), ("meditat", 1.0),
+)
+DEFAULT_MET = 4.0
+
+
+def met_value(exercise_name):
+    """MET estimate for a free-text exercise name."""
+    name = exercise_name.lower()
+    for keyword, met in MET_KEYWORDS:
+        if keyword in name:
+            return met
+    return DEFAULT_MET
+
+
+def week_start(day):
+    """Monday of the week containing ``day``."""
+    return day - datetime.timedelta(days=day.weekday())
+
+
+def _as_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(str(value)[:10])
+
+
+class RollupDelta:
+    """Collects the rollup changes of one request and applies them together."""
+
+    def __init__(self, patient_id):
+        self.patient_id = patient_id
+        self.daily = {}    # activity_date -> [minutes, met_minutes, entries]
+        self.weekly = {}   # (week_start, exercise_name) -> [minutes, met_minutes, entries]
+
+    def add(self, exercise_name, exercise_date, minutes, entries=0):
+        """Record ``minutes`` more (or fewer) for one exercise on one day and ``entries`` new rows."""
+        if not minutes and not entries:
+            return
+        day = _as_date(exercise_date)
+        met_minutes = minutes * met_value(exercise_name)
+        for totals in (self.daily.setdefault(day, [0.0, 0.0, 0]),
+                       self.weekly.setdefault((week_start(day), exercise_name), [0.0, 0.0, 0])):
+            totals[0] += minutes
+            totals[1] += met_minutes
+            totals[2] += entries
+
+    def apply(self, cursor):
+        """Add the collected deltas to the rollup tables."""
+        if not self.daily:
+            return
+        for day, (minutes, met_minutes, entries) in self.daily.items():
+            cursor.execute("""
+                UPDATE ExerciseDailyRollup
+                SET total_minutes = total_minutes + ?, met_minutes = met_minutes + ?, entries = entries + ?
+                WHERE patient_id = ? AND activity_date = ?
+            """, (minutes, met_minutes, entries, self.patient_id, day.isoformat()))
+            if cursor.rowcount == 0:
+                cursor.execute("""
+                    INSERT INTO ExerciseDailyRollup (patient_id, activity_date, total_minutes, met_minutes, entries)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (self.patient_id, day.isoformat(), minutes, met_minutes, entries))
+        for (week, exercise_name), (minutes, met_minutes, entries) in self.weekly.items():
+            cursor.execute("""
+                UPDATE ExerciseWeeklyRollup
+                SET total_minutes = total_minutes + ?, met_minutes = met_minutes + ?, entries = entries + ?
+                WHERE patient_id = ? AND week_start = ? AND exercise_name = ?
+            """, (minutes, met_minutes, entries, self.patient_id, week.isoformat(), exercise_name))
+            if cursor.rowcount == 0:
+                cursor.execute("""
+                    INSERT INTO ExerciseWeeklyRollup
+                    (patient_id, week_start, exercise_name, total_minutes, met_minutes, entries)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (self.patient_id, week.isoformat(), exercise_name, minutes, met_minutes, entries))
+
+
+def rebuild_patient(cursor, patient_id):
+    """Recompute a patient's rollups from its hot and archived exercise rows; returns the number of days."""
+    cursor.execute("""
+        SELECT exercise_date, exercise_name, SUM(duration_minutes), COUNT(*)
+        FROM PatientExerciseTracking
+        WHERE patient_id = ?
+        GROUP BY exercise_date, exercise_name
+    """, (patient_id,))
+    groups = {(archive.day(d), name): (float(minutes or 0), entries) for d, name, minutes, entries in cursor.fetchall()}
+    cold = {}
+    for _, exercise_date, exercise_name, minutes, *_ in archive.cold_rows("exercise", patient_id):
+        total, entries = cold.get((exercise_date, exercise_name), (0.0, 0))
+        cold[(exercise_date, exercise_name)] = (total + float(minutes or 0), entries + 1)
+    delta = RollupDelta(patient_id)
+    for (exercise_date, exercise_name), (minutes, entries) in {**cold, **groups}.items():
+        delta.add(exercise_name, exercise_date, minutes, entries)
+
+    cursor.execute("DELETE FROM ExerciseDailyRollup WHERE patient_id = ?", (patient_id,))
+    cursor.execute("DELETE FROM ExerciseWeeklyRollup WHERE patient_id = ?", (patient_id,))
+    if delta.daily:
+        cursor.executemany("""
+            INSERT INTO ExerciseDailyRollup (patient_id, activity_date, total_minutes, met_minutes, entries)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(patient_id, day.isoformat(), *totals) for day, totals in delta.daily.items()])
+        cursor.executemany("""
+            INSERT INTO ExerciseWeeklyRollup
+            (patient_id, week_start, exercise_name, total_minutes, met_minutes, entries)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [(patient_id, week.isoformat(), name, *totals) for (week, name), totals in delta.weekly.items()])
+    return len(delta.daily)
+
+
+def _iso(value):
+    return value.isoformat()[:10] if hasattr(value, "isoformat") else str(value)[:10]
+
+
+def fetch_daily(cursor, patient_id, start, end):
+    """Daily rollups between ``start`` and ``end`` as ``{column: [values]}``."""
+    cursor.execute("""
+        SELECT activity_date, total_minutes, met_minutes, entries
+        FROM ExerciseDailyRollup
+        WHERE patient_id = ? AND activity_date BETWEEN ? AND ?
+        ORDER BY activity_date
+    """, (patient_id, start.isoformat(), end.isoformat()))
+    columns = {"activity_date": [], "total_minutes": [], "met_minutes": [], "entries": []}
+    for day, minutes, met_minutes, entries in cursor.fetchall():
+        columns["activity_date"].append(_iso(day))
+        columns["total_minutes"].append(minutes)
+        columns["met_minutes"].append(round(met_minutes, 1))
+        columns["entries"].append(entries)
+    return columns
+
+
+def fetch_weekly(cursor, patient_id, start, end):
+    """Weekly per-exercise rollups for weeks overlapping ``start``..``end`` as ``{column: [values]}``."""
+    cursor.execute("""
+        SELECT week_start, exercise_name, total_minutes, met_minutes, entries
+        FROM ExerciseWeeklyRollup
+        WHERE patient_id = ? AND week_start BETWEEN ? AND ?
+        ORDER BY week_start, exercise_name
+    """, (patient_id, week_start(start).isoformat(), end.isoformat()))
+    columns = {"week_start": [], "exercise_name": [], "total_minutes": [], "met_minutes": [], "entries": []}
+    for week, exercise_name, minutes, met_minutes, entries in cursor.fetchall():
+        columns["week_start"].append(_iso(week))
+        columns["exercise_name"].append(exercise_name)
+        columns["total_minutes"].append(minutes)
+        columns["met_minutes"].append(round(met_minutes, 1))
+        columns["entries"].append(entries)
+    return columns
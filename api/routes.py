@@ -1,29 +1,45 @@
-import pyodbc
 import os
-import openai
-from flask import Flask, request, jsonify,session,Blueprint
+import collections
+import datetime
+import zlib
+from flask import Flask, request, jsonify,session,Blueprint, Response, stream_with_context
 from flask_cors import CORS
 import bcrypt  # For password hashing
 import base64
-import matplotlib
-matplotlib.use('Agg')
-import pandas as pd
-import io
-from PIL import Image
-from supabase import create_client
-
+from api.db import get_db_connection, is_unique_violation
+from api.llm import StructuredOutputError
+from api.llm_cassette import LLM_CASSETTE_MODE, REPLAY
+from api.logs import get_logger
+from api.meal_analysis import MealAnalysisUnavailable, analyze_patient_meals
+from api.meals import (DEFAULT_RANGE_DAYS, MAX_RANGE_DAYS, fetch_meals, normalize_entries, normalize_entry,
+                       parse_date, upsert_meals)
+from api import archive, blog_render, blog_search, cohort, exports, ipaq, page_data, plan_items, precompute
+from api.admission import LLM, LOGIN, admit
+from api.resilience import LLM_DEADLINE_SECONDS, DependencyUnavailable, deadline, service_unavailable
+from api.rollups import SUMMARY_RANGE_DAYS, RollupDelta, fetch_daily, fetch_weekly
+from api.plans import (DIET, EXERCISE, PlanGenerationError, fetch_diet_inputs, fetch_exercise_inputs,
+                       fetch_stored_plan, input_fingerprint, store_plan)
+
+# Heavy libraries (openai, supabase, pandas, matplotlib) are imported lazily
+# on first use so that gunicorn workers start fast and stay small.
 
 supabase_url = os.getenv("SUPABASE_URL")
 supabase_key = os.getenv("SUPABASE_KEY")
+_supabase_client = None
 
-supabase = create_client(supabase_url, supabase_key)
+def get_supabase_client():
+    """Return the shared Supabase client, or None when Supabase is not configured."""
+    global _supabase_client
+    if _supabase_client is None and supabase_url and supabase_key:
+        from supabase import create_client
+        _supabase_client = create_client(supabase_url, supabase_key)
+    return _supabase_client
 
 def encode_image_to_base64(image_binary):
     """Encodes image binary data to a base64 string."""
     return base64.b64encode(image_binary).decode('utf-8')
-# Get OpenAI API Key from environment
-openai.api_key = os.getenv("OPENAI_API_KEY")
-if not openai.api_key:
+# Get OpenAI API Key from environment (not needed when replaying a cassette)
+if not os.getenv("OPENAI_API_KEY") and LLM_CASSETTE_MODE != REPLAY:
     raise ValueError("❌ OpenAI API Key not found! Set the 'OPENAI_API_KEY' environment variable.")
 
 app = Blueprint('api', __name__)
@@ -31,77 +47,48 @@ CORS(app)
 
 app.secret_key = 'your_secret_key'  # Use a strong, random string
 
-# Detect environment (LOCAL or AZURE)
-ENV = os.getenv("ENVIRONMENT", "LOCAL")
-
-if ENV == "LOCAL":
-    # Local SQL Server using Windows Auth
-    DB_SERVER = r'localhost\SQLEXPRESS'
-    DB_DATABASE = 'UserDatabase'
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={DB_SERVER};DATABASE={DB_DATABASE};Trusted_Connection=yes;"
-    )
-else:
-    # Azure SQL Server - use full credentials from environment
-    DB_SERVER = os.getenv("AZURE_SQL_SERVER")  # e.g. my-sqlserver.database.windows.net
-    DB_DATABASE = os.getenv("AZURE_SQL_DB")    # e.g. HealthPackageDB
-    DB_USER = os.getenv("AZURE_SQL_USER")      # e.g. sqladmin
-    DB_PASS = os.getenv("AZURE_SQL_PASS")      # Strong password
-
-    conn_str = (
-        f"DRIVER={{ODBC Driver 17 for SQL Server}};"
-        f"SERVER={DB_SERVER};DATABASE={DB_DATABASE};"
-        f"UID={DB_USER};PWD={DB_PASS};Encrypt=yes;TrustServerCertificate=no;"
-    )
-
-
-# Function to connect to SQL Server
-def get_db_connection():
-    try:
-        conn = pyodbc.connect(conn_str, autocommit=True)
-        return conn
-    except Exception as e:
-        print("Database Connection Error:", str(e))
-        return None
-    
-#function get openai response
-def get_openai_response(prompt):
-    """Fetch response from OpenAI API (Safe version with logging)."""
-    try:
-        # Get API key
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            raise ValueError("❌ API key not found. Please check .env file.")
-
-        # Initialize client
-        client = openai.OpenAI(api_key=api_key)
-
-        # Send request
-        print("📡 Sending request to OpenAI...")
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": "You are a medical expert."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        print("✅ Response received!")
-        return response.choices[0].message.content
+log = get_logger(__name__)
 
-    except Exception as e:
-        print("❌ OpenAI API Error:", str(e))
-        # Log it to file for the .exe version
-        with open("log.txt", "a") as f:
-            f.write("OpenAI API Error:\n")
-            f.write(str(e) + "\n\n")
-        return None
-    
 # Hash password function
+def stored_plan_fallback(cursor, patient_id, plan_type, error):
+    """The patient's current plan when a new one can't be generated, else 503 with Retry-After."""
+    plan = fetch_stored_plan(cursor, patient_id, plan_type)
+    if not plan:
+        return service_unavailable(error, "Plan generation is temporarily unavailable, please try again shortly")
+    log.warning("plan_fallback_served", patient_id=patient_id, plan_type=plan_type, reason=error.reason)
+    response = jsonify({**plan, "fallback": True})
+    response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+
+def stored_analysis_fallback(cursor, patient_id, error):
+    """The last stored meal analysis when a new one can't be generated, else 503 with Retry-After."""
+    cursor.execute("SELECT analytics, graph_image, table_image FROM PatientInformation WHERE patient_id = ?",
+                   (patient_id,))
+    row = cursor.fetchone()
+    if not row or not row[0]:
+        return service_unavailable(error, "Meal analysis is temporarily unavailable, please try again shortly")
+    log.warning("analysis_fallback_served", patient_id=patient_id, reason=error.reason)
+    response = jsonify({
+        "patient_id": patient_id,
+        "analysis": row[0],
+        "graph_image": encode_image_to_base64(row[1]) if row[1] else None,
+        "table_image": encode_image_to_base64(row[2]) if row[2] else None,
+        "graph_data": None,
+        "table_data": None,
+        "fallback": True,
+    })
+    response.headers["Warning"] = '110 - "Response is Stale"'
+    return response
+
+
 def hash_password(password):
     salt = bcrypt.gensalt()
     return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
 
+# Concurrent registrations can compute the same next PatientID; the unique index rejects all but one
+REGISTER_ATTEMPTS = 3
+
 # Function to generate sequential PatientID
 def generate_patient_id(cursor):
     cursor.execute("SELECT TOP 1 patient_id FROM Users WHERE patient_id LIKE 'MYH%' ORDER BY patient_id DESC")
@@ -142,31 +129,42 @@ def register_user():
         if cursor.fetchone()[0] > 0:
             return jsonify({"error": "User with this name and email already exists"}), 400
 
-        # Generate sequential PatientID
-        patient_id = generate_patient_id(cursor)
-        
-        # Generate Unique Username
-        base_username = f"{name}{dob.replace('-', '')}".replace(" ", "").lower()
-        username = base_username
-        count = 1
-        
-        while True:
-            cursor.execute("SELECT COUNT(*) FROM Users WHERE Username = ?", (username,))
-            if cursor.fetchone()[0] == 0:
-                break
-            username = f"{base_username}{count}"
-            count += 1
-
         # Generate & Hash Password
         raw_password = f"{location}{name}{dob.replace('-', '')}".replace(" ", "")
         hashed_password = hash_password(raw_password)
-        
-        # Insert into Database
-        cursor.execute("""
-            INSERT INTO Users (patient_id, Name, PhoneNumber, Email, DOB, Location, Occupation, Username, Password)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (patient_id, name, phone_number, email, dob, location, occupation, username, hashed_password))
-        conn.commit()
+
+        for attempt in range(1, REGISTER_ATTEMPTS + 1):
+            # Generate sequential PatientID
+            patient_id = generate_patient_id(cursor)
+
+            # Generate Unique Username
+            base_username = f"{name}{dob.replace('-', '')}".replace(" ", "").lower()
+            username = base_username
+            count = 1
+
+            while True:
+                cursor.execute("SELECT COUNT(*) FROM Users WHERE Username = ?", (username,))
+                if cursor.fetchone()[0] == 0:
+                    break
+                username = f"{base_username}{count}"
+                count += 1
+
+            # Insert into Database; a duplicate PatientID or Username means another registration won the race
+            try:
+                cursor.execute("""
+                    INSERT INTO Users (patient_id, Name, PhoneNumber, Email, DOB, Location, Occupation, Username, Password)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, (patient_id, name, phone_number, email, dob, location, occupation, username, hashed_password))
+                conn.commit()
+                break
+            except Exception as error:
+                if not is_unique_violation(error):
+                    raise
+                conn.rollback()
+                log.warning("registration_id_taken", patient_id=patient_id, attempt=attempt)
+        else:
+            return jsonify({"error": "Registration conflicted with another sign-up, please try again"}), 409
+        cohort.invalidate()
         
         return jsonify({
             "message": "User registered successfully",
@@ -176,8 +174,8 @@ def register_user():
             "password": raw_password  # Only for initial display
         })
 
-    except Exception as e:
-        print("Error in Registration:", str(e))
+    except Exception:
+        log.exception("registration_failed")
         return jsonify({"error": "Database error occurred"}), 500
     
     finally:
@@ -217,18 +215,43 @@ def search_users():
 
         return jsonify(results)
 
-    except Exception as e:
-        print("Error in Searching:", str(e))
+    except Exception:
+        log.exception("search_failed")
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
         conn.close()
 
 
+# API Endpoint: Initial data of a patient page (used when the page was rendered without it)
+@app.route('/patients/<string:patient_id>/page_data/<string:page>', methods=['GET'])
+def get_page_data(patient_id, page):
+    if page not in page_data.PAGES:
+        return jsonify({"error": "Unknown page"}), 404
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    try:
+        data = page_data.load(conn.cursor(), page, patient_id)
+    except Exception:
+        log.exception("page_data_failed", page=page, patient_id=patient_id)
+        return jsonify({"error": "Database error occurred"}), 500
+    finally:
+        conn.close()
+
+    if data is None:
+        return jsonify({"error": "User not found"}), 404
+    response = jsonify(data)
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
+
+
 # API Endpoint: Get User Details
 @app.route('/patients/<string:patient_id>', methods=['GET'])
 def get_user_details(patient_id):
-    print(f"🔍 Received patient_id: {repr(patient_id)}") # Debugging
+    log.debug("user_details_requested", patient_id=patient_id)
 
     conn = get_db_connection()
     if not conn:
@@ -237,12 +260,10 @@ def get_user_details(patient_id):
     try:
         cursor = conn.cursor()
         query = "SELECT Name, DOB, Location, Occupation, PhoneNumber FROM Users WHERE patient_id = ?"
-        print(f"Executing query: {query} with patient_id: {patient_id}")  # Debugging
 
         cursor.execute(query, (patient_id,))
         row = cursor.fetchone()
 
-        print(f"Query Result: {row}")  # Debugging
 
         if not row:
             return jsonify({"error": "User not found"}), 404
@@ -255,8 +276,8 @@ def get_user_details(patient_id):
             "phone_number": row[4]
         })
 
-    except Exception as e:
-        print("Error Fetching User Details:", str(e))
+    except Exception:
+        log.exception("user_details_fetch_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -286,11 +307,12 @@ def update_user_details(patient_id):
         """
         cursor.execute(update_query, (name, dob, location, occupation, patient_id))
         conn.commit()
+        cohort.invalidate()
 
         return jsonify({"status": "success", "message": "Patient details updated successfully"})
 
-    except Exception as e:
-        print("Error Updating User Details:", str(e))
+    except Exception:
+        log.exception("user_details_update_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -298,6 +320,7 @@ def update_user_details(patient_id):
 
 # API Endpoint: Login
 @app.route('/login', methods=['POST'])
+@admit(LOGIN)
 def login():
     data = request.json
     username = data.get('username', '').strip()
@@ -331,8 +354,8 @@ def login():
         else:
             return jsonify({"success": False, "message": "Invalid username or password"}), 401
 
-    except Exception as e:
-        print("Login Error:", str(e))
+    except Exception:
+        log.exception("login_failed")
         return jsonify({"success": False, "message": "Database error occurred"}), 500
 
     finally:
@@ -357,7 +380,7 @@ def logout():
 @app.route('/patients/<string:patient_id>/info', methods=['POST'])
 def store_patient_info(patient_id):  
     data = request.json
-    print("Received data:", data)  # Debug log to check if data is received correctly.
+    log.debug("patient_info_received", patient_id=patient_id, payload=data)
 
     # Extract values from the data
     weight = data.get('weight')
@@ -438,12 +461,20 @@ def store_patient_info(patient_id):
                 current_health_conditions, treatment_details, fitness_goal, allergies, smoking, drinking, sleep_pattern
             ))
 
+        # Edited plan text replaces the parsed rows (blank fields keep the old text, and so the old rows)
+        if structured_diet_chart:
+            plan_items.store_items(cursor, patient_id, DIET, structured_diet_chart)
+        if exercise_prescription:
+            plan_items.store_items(cursor, patient_id, EXERCISE, exercise_prescription)
 
         conn.commit()
+        cohort.invalidate()
+        # Inputs changed: prepare fresh drafts in the background
+        precompute.schedule(patient_id, (DIET, EXERCISE))
         return jsonify({"message": "Patient information saved successfully"})
 
-    except Exception as e:
-        print("Error storing patient info:", str(e))
+    except Exception:
+        log.exception("patient_info_store_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -489,8 +520,8 @@ def add_patient_visit(patient_id):
         conn.commit()
         return jsonify({"message": "Visit added successfully"})
 
-    except Exception as e:
-        print("Error adding patient visit:", str(e))
+    except Exception:
+        log.exception("patient_visit_add_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -521,8 +552,8 @@ def get_patient_visits(patient_id):
 
         return jsonify(visits)
 
-    except Exception as e:
-        print("Error fetching patient visits:", str(e))
+    except Exception:
+        log.exception("patient_visits_fetch_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -569,8 +600,8 @@ def get_patient_info(patient_id):
             "sleep_pattern": row[14],
         })
 
-    except Exception as e:
-        print("Error fetching patient info:", str(e))
+    except Exception:
+        log.exception("patient_info_fetch_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -644,10 +675,11 @@ def store_3_day_recall(patient_id):
             """, (patient_id, day1_meal, day2_meal, day3_meal))
 
         conn.commit()
+        precompute.schedule(patient_id, (DIET,))
         return jsonify({"message": "3-Day Recall data saved successfully"})
 
-    except Exception as e:
-        print("Error storing 3-Day Recall data:", str(e))
+    except Exception:
+        log.exception("recall_store_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -656,11 +688,10 @@ def store_3_day_recall(patient_id):
 #API Endpoint: Get 3 day recall
 @app.route('/patients/<string:patient_id>/getDiet', methods=['GET'])
 def get_3_day_recall(patient_id):
-    print(f"🟢 Fetching Recall Data for: {repr(patient_id)}")  # Debugging
+    log.debug("recall_requested", patient_id=patient_id)
 
     conn = get_db_connection()
     if not conn:
-        print("❌ Database connection failed")
         return jsonify({"error": "Database connection failed"}), 500
 
     try:
@@ -672,10 +703,8 @@ def get_3_day_recall(patient_id):
         """, (patient_id,))
 
         row = cursor.fetchone()
-        print(f"🔍 Query Result: {row}")  # Debugging
 
         if row:
-            print(f"✅ Found Data: Day 1: {row[0]}, Day 2: {row[1]}, Day 3: {row[2]}")
             return jsonify({
                 "day1_meal": row[0].replace("\n", " ").strip() if row[0] else "",
                 "day2_meal": row[1].replace("\n", " ").strip() if row[1] else "",
@@ -683,11 +712,11 @@ def get_3_day_recall(patient_id):
             })
 
         else:
-            print("❌ No recall data found for this patient")
+            log.debug("recall_not_found", patient_id=patient_id)
             return jsonify({"day1_meal": "", "day2_meal": "", "day3_meal": ""}), 200
 
-    except Exception as e:
-        print("❌ Error fetching recall data:", str(e))
+    except Exception:
+        log.exception("recall_fetch_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -697,16 +726,28 @@ def get_3_day_recall(patient_id):
 @app.route('/patients/<string:patient_id>/ipaq', methods=['POST'])
 def store_ipaq_data(patient_id):
     data = request.json
-    print(f"🔍 Received IPAQ Data for {patient_id}: {data}")  # Debugging log
-    total_met = data.get("ipaQ_total_met", 0)
-    vigorous_met = data.get("ipaQ_vigorous_met", 0)
-    moderate_met = data.get("ipaQ_moderate_met", 0)
-    walking_met = data.get("ipaQ_walking_met", 0)
-    activity_category = data.get("ipaQ_category", "").strip()
+    log.debug("ipaq_received", patient_id=patient_id, payload=data)
 
     if not patient_id:
         return jsonify({"error": "Patient ID is required"}), 400
 
+    # Score raw answers server-side; older clients still send precomputed scores
+    answers = None
+    if "answers" in data:
+        try:
+            answers, scores = ipaq.score_one(data["answers"])
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+    else:
+        scores = {key: data.get(key, 0) for key in ("ipaQ_vigorous_met", "ipaQ_moderate_met",
+                                                    "ipaQ_walking_met", "ipaQ_total_met")}
+        scores["ipaQ_category"] = data.get("ipaQ_category", "").strip()
+    total_met = scores["ipaQ_total_met"]
+    vigorous_met = scores["ipaQ_vigorous_met"]
+    moderate_met = scores["ipaQ_moderate_met"]
+    walking_met = scores["ipaQ_walking_met"]
+    activity_category = scores["ipaQ_category"]
+
     conn = get_db_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
@@ -738,12 +779,19 @@ def store_ipaq_data(patient_id):
                 VALUES (?, ?, ?, ?, ?, ?)
             """, (patient_id, vigorous_met, moderate_met, walking_met, total_met, activity_category))
 
+        if answers is not None:
+            ipaq.save_answers(cursor, patient_id, answers)
+        else:
+            ipaq.delete_answers(cursor, patient_id)
+
         conn.commit()
-        print("✅ IPAQ Data Successfully Stored")  # Debugging confirmation
-        return jsonify({"message": "IPAQ data saved successfully"})
+        cohort.invalidate()
+        log.info("ipaq_stored", patient_id=patient_id, scored_server_side=answers is not None)
+        precompute.schedule(patient_id, (EXERCISE,))
+        return jsonify({"message": "IPAQ data saved successfully", **scores})
 
-    except Exception as e:
-        print("Error storing IPAQ data:", str(e))
+    except Exception:
+        log.exception("ipaq_store_failed", patient_id=patient_id)
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
@@ -751,6 +799,8 @@ def store_ipaq_data(patient_id):
 
 #API Endpoint : Generate Diet
 @app.route('/patients/<string:patient_id>/generate-diet', methods=['POST'])
+@admit(LLM)
+@deadline(LLM_DEADLINE_SECONDS)
 def generate_and_store_diet(patient_id):
     conn = get_db_connection()
     if not conn:
@@ -760,112 +810,40 @@ def generate_and_store_diet(patient_id):
         cursor = conn.cursor()
 
         # Fetch patient details including 3-day recall data
-        cursor.execute("""
-            SELECT weight, height, medical_history, current_health_conditions, treatment_details,
-                   fitness_goal, allergies, smoking, drinking, day1_meal, day2_meal, day3_meal
-            FROM PatientInformation
-            JOIN PatientActivityData ON PatientInformation.patient_id = PatientActivityData.patient_id
-            WHERE PatientInformation.patient_id = ?
-        """, (patient_id,))
-        
-        row = cursor.fetchone()
-        if not row:
+        inputs = fetch_diet_inputs(cursor, patient_id)
+        if not inputs:
             return jsonify({"error": "Patient data not found"}), 404
 
-        weight, height, medical_history, current_health_conditions, treatment_details, fitness_goal, \
-        allergies, smoking, drinking, day1_meal, day2_meal, day3_meal = row
-
-        # Prompt for Diet Plan (Analyzing 3-Day Recall)
-        diet_prompt = f"""
-        Based on the patient's 3-day meal recall, analyze their **food preferences** and recommend a **healthy meal plan**.
-
-        **Patient Details:**
-        - Weight: {weight} kg
-        - Height: {height} cm
-        - Medical History: {medical_history}
-        - Current health conditions: {current_health_conditions}
-        - Treatment Details: {treatment_details}
-        - Fitness Goal: {fitness_goal}
-        - Allergies: {allergies}
-        - Smoking: {smoking}
-        - Drinking: {drinking}
-
-        **3-Day Meal Recall:**
-        - **Day 1:** {day1_meal}
-        - **Day 2:** {day2_meal}
-        - **Day 3:** {day3_meal}
-
-        **Analyze:**
-        - Identify **common patterns** (e.g., high carb, protein-rich, vegetarian, fast food, home-cooked meals).
-        - Consider the patient's **likes & dislikes**.
-        - Suggest **healthier alternatives** based on their preferences.
-        - Keep in mind their allergies and fitness goals.
-        - Analyze the amout of calories intake done by patient. 
-
-        **Recommend:**
-        - **Breakfast:** Suggest meals that align with the patient's tastes but are healthier.
-        - **Lunch:** Suggest balanced meals that match their dietary habits.
-        - **Dinner:** Suggest meals that maintain variety while staying nutritious.
-        - **Snacks:** Recommend healthy snacks similar to what they already eat.
-
-        Keep the recommendations **realistic** and based on their existing eating habits.
-        And mention calories the patient consumed(approximate is fine). 
-        And reccomend how much the patient should consume for accomplishing their fitness goal.
-        Take in note their medical history , health conditions etc.
-        """
-
-        # Get AI response for general diet p lan
-        diet_plan = get_openai_response(diet_prompt)
-        if not diet_plan:
-            return jsonify({"error": "Failed to generate diet plan"}), 500
-
-        print("\n🔍 Generated Diet Plan for Patient:", patient_id)
-        print(diet_plan)
-
-        # SECOND PROMPT – Generate Day-wise diet plan from previous output
-        structured_diet_prompt = f"""
-        Based on the following diet plan generated for the patient, convert it into a clear **day-wise diet chart** for one week (Day 1 to Day 7).I want each day meal(no responses like day 1 - day 3 or anything like that). Ensure that the chart includes:
-
-        - **Breakfast**
-        - **Mid-morning snack**
-        - **Lunch**
-        - **Evening snack**
-        - **Dinner**
-        *Note: You can even reccomend alternates for each food you reccomend. And try to stay true to the patients general diet(based on what type of food patient likes)
-
-        The plan should be simple, practical, and in line with the recommendations. Include calories nutritional data and quantity too.
-        In the end also give total calories consumed per day. I want each day's separate plan.Not genereic and try not be repetitive. Based on what cuisine and regional food patient likes only reccomend that.
-        The point is to make the diet plan such that patient can eat healthy while not diverting from their normal eating habits.
-
-        **Reference Diet Plan:**
-        {diet_plan}
-        """
-
-        # Get AI response for structured, day-wise plan
-        structured_diet_chart = get_openai_response(structured_diet_prompt)
-        if not structured_diet_chart:
-            return jsonify({"error": "Failed to generate structured diet chart"}), 500
-
-        print("\n📅 Structured Day-wise Diet Plan:")
-        print(structured_diet_chart)
-
-        # Store both in database
-        cursor.execute("""
-            UPDATE PatientInformation
-            SET diet_prescription = ?, structured_diet_chart = ?
-            WHERE patient_id = ?
-        """, (diet_plan, structured_diet_chart, patient_id))
+        # Use the background draft if it was generated from these exact inputs
+        fingerprint = input_fingerprint(DIET, inputs)
+        plan = precompute.load_draft(cursor, patient_id, DIET, fingerprint)
+        if plan:
+            log.info("diet_plan_from_draft", patient_id=patient_id)
+        else:
+            try:
+                plan, shared = precompute.generate_draft(patient_id, DIET, fingerprint, inputs)
+            except PlanGenerationError as e:
+                return jsonify({"error": str(e)}), 500
+            except DependencyUnavailable as e:
+                return stored_plan_fallback(cursor, patient_id, DIET, e)
+            log.info("diet_plan_generated", patient_id=patient_id, shared=shared,
+                     chars=len(plan["diet_prescription"]) + len(plan["structured_diet_chart"]))
+
+        # Store both in database, with the chart parsed into day-by-meal rows
+        store_plan(cursor, patient_id, DIET, plan)
+        # A draft is served once; asking again for the same inputs generates a new plan
+        precompute.discard_draft(cursor, patient_id, DIET)
 
         conn.commit()
 
         # Return both to frontend
         return jsonify({
-            "diet_prescription": diet_plan,
-            "structured_diet_chart": structured_diet_chart
+            "diet_prescription": plan["diet_prescription"],
+            "structured_diet_chart": plan["structured_diet_chart"]
         })
 
-    except Exception as e:
-        print("❌ Error generating diet plan:", str(e))
+    except Exception:
+        log.exception("diet_generation_failed", patient_id=patient_id)
         return jsonify({"error": "Error generating diet plan"}), 500
 
     finally:
@@ -873,6 +851,8 @@ def generate_and_store_diet(patient_id):
 
 #API Endppint: Exercise
 @app.route('/patients/<string:patient_id>/generate-exercise', methods=['POST'])
+@admit(LLM)
+@deadline(LLM_DEADLINE_SECONDS)
 def generate_and_store_exercise(patient_id):
     conn = get_db_connection()
     if not conn:
@@ -882,87 +862,92 @@ def generate_and_store_exercise(patient_id):
         cursor = conn.cursor()
         
         # Fetch patient details
-        cursor.execute("""
-            SELECT weight, height, medical_history,fitness_goal,smoking,drinking,sleep_pattern, ipaQ_total_met, ipaQ_category,ipaQ_walking_met
-            FROM PatientInformation
-            JOIN PatientActivityData ON PatientInformation.patient_id = PatientActivityData.patient_id
-            WHERE PatientInformation.patient_id = ?
-        """, (patient_id,))
-        
-        row = cursor.fetchone()
-        if not row:
+        inputs = fetch_exercise_inputs(cursor, patient_id)
+        if not inputs:
             return jsonify({"error": "Patient data not found"}), 404
 
-        weight, height, medical_history,fitness_goal,smoking,drinking,sleep_pattern, total_met, activity_category,walking_met = row
-
-        # Prompt for Exercise Plan
-        exercise_prompt = f"""
-        Generate a **personalized exercise plan** for a patient with the following details:
-        - Weight: {weight} kg
-        - Height: {height} cm
-        - Medical History: {medical_history}
-        - Physical Activity Level: {activity_category} (MET Score: {total_met})
-        - Walking MET : {walking_met}
-        - Fitness Goal : {fitness_goal}
-        - Smoking : {smoking}
-        - Drinking : {drinking}
-        - Sleep Pattern : {sleep_pattern}
-
-        Please suggest a **weekly exercise routine**, including:
-        - **Cardio Recommendations** (walking, jogging, cycling, etc.)
-        - **Strength Training** (weight lifting, resistance exercises)
-        - **Flexibility & Mobility Exercises**
-        - **Duration and Frequency per Week**
-        - Talk about reps and sets.
+        # Use the background draft if it was generated from these exact inputs
+        fingerprint = input_fingerprint(EXERCISE, inputs)
+        plan = precompute.load_draft(cursor, patient_id, EXERCISE, fingerprint)
+        if plan:
+            log.info("exercise_plan_from_draft", patient_id=patient_id)
+        else:
+            try:
+                plan, shared = precompute.generate_draft(patient_id, EXERCISE, fingerprint, inputs)
+            except PlanGenerationError as e:
+                return jsonify({"error": str(e)}), 500
+            except DependencyUnavailable as e:
+                return stored_plan_fallback(cursor, patient_id, EXERCISE, e)
+            log.info("exercise_plan_generated", patient_id=patient_id, shared=shared,
+                     chars=len(plan["exercise_prescription"]))
+
+        # Store in database, with the prescription parsed into rows
+        store_plan(cursor, patient_id, EXERCISE, plan)
+        # A draft is served once; asking again for the same inputs generates a new plan
+        precompute.discard_draft(cursor, patient_id, EXERCISE)
         
-        Ensure the plan is **safe and suitable** based on their health condition, fitness goal,met values, health history and their bmi(height and weight).
-        """
+        conn.commit()
 
-        # Fetch AI-generated response
-        exercise_plan = get_openai_response(exercise_prompt)
+        # Return generated exercise plan immediately
+        return jsonify({"exercise_prescription": plan["exercise_prescription"]})
 
-        if not exercise_plan:
-            return jsonify({"error": "Failed to generate exercise plan"}), 500
+    except Exception:
+        log.exception("exercise_generation_failed", patient_id=patient_id)
+        return jsonify({"error": "Error generating exercise plan"}), 500
 
-        # Debugging: Print in terminal
-        print("\n🔍 Generated Exercise Plan for Patient:", patient_id)
-        print(exercise_plan)
+    finally:
+        conn.close()
 
-        # Store in database
-        cursor.execute("""
-            UPDATE PatientInformation
-            SET exercise_prescription = ?
-            WHERE patient_id = ?
-        """, (exercise_plan, patient_id))
-        
-        conn.commit()
 
-        # Return generated exercise plan immediately
-        return jsonify({"exercise_prescription": exercise_plan})
+# API Endpoint: Parsed diet or exercise plan, optionally one day (?day=2) and one meal (?meal=lunch, diet only)
+@app.route('/patients/<string:patient_id>/plans/<string:plan_type>', methods=['GET'])
+def get_plan_items(patient_id, plan_type):
+    if plan_type not in plan_items.PARSERS:
+        return jsonify({"error": "Unknown plan type"}), 404
+    day = request.args.get("day")
+    if day is not None:
+        if not day.isdigit():
+            return jsonify({"error": "day must be a non-negative integer"}), 400
+        day = int(day)
+    meal = request.args.get("meal")
+    if meal is not None:
+        meal = plan_items.meal_key(meal)
+        if plan_type != DIET or meal is None:
+            return jsonify({"error": f"meal must be one of: {', '.join(plan_items.MEAL_ORDER)} (diet plans only)"}), 400
 
-    except Exception as e:
-        print("❌ Error generating exercise plan:", str(e))
-        return jsonify({"error": "Error generating exercise plan"}), 500
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
 
+    try:
+        rows = plan_items.fetch_items(conn.cursor(), patient_id, plan_type, day, meal)
+    except Exception:
+        log.exception("plan_items_failed", patient_id=patient_id, plan_type=plan_type)
+        return jsonify({"error": "Database error occurred"}), 500
     finally:
         conn.close()
 
+    if rows is None:
+        return jsonify({"error": f"No {plan_type} plan for this patient"}), 404
+    group = plan_items.group_diet if plan_type == DIET else plan_items.group_exercise
+    return jsonify({"patient_id": patient_id, "plan_type": plan_type, "day": day, "meal": meal, "days": group(rows)})
+
 # API Endpoint: Store Patient Meal Tracking Data (Date-wise)
 @app.route('/patients/<string:patient_id>/track_meals', methods=['POST'])
 def store_patient_meals(patient_id):
     data = request.json
     
-    # 🔹 Debugging: Log received request payload
-    print("📥 Received Request Data:", data)
+    log.debug("meal_tracking_received", patient_id=patient_id, payload=data)
     meal_date = data.get("meal_date")
-    breakfast = data.get("breakfast", "").strip()
-    lunch = data.get("lunch", "").strip()
-    dinner = data.get("dinner", "").strip()
-    snacks = data.get("snacks", "").strip()
 
     if not patient_id or not meal_date:
         return jsonify({"error": "Patient ID and meal date are required"}), 400
 
+    try:
+        rows = [normalize_entry(data)]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
     conn = get_db_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
@@ -975,36 +960,84 @@ def store_patient_meals(patient_id):
         if not cursor.fetchone():
             return jsonify({"error": "Patient not found"}), 404
 
-        # Check if meal data already exists for this date
-        cursor.execute("""
-            SELECT 1 FROM PatientMealTracking WHERE patient_id = ? AND meal_date = ?
-        """, (patient_id, meal_date))
-        existing_entry = cursor.fetchone()
-
-        if existing_entry:
-            # Update meal entry
-            cursor.execute("""
-                UPDATE PatientMealTracking
-                SET breakfast = ?, lunch = ?, dinner = ?, snacks = ?
-                WHERE patient_id = ? AND meal_date = ?
-            """, (breakfast, lunch, dinner, snacks, patient_id, meal_date))
-        else:
-            # Insert new meal entry
-            cursor.execute("""
-                INSERT INTO PatientMealTracking (patient_id, meal_date, breakfast, lunch, dinner, snacks)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (patient_id, meal_date, breakfast, lunch, dinner, snacks))
+        # Insert or update the day in one statement
+        upsert_meals(cursor, patient_id, rows)
 
         conn.commit()
         return jsonify({"message": "Meal tracking data saved successfully"})
 
-    except Exception as e:
-        print("❌ Error storing meal data:", str(e))
+    except Exception:
+        log.exception("meal_tracking_store_failed", patient_id=patient_id)
+        return jsonify({"error": "Database error occurred"}), 500
+
+    finally:
+        conn.close()
+
+# API Endpoint: Store many days of meals in one request
+@app.route('/patients/<string:patient_id>/track_meals/batch', methods=['POST'])
+def store_patient_meals_batch(patient_id):
+    data = request.json or {}
+
+    try:
+        rows = normalize_entries(data.get("entries"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    try:
+        cursor = conn.cursor()
+
+        # Check if patient exists
+        cursor.execute("SELECT 1 FROM Users WHERE patient_id = ?", (patient_id,))
+        if not cursor.fetchone():
+            return jsonify({"error": "Patient not found"}), 404
+
+        upsert_meals(cursor, patient_id, rows)
+        conn.commit()
+        return jsonify({"message": "Meal tracking data saved successfully", "saved": len(rows)})
+
+    except Exception:
+        log.exception("meal_tracking_batch_store_failed", patient_id=patient_id, entries=len(rows))
         return jsonify({"error": "Database error occurred"}), 500
 
     finally:
         conn.close()
 
+# API Endpoint: Meals for a date range (columnar, with ETag)
+@app.route('/patients/<string:patient_id>/meals', methods=['GET'])
+def get_patient_meals(patient_id):
+    try:
+        end = parse_date(request.args["to"], "to") if request.args.get("to") else datetime.date.today()
+        start = (parse_date(request.args["from"], "from") if request.args.get("from")
+                 else end - datetime.timedelta(days=DEFAULT_RANGE_DAYS - 1))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if start > end:
+        return jsonify({"error": "from must not be after to"}), 400
+    if (end - start).days >= MAX_RANGE_DAYS:
+        return jsonify({"error": f"Date range is limited to {MAX_RANGE_DAYS} days"}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    try:
+        meals = fetch_meals(conn.cursor(), patient_id, start, end)
+    except Exception:
+        log.exception("meal_tracking_fetch_failed", patient_id=patient_id)
+        return jsonify({"error": "Database error occurred"}), 500
+    finally:
+        conn.close()
+
+    response = jsonify({"patient_id": patient_id, "from": start.isoformat(), "to": end.isoformat(), **meals})
+    # Clients revalidate with If-None-Match and get a bodyless 304 when nothing changed
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
 #API-Endpoint : Tracking exercise
 @app.route('/patients/<string:patient_id>/track_exercise', methods=['POST'])
 def track_or_update_exercise(patient_id):
@@ -1026,6 +1059,15 @@ def track_or_update_exercise(patient_id):
         if not cursor.fetchone():
             return jsonify({"error": "Patient not found"}), 404
 
+        # Archived entries on the submitted days, read once for the whole batch
+        dates = [str(ex.get("exercise_date")) for ex in exercises if ex.get("exercise_date")]
+        archived_minutes = collections.defaultdict(list)
+        if dates:
+            for _, exercise_date, exercise_name, minutes, *_ in archive.cold_rows("exercise", patient_id,
+                                                                                  min(dates), max(dates)):
+                archived_minutes[(exercise_date, exercise_name)].append(minutes or 0)
+
+        rollup = RollupDelta(patient_id)
         for ex in exercises:
             name = ex.get("exercise_name", "").strip()
             duration = ex.get("duration_minutes")
@@ -1034,189 +1076,116 @@ def track_or_update_exercise(patient_id):
             if not name or not duration or not date:
                 continue  # skip invalid
 
-            # Check if entry exists
+            # Check if entry exists (its old duration becomes the rollup delta)
             cursor.execute("""
-                SELECT 1 FROM PatientExerciseTracking 
+                SELECT duration_minutes FROM PatientExerciseTracking 
                 WHERE patient_id = ? AND exercise_name = ? AND exercise_date = ?
             """, (patient_id, name, date))
-            exists = cursor.fetchone()
+            existing = [row[0] or 0 for row in cursor.fetchall()]
 
-            if exists:
+            if existing:
                 # Update
                 cursor.execute("""
                     UPDATE PatientExerciseTracking
                     SET duration_minutes = ?
                     WHERE patient_id = ? AND exercise_name = ? AND exercise_date = ?
                 """, (duration, patient_id, name, date))
+                rollup.add(name, date, float(duration) * len(existing) - sum(existing))
             else:
-                # Insert
+                # Insert; on an archived day the new row replaces the archived ones in reads and rollups
                 cursor.execute("""
                     INSERT INTO PatientExerciseTracking 
                     (patient_id, exercise_name, duration_minutes, exercise_date)
                     VALUES (?, ?, ?, ?)
                 """, (patient_id, name, duration, date))
+                archived = archived_minutes[(archive.day(date), name)]
+                rollup.add(name, date, float(duration) - sum(archived), entries=1 - len(archived))
 
+        rollup.apply(cursor)
         conn.commit()
         return jsonify({"message": "Exercise data stored/updated successfully"})
 
-    except Exception as e:
-        print("❌ Error:", e)
+    except Exception:
+        log.exception("exercise_tracking_store_failed", patient_id=patient_id)
         return jsonify({"error": "Database error"}), 500
 
     finally:
         conn.close()
 
-import matplotlib
-matplotlib.use('Agg')  # Ensure the use of a non-GUI backend for Matplotlib
-
-@app.route('/patients/<patient_id>/analyze_meals', methods=['POST'])
-def analyze_meals(patient_id):
+# API Endpoint: Exercise summary from the daily/weekly rollups
+@app.route('/patients/<string:patient_id>/activity_summary', methods=['GET'])
+def get_activity_summary(patient_id):
+    period = request.args.get("period", "day")
+    if period not in ("day", "week"):
+        return jsonify({"error": "period must be 'day' or 'week'"}), 400
     try:
-        import matplotlib.pyplot as plt
-        import pandas as pd
-        import io
-        from PIL import Image
-        import base64
-
-        # Establish DB connection
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # 1. Fetch diet prescription
-        cursor.execute("SELECT diet_prescription FROM PatientInformation WHERE patient_id = ?", (patient_id,))
-        diet_prescription = cursor.fetchone()
-
-        if not diet_prescription:
-            return jsonify({"error": "No diet prescription found for this patient."}), 404
+        end = parse_date(request.args["to"], "to") if request.args.get("to") else datetime.date.today()
+        start = (parse_date(request.args["from"], "from") if request.args.get("from")
+                 else end - datetime.timedelta(days=SUMMARY_RANGE_DAYS - 1))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if start > end:
+        return jsonify({"error": "from must not be after to"}), 400
+    if (end - start).days >= MAX_RANGE_DAYS:
+        return jsonify({"error": f"Date range is limited to {MAX_RANGE_DAYS} days"}), 400
 
-        diet_prescription = diet_prescription[0]
-
-        # 2. Fetch meal tracking data
-        cursor.execute("SELECT meal_date, breakfast, lunch, dinner, snacks FROM PatientMealTracking WHERE patient_id = ?", (patient_id,))
-        meal_logs = cursor.fetchall()
-
-        if not meal_logs:
-            return jsonify({"error": "No meal tracking data found for this patient."}), 404
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
 
-        meal_data = []
-        for meal in meal_logs:
-            meal_date, breakfast, lunch, dinner, snacks = meal
-            meal_data.append({
-                "meal_date": meal_date,
-                "breakfast": breakfast,
-                "lunch": lunch,
-                "dinner": dinner,
-                "snacks": snacks
-            })
+    try:
+        fetch = fetch_daily if period == "day" else fetch_weekly
+        summary = fetch(conn.cursor(), patient_id, start, end)
+    except Exception:
+        log.exception("activity_summary_failed", patient_id=patient_id)
+        return jsonify({"error": "Database error occurred"}), 500
+    finally:
+        conn.close()
 
-        # 3. Prompt 1: Text Analysis
-        analysis_prompt = f"""
-        The patient has a diet prescription as follows:
-        {diet_prescription}
+    response = jsonify({"patient_id": patient_id, "period": period, "from": start.isoformat(),
+                        "to": end.isoformat(), **summary})
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
 
-        The patient ate the following meals on different days:
-        {meal_data}
+@app.route('/patients/<patient_id>/analyze_meals', methods=['POST'])
+@admit(LLM)
+@deadline(LLM_DEADLINE_SECONDS)
+def analyze_meals(patient_id):
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
 
-        Also based on the {meal_data} first understand what kind of food the patient eats , like understand the cuisine first. Once you understand that then generate the analysis.
-        Analyze the meals compared to the diet prescription and determine if the patient ate appropriately. 
-        Highlight if they consumed too much, too little, or the right amount. Suggest necessary dietary changes.
-        """
+    try:
+        cursor = conn.cursor()
 
-        analysis = get_openai_response(analysis_prompt)
-        if not analysis:
+        try:
+            result = analyze_patient_meals(cursor, patient_id)
+        except MealAnalysisUnavailable as e:
+            return jsonify({"error": str(e)}), 404
+        except DependencyUnavailable as e:
+            return stored_analysis_fallback(cursor, patient_id, e)
+        except StructuredOutputError:
+            log.exception("meal_analysis_invalid", patient_id=patient_id)
             return jsonify({"error": "Failed to generate analysis."}), 500
-
-        # 4. Prompt 2: Get graph data
-        graph_prompt = f"""
-        Based on this analysis:
-        {analysis}
-
-        Generate nutritional summary data to be plotted in a bar chart with values for: Calories, Carbs, Protein, Fats — both prescribed and actual. 
-        Return JSON like: 
-        {{
-          "Nutrient": ["Calories", "Carbs", "Protein", "Fats"],
-          "Prescribed": [2000, 300, 100, 70],
-          "Actual": [2500, 400, 90, 110]
-        }}
-
-        return only json no text before or after it.
-        """
-        graph_data = get_openai_response(graph_prompt)
-        graph_data = eval(graph_data)  # parse JSON-like text to dict
-
-        # Generate graph image
-        df_graph = pd.DataFrame(graph_data)
-        fig1, ax1 = plt.subplots()
-        df_graph.set_index('Nutrient').plot(kind='bar', ax=ax1)
-        ax1.set_title("Prescribed vs Actual Nutrient Intake")
-        ax1.set_ylabel("Grams / Calories")
-        ax1.legend()
-
-        buf1 = io.BytesIO()
-        plt.savefig(buf1, format='png')
-        buf1.seek(0)
-        graph_image = buf1.read()
-        plt.close(fig1)
-
-        # 5. Prompt 3: Get table data
-        table_prompt = f"""
-        Based on this analysis:
-        {analysis}
-
-        Generate a table with columns: Nutrient | Prescribed | Actual | Deviation | Analysis.
-        Return JSON like:
-        [
-          ["Calories", 2000, 2500, 500, "Too much"],
-          ["Carbs", 300, 400, 100, "Excess carbs"],
-          ...
-        ]
-        return only json no text before or after it
-        """
-        table_data = get_openai_response(table_prompt)
-        table_data = eval(table_data)
-
-        # Generate table image
-        df_table = pd.DataFrame(table_data, columns=["Nutrient", "Prescribed", "Actual", "Deviation", "Analysis"])
-        fig2, ax2 = plt.subplots(figsize=(6, 4))
-        ax2.axis('off')
-        tbl = ax2.table(cellText=df_table.values, colLabels=df_table.columns, loc='center')
-        tbl.auto_set_font_size(False)
-        tbl.set_fontsize(10)
-        tbl.scale(1.2, 1.5)
-
-        buf2 = io.BytesIO()
-        plt.savefig(buf2, format='png')
-        buf2.seek(0)
-        table_image = buf2.read()
-        plt.close(fig2)
-
-        # 6. Store everything in DB
-        cursor.execute("""
-            UPDATE PatientInformation
-            SET analytics = ?, graph_image = ?, table_image = ?
-            WHERE patient_id = ?
-        """, (analysis, graph_image, table_image, patient_id))
         conn.commit()
 
-        # 7. Close and return
-        cursor.close()
-        conn.close()
-
         # Encode the images to base64 for easier display on the client side
-        graph_image_base64 = encode_image_to_base64(graph_image)
-        table_image_base64 = encode_image_to_base64(table_image)
-
         return jsonify({
             "patient_id": patient_id,
-            "analysis": analysis,
-            "graph_image": graph_image_base64,
-            "table_image": table_image_base64,
-            "graph_data": graph_data,
-            "table_data": table_data
+            "analysis": result["analysis"],
+            "graph_image": encode_image_to_base64(result["graph_image"]),
+            "table_image": encode_image_to_base64(result["table_image"]),
+            "graph_data": result["graph_data"],
+            "table_data": result["table_data"]
         })
 
     except Exception as e:
+        log.exception("analyze_meals_failed", patient_id=patient_id)
         return jsonify({"error": str(e)}), 500
+
+    finally:
+        conn.close()
     
 @app.route('/patients/<patient_id>/analytics_images', methods=['GET'])
 def get_analytics_images(patient_id):
@@ -1243,6 +1212,97 @@ def get_analytics_images(patient_id):
         return jsonify({"error": str(e)}), 500
 
 
+# API Endpoint: Cohort analytics for doctors (cached, filterable)
+@app.route('/cohort/analytics', methods=['GET'])
+def get_cohort_analytics():
+    try:
+        filters = cohort.normalize_filters(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    def load_frame():
+        conn = get_db_connection()
+        if not conn:
+            raise ConnectionError("Database connection failed")
+        try:
+            return cohort.fetch_cohort_frame(conn.cursor())
+        finally:
+            conn.close()
+
+    try:
+        result, cached = cohort.cache.summary(filters, load_frame)
+    except ConnectionError as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception:
+        log.exception("cohort_analytics_failed", filters=filters)
+        return jsonify({"error": "Error computing cohort analytics"}), 500
+
+    response = jsonify(result)
+    response.headers["X-Cache"] = "HIT" if cached else "MISS"
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response.make_conditional(request)
+
+# API Endpoint: Streaming CSV/NDJSON export (resumable with ?after=<last key>)
+@app.route('/exports/<string:dataset>.<string:fmt>', methods=['GET'])
+def export_dataset(dataset, fmt):
+    if not exports.authorized(request.headers.get("Authorization")):
+        return jsonify({"error": "Export token required"}), 403
+    if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+        return jsonify({"error": "Unknown export"}), 404
+    try:
+        after = exports.parse_after(dataset, request.args.get("after"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    patient_id = request.args.get("patient_id")
+    use_gzip = "gzip" in request.headers.get("Accept-Encoding", "")
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    try:
+        batches = exports.iter_batches(conn.cursor(), dataset, after, patient_id)
+        first = next(batches, None)  # runs the query so errors still get a proper status
+    except Exception:
+        conn.close()
+        log.exception("export_failed", dataset=dataset)
+        return jsonify({"error": "Database error occurred"}), 500
+
+    def generate():
+        # The connection stays open while the client reads and is closed at the end
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+
+        def encode(text):
+            data = text.encode("utf-8")
+            return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else data
+
+        rows = 0
+        try:
+            if fmt == "csv" and after is None:
+                yield encode(exports.csv_header(dataset))
+            batch = first
+            while batch:
+                rows += len(batch)
+                yield encode(exports.format_batch(dataset, batch, fmt))
+                batch = next(batches, None)
+            if compressor:
+                yield compressor.flush()
+        except Exception:
+            # Headers are gone; the client sees a short body and resumes with ?after=
+            log.exception("export_stream_failed", dataset=dataset, rows=rows)
+        finally:
+            conn.close()
+            log.info("export_streamed", dataset=dataset, rows=rows, gzip=use_gzip)
+
+    response = Response(stream_with_context(generate()), mimetype=exports.FORMATS[fmt])
+    response.headers["Content-Disposition"] = f'attachment; filename="{dataset}.{fmt}"'
+    response.headers["X-Export-Key"] = ",".join(exports.DATASETS[dataset][1])
+    response.headers["Vary"] = "Accept-Encoding"
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
 #API Endpoint: Retrieve doctor's blogs
 @app.route('/doctor_blogs', methods=['GET'])
 def get_all_blogs():
@@ -1253,11 +1313,51 @@ def get_all_blogs():
 
     try:
         cursor = conn.cursor()
-        cursor.execute("SELECT id, title, content, date_written FROM DoctorBlogs ORDER BY date_written DESC")
-        blogs = [{"id": row[0], "title": row[1], "content": row[2], "date_written": row[3]} for row in cursor.fetchall()]
+        # Served as rendered at write time (BlogRenditions comes from migration 5); raw content only
+        # comes back for blogs without a rendition
+        cursor.execute("""
+            SELECT b.id, b.title, r.content_html, r.excerpt, r.reading_minutes, b.date_written,
+                   CASE WHEN r.blog_id IS NULL THEN b.content END
+            FROM DoctorBlogs b LEFT JOIN BlogRenditions r ON r.blog_id = b.id
+            ORDER BY b.date_written DESC
+        """)
+        blogs = []
+        for blog_id, title, content_html, excerpt, reading_minutes, date_written, content in cursor.fetchall():
+            if content_html is None:  # saved before BlogRenditions; python -m scripts.rerender_blogs fixes it
+                rendition = blog_render.render(content)
+                content_html, excerpt, reading_minutes = rendition.html, rendition.excerpt, rendition.reading_minutes
+            blogs.append({"id": blog_id, "title": title, "content_html": content_html, "excerpt": excerpt,
+                          "reading_minutes": reading_minutes, "date_written": date_written})
         return jsonify(blogs)  # ✅ Returns a list of all blogs
-    except Exception as e:
-        print("Error fetching blogs:", str(e))
+    except Exception:
+        log.exception("blogs_fetch_failed")
+        return jsonify({"error": "Database error occurred"}), 500
+    finally:
+        conn.close()
+
+#API Endpoint: Search doctor's blogs
+@app.route('/doctor_blogs/search', methods=['GET'])
+def search_blogs():
+    """Ranked full-text search with highlighted snippets (api/blog_search.py)."""
+    query = request.args.get("q", "").strip()
+    if not query:
+        return jsonify({"error": "Query parameter q is required"}), 400
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = int(request.args.get("per_page", blog_search.DEFAULT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "page and per_page must be integers"}), 400
+    if page < 1 or not 1 <= per_page <= blog_search.MAX_PAGE_SIZE:
+        return jsonify({"error": f"page must be >= 1 and per_page 1..{blog_search.MAX_PAGE_SIZE}"}), 400
+
+    conn = get_db_connection()
+    if not conn:
+        return jsonify({"error": "Database connection failed"}), 500
+
+    try:
+        return jsonify(blog_search.search(conn.cursor(), query, page, per_page))
+    except Exception:
+        log.exception("blog_search_failed")
         return jsonify({"error": "Database error occurred"}), 500
     finally:
         conn.close()
@@ -1280,8 +1380,8 @@ def get_blog(blog_id):
         
         blog = {"id": row[0], "title": row[1], "content": row[2], "date_written": row[3]}
         return jsonify(blog)  # ✅ Returns one specific blog
-    except Exception as e:
-        print("Error fetching blog:", str(e))
+    except Exception:
+        log.exception("blog_fetch_failed", blog_id=blog_id)
         return jsonify({"error": "Database error occurred"}), 500
     finally:
         conn.close()
@@ -1298,6 +1398,7 @@ def update_blog(id):
     if not title or not content or not date_written:
         return jsonify({"error": "Title, content, and date are required"}), 400
     
+    rendition = blog_render.render(content)
     conn = get_db_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
@@ -1311,11 +1412,16 @@ def update_blog(id):
             SET title = ?, content = ?, date_written = ?
             WHERE id = ?
         """, (title, content, date_written, id))
+        updated = cursor.rowcount
+        if updated:
+            blog_render.save_rendition(cursor, id, rendition)
 
         conn.commit()
+        if updated:
+            blog_search.index_blog(id, title, rendition.text)
         return jsonify({"message": "Blog successfully updated!"})
-    except Exception as e:
-        print("Error updating blog:", str(e))
+    except Exception:
+        log.exception("blog_update_failed", blog_id=id)
         return jsonify({"error": "Database error occurred"}), 500
     finally:
         conn.close()
@@ -1333,11 +1439,13 @@ def delete_blog(id):
         
         # Delete the blog with the given ID
         cursor.execute("DELETE FROM DoctorBlogs WHERE id = ?", (id,))
+        blog_render.delete_rendition(cursor, id)
         
         conn.commit()
+        blog_search.remove_blog(id)
         return jsonify({"message": "Blog successfully deleted!"})
-    except Exception as e:
-        print("Error deleting blog:", str(e))
+    except Exception:
+        log.exception("blog_delete_failed", blog_id=id)
         return jsonify({"error": "Database error occurred"}), 500
     finally:
         conn.close()
@@ -1354,6 +1462,7 @@ def create_blog():
     if not title or not content or not date_written:
         return jsonify({"error": "Title, content, and date are required"}), 400
     
+    rendition = blog_render.render(content)
     conn = get_db_connection()
     if not conn:
         return jsonify({"error": "Database connection failed"}), 500
@@ -1364,13 +1473,17 @@ def create_blog():
         # Insert new blog without deleting previous ones
         cursor.execute("""
             INSERT INTO DoctorBlogs (title, content, date_written)
+            OUTPUT INSERTED.id
             VALUES (?, ?, ?)
         """, (title, content, date_written))
+        blog_id = cursor.fetchone()[0]
+        blog_render.save_rendition(cursor, blog_id, rendition)
 
         conn.commit()
+        blog_search.index_blog(blog_id, title, rendition.text)
         return jsonify({"message": "Blog successfully saved!"})
-    except Exception as e:
-        print("Error saving blog:", str(e))
+    except Exception:
+        log.exception("blog_create_failed")
         return jsonify({"error": "Database error occurred"}), 500
     finally:
         conn.close()
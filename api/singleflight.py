@@ -0,0 +1,189 @@
+"""Single-flight execution: identical work in progress runs once, callers share its result.
+
+``run(key, compute)`` is used for plan generation, keyed on (plan
+type, patient id, input fingerprint). Repeated clicks on "generate" and the
+precompute job for the same inputs all end up with one OpenAI chain.
+
+Within a worker, the first caller for a key runs ``compute()`` and the
+others block until it finishes, then get its result (or its exception).
+Across gunicorn workers, the running caller holds a row in
+``SingleFlightLocks`` (migration 2). When ``compute()`` returns, the holder
+publishes the result (as JSON, so it must serialize) in
+``SingleFlightResults`` (migration 7) for ``RESULT_TTL_SECONDS`` and
+releases the lock. A caller in another worker
+that finds the lock taken polls for that result. It is not the plan draft
+the routes read, because a route deletes the draft as soon as it stores the
+plan, usually before a waiter's next poll. If the holder fails or its lease
+expires without a result, the waiting caller computes the result itself.
+Waits end at the request deadline.
+``SINGLEFLIGHT_SHARED=0`` turns the lock table off and keeps only the
+in-worker coalescing.
+"""
+import json
+import os
+import threading
+import time
+import uuid
+
+from api import resilience
+from api.db import get_db_connection
+from api.logs import get_logger
+
+log = get_logger(__name__)
+
+SINGLEFLIGHT_SHARED = os.getenv("SINGLEFLIGHT_SHARED", "1") != "0"
+# Longest a plan generation may hold a key; a crashed worker's lock lapses after this
+LOCK_TTL_SECONDS = float(os.getenv("SINGLEFLIGHT_LOCK_TTL_SECONDS", "180"))
+POLL_SECONDS = 1.0
+# How long a published result stays readable; several polls, so every waiter sees it
+RESULT_TTL_SECONDS = float(os.getenv("SINGLEFLIGHT_RESULT_TTL_SECONDS", "30"))
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+def run(key, compute):
+    """Run ``compute()`` once for ``key`` while it is in flight; returns (result, shared).
+
+    ``shared`` is True when the result came from another caller's run.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        log.info("singleflight_joined", key=":".join(key))
+        if not flight.done.wait(max(0.0, resilience.remaining(LOCK_TTL_SECONDS))):
+            log.warning("singleflight_wait_timed_out", key=":".join(key))
+            resilience.check_deadline("singleflight")
+            return compute(), False
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, True
+
+    try:
+        flight.result, shared = _run_across_workers(":".join(key), compute)
+        return flight.result, shared
+    except BaseException as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            del _flights[key]
+        flight.done.set()
+
+
+def _run_across_workers(lock_key, compute):
+    if not SINGLEFLIGHT_SHARED:
+        return compute(), False
+    owner = uuid.uuid4().hex
+    acquired = _try_acquire(lock_key, owner)
+    if acquired is False:
+        log.info("singleflight_waiting", key=lock_key)
+        result = _wait_for_holder(lock_key)
+        if result is not None:
+            return result, True
+        acquired = _try_acquire(lock_key, owner)
+    if not acquired:
+        return compute(), False
+    result = None
+    try:
+        result = compute()
+        return result, False
+    finally:
+        _release(lock_key, owner, result)
+
+
+def _try_acquire(lock_key, owner):
+    """True if we now hold the key, False if another worker does, None if the lock table is unusable."""
+    conn = get_db_connection()
+    if not conn:
+        return None
+    try:
+        cursor = conn.cursor()
+        now = time.time()
+        cursor.execute("DELETE FROM SingleFlightLocks WHERE lock_key = ? AND expires_at < ?", (lock_key, now))
+        conn.commit()
+        try:
+            cursor.execute("INSERT INTO SingleFlightLocks (lock_key, owner, expires_at) VALUES (?, ?, ?)",
+                           (lock_key, owner, now + LOCK_TTL_SECONDS))
+            conn.commit()
+            return True
+        except Exception:
+            # Primary key violation: someone else inserted it first
+            return False if _held(cursor, lock_key) else None
+    except Exception:
+        log.warning("singleflight_lock_unavailable", key=lock_key, exc_info=True)
+        return None
+    finally:
+        conn.close()
+
+
+def _held(cursor, lock_key):
+    cursor.execute("SELECT 1 FROM SingleFlightLocks WHERE lock_key = ? AND expires_at >= ?", (lock_key, time.time()))
+    return cursor.fetchone() is not None
+
+
+def _published(cursor, lock_key):
+    cursor.execute("SELECT payload FROM SingleFlightResults WHERE lock_key = ? AND expires_at >= ?",
+                   (lock_key, time.time()))
+    row = cursor.fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _wait_for_holder(lock_key):
+    """Poll until the holder publishes its result; None if it gave up without one."""
+    deadline = time.monotonic() + resilience.remaining(LOCK_TTL_SECONDS)
+    while time.monotonic() < deadline:
+        conn = get_db_connection()
+        if not conn:
+            return None
+        try:
+            cursor = conn.cursor()
+            # Lock first: a holder publishes before it releases, so a released lock means the result is there
+            held = _held(cursor, lock_key)
+            result = _published(cursor, lock_key)
+        except Exception:
+            log.warning("singleflight_poll_failed", key=lock_key, exc_info=True)
+            return None
+        finally:
+            conn.close()
+        if result is not None or not held:
+            return result
+        time.sleep(POLL_SECONDS)
+    return None
+
+
+def _release(lock_key, owner, result=None):
+    """Publish ``result`` for the waiters (unless None), then drop the lock."""
+    conn = get_db_connection()
+    if not conn:
+        return
+    try:
+        cursor = conn.cursor()
+        if result is not None:
+            try:
+                now = time.time()
+                cursor.execute("DELETE FROM SingleFlightResults WHERE lock_key = ? OR expires_at < ?",
+                               (lock_key, now))
+                cursor.execute("INSERT INTO SingleFlightResults (lock_key, payload, expires_at) VALUES (?, ?, ?)",
+                               (lock_key, json.dumps(result), now + RESULT_TTL_SECONDS))
+                conn.commit()
+            except Exception:
+                # The waiters then find the lock gone without a result and compute it themselves
+                log.warning("singleflight_publish_failed", key=lock_key, exc_info=True)
+        cursor.execute("DELETE FROM SingleFlightLocks WHERE lock_key = ? AND owner = ?", (lock_key, owner))
+        conn.commit()
+    except Exception:
+        log.warning("singleflight_release_failed", key=lock_key, exc_info=True)
+    finally:
+        conn.close()
@@ -2,9 +2,17 @@ import os
 import sys
 from flask import Flask
 from flask_cors import CORS
+from api.logs import init_logging
+
+# Structured JSON logging with a background writer (configure via LOG_* env vars)
+init_logging()
+
 from api.routes import app as api_blueprint
 from html_routes.routes import app_html as html_blueprint
-from init_db import initialize_database
+from api.metrics import init_metrics
+from api.profiler import init_profiler
+from api.resilience import init_resilience
+from api.db import init_replica_routing
 
 # Detect base directory correctly
 if getattr(sys, 'frozen', False):
@@ -31,10 +39,40 @@ CORS(app)
 app.register_blueprint(api_blueprint)
 app.register_blueprint(html_blueprint)
 
+# Request/DB/LLM metrics, exposed at /metrics
+init_metrics(app)
+
+# Slow-query log; PROFILE_QUERIES=1 also flags N+1 query patterns per request
+init_profiler(app)
+
+# Request deadlines and 503 + Retry-After while the database or OpenAI is out
+init_resilience(app)
+
+# Successful writes keep the session's reads on the primary for a while (read replica)
+init_replica_routing(app)
+
 # 👇 Azure looks for this variable
 application = app  # gunicorn will use this
 
+# Meal chart rendered by ``app --smoke-chart``; the build check runs it against the bundle
+SMOKE_CHART = (
+    {"Nutrient": ["Calories", "Protein"], "Prescribed": [2000, 100], "Actual": [2500, 90]},
+    [["Calories", 2000, 2500, 500, "Too much"], ["Protein", 100, 90, -10, "Too little"]],
+)
+
 # Local run only
 if __name__ == "__main__":
-    initialize_database()
-    app.run(debug=True)
+    # Render the plotting stack once and exit, so a bundle missing part of it fails the build
+    if "--smoke-chart" in sys.argv[1:]:
+        from api.meal_analysis import render_meal_charts
+        graph_image, table_image = render_meal_charts(*SMOKE_CHART)
+        print(f"📊 Chart smoke test rendered {len(graph_image)} + {len(table_image)} PNG bytes")
+        sys.exit(0)
+    # SKIP_DB_INIT=1 lets the launch benchmark start without a database
+    if os.getenv("SKIP_DB_INIT") != "1":
+        from init_db import initialize_database  # not needed by gunicorn workers
+        initialize_database()
+    # The debug reloader re-executes the program; in the frozen desktop build
+    # that would mean a second full startup, so it is only used from source.
+    frozen = getattr(sys, 'frozen', False)
+    app.run(debug=not frozen, port=int(os.getenv("PORT", "5000")))
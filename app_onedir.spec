@@ -0,0 +1,80 @@
+# -*- mode: python ; coding: utf-8 -*-
+#
+# Fast-starting desktop build: an unpacked "onedir" bundle.
+#
+#     pyinstaller app_onedir.spec        ->  dist/app/app(.exe)
+#
+# Unlike app.spec (one-file EXE + UPX), nothing has to be extracted to a temp
+# dir on every launch and nothing is UPX-decompressed, so Flask starts as soon
+# as the interpreter is up. pandas/matplotlib stay inside the PYZ archive and
+# are only imported on the first /analyze_meals call.
+import os
+
+# Modules the app never imports; leaving them out shrinks the bundle and the
+# directory the bootloader has to scan.
+excludes = [
+    # GUI toolkits and interactive matplotlib backends (only Agg is used)
+    'tkinter', '_tkinter', 'PyQt5', 'PyQt6', 'PySide2', 'PySide6', 'wx', 'gi',
+    'matplotlib.backends.backend_tkagg', 'matplotlib.backends.backend_tkcairo',
+    'matplotlib.backends.backend_qtagg', 'matplotlib.backends.backend_qt5agg',
+    'matplotlib.backends.backend_wxagg', 'matplotlib.backends.backend_gtk3agg',
+    'matplotlib.backends.backend_gtk4agg', 'matplotlib.backends.backend_webagg',
+    'matplotlib.backends.backend_pdf', 'matplotlib.backends.backend_ps',
+    'matplotlib.backends.backend_svg', 'matplotlib.backends.backend_pgf',
+    'PIL.ImageTk', 'PIL.ImageQt',
+    # Notebook / dev tooling pulled in by optional pandas and matplotlib paths
+    'IPython', 'jupyter_client', 'notebook', 'pytest', 'setuptools', 'pip',
+    # (not pandas.plotting._matplotlib.*: DataFrame.plot imports the whole
+    # package, so /analyze_meals needs it; benchmarks.launch checks a chart renders)
+    'pandas.tests', 'numpy.tests', 'matplotlib.tests', 'pandas.io.clipboard',
+    'scipy', 'sqlalchemy', 'openpyxl', 'xlsxwriter', 'tables', 'numexpr', 'bottleneck',
+    # The Supabase client is only created when SUPABASE_URL/KEY are configured,
+    # which the desktop build never is.
+    'supabase', 'postgrest', 'gotrue', 'realtime', 'storage3', 'supafunc',
+]
+
+a = Analysis(
+    ['app.py'],
+    pathex=[],
+    binaries=[],
+    datas=[('templates', 'templates'), ('static', 'static')],
+    # pandas imports its Parquet engine by name, which the analysis can't see;
+    # archived tracking rows (api/archive.py) need it
+    hiddenimports=['pyarrow'],
+    hookspath=[],
+    hooksconfig={'matplotlib': {'backends': 'Agg'}},
+    runtime_hooks=[],
+    excludes=excludes,
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='app',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+    icon=['icon.ico'] if os.path.exists('icon.ico') else None,
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='app',
+)
@@ -0,0 +1,212 @@
+"""Local stand-in for the OpenAI chat completions API.
+
+Serves ``POST /v1/chat/completions`` with deterministic fake answers so the
+app, the batch runner and the benchmarks can run without a real key or
+network. Point the code at it with ``OPENAI_BASE_URL``:
+
+    python -m benchmarks.fake_openai --port 8089 --latency 0.5 --error-rate 0.05
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=fake python -m scripts.batch_regenerate ...
+
+or in-process::
+
+    with FakeOpenAIServer(latency=0.2) as server:
+        os.environ["OPENAI_BASE_URL"] = server.base_url
+
+Requests with a ``json_schema`` response format get a generated instance of
+that schema; everything else gets a markdown plan. Latency is ``latency``
+plus ``completion_tokens / tokens_per_second``; ``error_rate`` of the
+requests fail with ``error_status``. ``stream=True`` is answered with
+server-sent events, one chunk per line of the answer.
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PLAN_TEXT = """### Day {day}
+- **Breakfast:** Vegetable poha with peanuts (1 bowl, 250 kcal)
+- **Mid-morning snack:** Apple and 10 almonds (150 kcal)
+- **Lunch:** 2 rotis, dal, mixed sabzi and salad (550 kcal)
+- **Evening snack:** Roasted chana (100 kcal)
+- **Dinner:** Grilled paneer with sauteed vegetables (450 kcal)
+- **Exercise:** Brisk walking 30 minutes; 3 sets x 12 reps squats
+**Total:** 1500 kcal
+"""
+
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def sample_from_schema(schema, seed=0):
+    """Build a value that satisfies a (strict, structured-output style) JSON schema."""
+    kind = schema.get("type")
+    if kind == "object":
+        return {name: sample_from_schema(sub, seed + i) for i, (name, sub) in enumerate(schema.get("properties", {}).items())}
+    if kind == "array":
+        return [sample_from_schema(schema.get("items", {}), seed + i) for i in range(4)]
+    if kind in ("number", "integer"):
+        return 100 + (seed * 37) % 400
+    if kind == "boolean":
+        return seed % 2 == 0
+    if "enum" in schema:
+        return schema["enum"][seed % len(schema["enum"])]
+    return f"Sample text {seed}: intake was slightly above the prescription; reduce fried snacks."
+
+
+class FakeOpenAIServer:
+    """Threaded HTTP server; ``start()`` returns the ``/v1`` base URL."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, tokens_per_second=0.0,
+                 error_rate=0.0, error_status=500, plan_days=7, seed=None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.plan_days = plan_days
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-openai", daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def answer(self, body):
+        """Return the completion text for a request body."""
+        prompt = json.dumps(body.get("messages", []), sort_keys=True)
+        seed = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:8], 16)
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            return json.dumps(sample_from_schema(response_format["json_schema"]["schema"], seed % 97))
+        return "\n".join(PLAN_TEXT.format(day=day) for day in range(1, self.plan_days + 1))
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            fail = self.error_rate and self.random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            return fail
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, payload, headers=()):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._send_json(404, {"error": {"message": "not found"}})
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                time.sleep(server.latency)
+                if server._should_fail():
+                    headers = [("Retry-After", "1")] if server.error_status == 429 else []
+                    return self._send_json(server.error_status, {"error": {
+                        "message": "Injected failure from fake OpenAI", "type": "server_error"}}, headers)
+
+                content = server.answer(body)
+                prompt_tokens = estimate_tokens(json.dumps(body.get("messages", [])))
+                completion_tokens = estimate_tokens(content)
+                model = body.get("model", "gpt-4o")
+                if body.get("stream"):
+                    return self._stream(model, content)
+                if server.tokens_per_second:
+                    time.sleep(completion_tokens / server.tokens_per_second)
+                self._send_json(200, {
+                    "id": f"chatcmpl-fake-{server.requests}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content, "refusal": None}}],
+                    "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens},
+                })
+
+            def _stream(self, model, content):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                pieces = content.splitlines(keepends=True) or [""]
+                for piece in pieces:
+                    if server.tokens_per_second:
+                        time.sleep(estimate_tokens(piece) / server.tokens_per_second)
+                    chunk = {"id": "chatcmpl-fake-stream", "object": "chat.completion.chunk",
+                             "created": int(time.time()), "model": model,
+                             "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                done = {"id": "chatcmpl-fake-stream", "object": "chat.completion.chunk",
+                        "created": int(time.time()), "model": model,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+                self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+                self.close_connection = True
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI chat completions server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before answering")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="0 = instant generation")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.tokens_per_second,
+                              args.error_rate, args.error_status, seed=args.seed)
+    print(f"Fake OpenAI listening on {server.base_url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Launch-to-first-response benchmark for the desktop build.
+
+Starts the app the way a user does (the onedir bundle from
+``app_onedir.spec`` by default, or any command given with ``--cmd``),
+polls a page until it answers with HTTP 200 and records how long that
+took. Each run uses a fresh process; the median and worst run are
+compared against the budget. Before timing, the app is run once with
+``--smoke-chart`` to render a meal chart, so a bundle that left out part
+of the lazily imported plotting stack fails here rather than on the first
+/analyze_meals call.
+
+    pyinstaller app_onedir.spec
+    python -m benchmarks.launch                          # dist/app/app
+    python -m benchmarks.launch --cmd "python app.py"    # from source
+    python -m benchmarks.launch --runs 10 --max-ms 3000 --json launch.json
+    python -m benchmarks.launch --skip-chart-smoke       # timing only
+
+Runs on Linux (CI) and macOS; the database is not needed because the
+probe page is a static template and SKIP_DB_INIT=1 is set.
+"""
+import argparse
+import json
+import os
+import shlex
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+DEFAULT_BUNDLE = os.path.join(REPO_ROOT, "dist", "app", "app")
+DEFAULT_MAX_MS = 4000
+
+
+def free_port():
+    """Ask the OS for an unused TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_response(url, proc, timeout):
+    """Poll ``url`` until it returns 200; return False if the process dies or time runs out."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            return False
+        try:
+            with urllib.request.urlopen(url, timeout=1) as response:
+                if response.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, socket.timeout):
+            pass
+        time.sleep(0.01)
+    return False
+
+
+def stop(proc):
+    """Stop the launched app and any reloader child it spawned."""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=10)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+
+
+def launch_once(cmd, path, timeout):
+    """Launch the app once and return milliseconds until the first 200 response."""
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), SKIP_DB_INIT="1")
+    env.setdefault("OPENAI_API_KEY", "sk-launch-benchmark")
+    start = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=REPO_ROOT, env=env, start_new_session=True,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        ok = wait_for_response(f"http://127.0.0.1:{port}{path}", proc, timeout)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+    finally:
+        stop(proc)
+    if not ok:
+        stderr = proc.stderr.read().decode(errors="replace")[-4000:]
+        raise RuntimeError(f"App did not answer {path} within {timeout}s:\n{stderr}")
+    return elapsed_ms
+
+
+def smoke_chart(cmd, timeout):
+    """Run the app with ``--smoke-chart``; raise if it cannot render a meal chart."""
+    env = dict(os.environ, SKIP_DB_INIT="1")
+    env.setdefault("OPENAI_API_KEY", "sk-launch-benchmark")
+    proc = subprocess.run(cmd + ["--smoke-chart"], cwd=REPO_ROOT, env=env, timeout=timeout,
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    if proc.returncode != 0:
+        output = proc.stdout.decode(errors="replace")[-4000:]
+        raise RuntimeError(f"Chart smoke test failed (exit {proc.returncode}):\n{output}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure launch-to-first-response time.")
+    parser.add_argument("--cmd", help=f"command that starts the app (default: {DEFAULT_BUNDLE})")
+    parser.add_argument("--path", default="/login", help="page to request (default: /login)")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait per launch")
+    parser.add_argument("--max-ms", type=float, default=float(os.getenv("LAUNCH_MAX_MS", DEFAULT_MAX_MS)))
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    parser.add_argument("--skip-chart-smoke", action="store_true",
+                        help="don't check that the app can render a meal chart first")
+    args = parser.parse_args(argv)
+
+    cmd = shlex.split(args.cmd) if args.cmd else [DEFAULT_BUNDLE]
+    if not args.cmd and not os.path.exists(DEFAULT_BUNDLE):
+        parser.error(f"{DEFAULT_BUNDLE} not found; run 'pyinstaller app_onedir.spec' or pass --cmd")
+
+    if not args.skip_chart_smoke:
+        smoke_chart(cmd, args.timeout)
+        print("✅ Meal chart renders")
+
+    timings = [launch_once(cmd, args.path, args.timeout) for _ in range(args.runs)]
+    median_ms = statistics.median(timings)
+    worst_ms = max(timings)
+
+    print(f"Launch to first response of {' '.join(cmd)} ({args.runs} runs)")
+    print(f"  median : {median_ms:8.1f} ms   (budget {args.max_ms:.0f} ms)")
+    print(f"  min    : {min(timings):8.1f} ms")
+    print(f"  max    : {worst_ms:8.1f} ms")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({"cmd": cmd, "path": args.path, "runs_ms": timings,
+                       "median_ms": median_ms, "max_ms": worst_ms, "budget_ms": args.max_ms}, f, indent=2)
+
+    if median_ms > args.max_ms:
+        print(f"❌ median launch time {median_ms:.1f} ms exceeds {args.max_ms:.0f} ms")
+        return 1
+    print("✅ Launch time within budget")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
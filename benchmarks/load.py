@@ -0,0 +1,413 @@
+"""End-to-end load test of the API against local fakes.
+
+Boots ``app.py`` in-process on a threaded WSGI server with the embedded
+database (``DB_BACKEND=sqlite``, schema from ``api/migrations.py``) and
+``benchmarks.fake_openai`` standing in for OpenAI, then drives a weighted
+mix of endpoints from ``--concurrency`` client threads and reports latency
+percentiles and throughput per route:
+
+    python -m benchmarks.load --duration 30 --concurrency 16 --out load.json
+    python -m benchmarks.load --mix login=50,search=50 --requests 2000
+    python -m benchmarks.load --llm-latency 2 --llm-tokens-per-second 60 --llm-error-rate 0.05
+    python -m benchmarks.load --out new.json --compare baseline.json --max-regression 0.2
+
+``--compare`` prints the change against an earlier result file and exits
+non-zero when a route's p95 grew (or total throughput fell) by more than
+``--max-regression``. ``--target URL`` sends the same mix to an already
+running server instead; it must use a database seeded by this script
+(``--seed-only --db PATH``).
+
+Each patient's first ``generate-diet`` calls the fake model; later calls
+for the same patient reuse the stored draft, so use ``--patients`` to
+control how much of that route is model-bound.
+"""
+import argparse
+import datetime
+import http.client
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+PASSWORD = "load-test-password"
+DEFAULT_MIX = "register=5,login=15,search=25,track_meals=20,track_exercise=20,generate_diet=5,analyze_meals=10"
+
+FIRST_NAMES = ["Aarav", "Diya", "Kabir", "Meera", "Rohan", "Anaya", "Vihaan", "Isha", "Arjun", "Sara"]
+LAST_NAMES = ["Sharma", "Patel", "Iyer", "Khan", "Das", "Reddy", "Singh", "Nair", "Gupta", "Joshi"]
+MEALS = ["Poha with peanuts", "2 rotis, dal, sabzi", "Idli sambar", "Paneer salad", "Rajma chawal",
+         "Oats with banana", "Grilled fish, rice", "Fruit bowl", "Masala dosa", "Khichdi with curd"]
+EXERCISES = ["Walking", "Cycling", "Yoga", "Swimming", "Squats", "Skipping"]
+
+
+def seed_database(path, patients, seed=0):
+    """Create the schema at ``path`` and insert ``patients`` complete patient records."""
+    import bcrypt
+    from api import embedded_db, migrations
+
+    rng = random.Random(seed)
+    password_hash = bcrypt.hashpw(PASSWORD.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+    conn = embedded_db.connect(path)
+    try:
+        migrations.migrate(conn)
+        cursor = conn.cursor()
+        cursor.execute("BEGIN")
+        today = datetime.date.today()
+        for i in range(patients):
+            patient_id = f"MYH{239 + i:05d}"
+            name = f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}"
+            cursor.execute("""
+                INSERT INTO Users (patient_id, Name, PhoneNumber, Email, DOB, Location, Occupation, Username, Password)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (patient_id, name, f"98{rng.randrange(10**8):08d}", f"patient{i}@example.com", "1988-04-12",
+                  "Pune", "Engineer", f"loaduser{i}", password_hash))
+            cursor.execute("""
+                INSERT INTO PatientInformation (patient_id, weight, height, blood_group, medical_history,
+                    current_health_conditions, treatment_details, fitness_goal, allergies, smoking, drinking,
+                    sleep_pattern, diet_prescription)
+                VALUES (?, ?, ?, 'B+', 'None', 'Mild hypertension', 'None', 'Weight loss', 'None', 'No',
+                    'Occasionally', '7 hours', 'Balanced 1800 kcal vegetarian diet')
+            """, (patient_id, rng.randrange(55, 110), rng.randrange(150, 190)))
+            days = [" | ".join(rng.sample(MEALS, 4)) for _ in range(3)]
+            cursor.execute("""
+                INSERT INTO PatientActivityData (patient_id, day1_meal, day2_meal, day3_meal, ipaQ_vigorous_met,
+                    ipaQ_moderate_met, ipaQ_walking_met, ipaQ_total_met, ipaQ_category)
+                VALUES (?, ?, ?, ?, 480, 640, 693, 1813, 'Moderate')
+            """, (patient_id, *days))
+            for back in range(1, 4):
+                cursor.execute("""
+                    INSERT INTO PatientMealTracking (patient_id, meal_date, breakfast, lunch, dinner, snacks)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, (patient_id, (today - datetime.timedelta(days=back)).isoformat(), *rng.sample(MEALS, 4)))
+        cursor.execute("COMMIT")
+    finally:
+        conn.close()
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f"unknown scenario {name.strip()!r}; choose from {', '.join(SCENARIOS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+# Each scenario returns (route label, method, path, JSON body)
+def _register(rng, patients):
+    suffix = rng.randrange(10**9)
+    return "POST /register", "POST", "/register", {
+        "name": f"{rng.choice(FIRST_NAMES)} Load{suffix}", "email": f"load{suffix}@example.com",
+        "dob": "1990-01-01", "location": "Mumbai", "occupation": "Teacher", "phone": f"97{suffix:08d}"[:10]}
+
+
+def _login(rng, patients):
+    return "POST /login", "POST", "/login", {"username": f"loaduser{rng.randrange(patients)}", "password": PASSWORD}
+
+
+def _search(rng, patients):
+    query = rng.choice([rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES), f"MYH{239 + rng.randrange(patients):05d}"])
+    return "GET /search", "GET", "/search?" + urllib.parse.urlencode({"query": query}), None
+
+
+def _patient(rng, patients):
+    return f"MYH{239 + rng.randrange(patients):05d}"
+
+
+def _track_meals(rng, patients):
+    day = datetime.date.today() - datetime.timedelta(days=rng.randrange(30))
+    return "POST /patients/<id>/track_meals", "POST", f"/patients/{_patient(rng, patients)}/track_meals", {
+        "meal_date": day.isoformat(), "breakfast": rng.choice(MEALS), "lunch": rng.choice(MEALS),
+        "dinner": rng.choice(MEALS), "snacks": rng.choice(MEALS)}
+
+
+def _track_meals_batch(rng, patients):
+    end = datetime.date.today() - datetime.timedelta(days=rng.randrange(30))
+    entries = [{"meal_date": (end - datetime.timedelta(days=back)).isoformat(), "breakfast": rng.choice(MEALS),
+                "lunch": rng.choice(MEALS), "dinner": rng.choice(MEALS), "snacks": rng.choice(MEALS)}
+               for back in range(7)]
+    return "POST /patients/<id>/track_meals/batch", "POST", \
+        f"/patients/{_patient(rng, patients)}/track_meals/batch", {"entries": entries}
+
+
+def _get_meals(rng, patients):
+    return "GET /patients/<id>/meals", "GET", f"/patients/{_patient(rng, patients)}/meals", None
+
+
+def _track_exercise(rng, patients):
+    day = datetime.date.today() - datetime.timedelta(days=rng.randrange(30))
+    exercises = [{"exercise_name": name, "duration_minutes": rng.randrange(10, 60), "exercise_date": day.isoformat()}
+                 for name in rng.sample(EXERCISES, 3)]
+    return "POST /patients/<id>/track_exercise", "POST", f"/patients/{_patient(rng, patients)}/track_exercise", {
+        "exercises": exercises}
+
+
+def _generate_diet(rng, patients):
+    return "POST /patients/<id>/generate-diet", "POST", f"/patients/{_patient(rng, patients)}/generate-diet", None
+
+
+def _analyze_meals(rng, patients):
+    return "POST /patients/<id>/analyze_meals", "POST", f"/patients/{_patient(rng, patients)}/analyze_meals", None
+
+
+SCENARIOS = {
+    "register": _register,
+    "login": _login,
+    "search": _search,
+    "track_meals": _track_meals,
+    "track_meals_batch": _track_meals_batch,
+    "get_meals": _get_meals,
+    "track_exercise": _track_exercise,
+    "generate_diet": _generate_diet,
+    "analyze_meals": _analyze_meals,
+}
+
+
+def start_app(host="127.0.0.1"):
+    """Serve ``app.app`` on a threaded WSGI server; returns (server, base_url)."""
+    from werkzeug.serving import make_server
+
+    sys.path.insert(0, REPO_ROOT)
+    from app import app
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # no access log line per request
+
+    server = make_server(host, 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, name="load-app", daemon=True).start()
+    return server, f"http://{host}:{server.server_port}"
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_load(base_url, mix, patients, concurrency, duration=None, requests=None, seed=0, timeout=120):
+    """Send the mix until ``duration`` seconds pass or ``requests`` are sent; returns per-route samples."""
+    target = urllib.parse.urlsplit(base_url)
+    names, weights = zip(*mix.items())
+    samples = defaultdict(list)        # route -> [(seconds, status)]
+    lock = threading.Lock()
+    sent = [0]
+    deadline = time.monotonic() + duration if duration else None
+
+    def claim():
+        with lock:
+            if requests is not None and sent[0] >= requests:
+                return False
+            sent[0] += 1
+            return True
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        conn = None
+        while (deadline is None or time.monotonic() < deadline) and claim():
+            route, method, path, body = SCENARIOS[rng.choices(names, weights)[0]](rng, patients)
+            payload = json.dumps(body).encode("utf-8") if body is not None else None
+            headers = {"Content-Type": "application/json"} if payload is not None else {}
+            started = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection(target.hostname, target.port, timeout=timeout)
+                conn.request(method, target.path.rstrip("/") + path, body=payload, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                status = response.status
+                if response.will_close:
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                status = 0
+                if conn is not None:
+                    conn.close()
+                    conn = None
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[route].append((elapsed, status))
+        if conn is not None:
+            conn.close()
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, time.monotonic() - started
+
+
+def summarize(samples, elapsed):
+    """Per-route and total count, error count, latency percentiles (ms) and requests/second."""
+    def stats(entries):
+        latencies = [seconds * 1000 for seconds, _ in entries]
+        statuses = defaultdict(int)
+        for _, status in entries:
+            statuses[str(status)] += 1
+        return {
+            "count": len(entries),
+            "errors": sum(1 for _, status in entries if status == 0 or status >= 500),
+            "statuses": dict(sorted(statuses.items())),
+            "rps": round(len(entries) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "mean_ms": round(statistics.mean(latencies), 2) if latencies else 0.0,
+            "max_ms": round(max(latencies), 2) if latencies else 0.0,
+        }
+
+    routes = {route: stats(entries) for route, entries in sorted(samples.items())}
+    total = stats([entry for entries in samples.values() for entry in entries])
+    return {"elapsed_seconds": round(elapsed, 3), "routes": routes, "total": total}
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, baseline, max_regression):
+    """Print p95 and throughput changes; return the list of regressions beyond ``max_regression``."""
+    regressions = []
+    print(f"\nvs {baseline.get('commit') or 'baseline'}:")
+    for route, now in current["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before or not before["p95_ms"]:
+            print(f"  {route:<36} new")
+            continue
+        change = now["p95_ms"] / before["p95_ms"] - 1
+        flag = ""
+        if change > max_regression:
+            regressions.append(f"{route} p95 {before['p95_ms']:.1f} -> {now['p95_ms']:.1f} ms")
+            flag = "  ⚠"
+        print(f"  {route:<36} p95 {before['p95_ms']:>8.1f} -> {now['p95_ms']:>8.1f} ms ({change:+.0%}){flag}")
+    before_rps, now_rps = baseline["total"]["rps"], current["total"]["rps"]
+    if before_rps:
+        change = now_rps / before_rps - 1
+        if -change > max_regression:
+            regressions.append(f"throughput {before_rps:.1f} -> {now_rps:.1f} req/s")
+        print(f"  {'total':<36} {before_rps:.1f} -> {now_rps:.1f} req/s ({change:+.0%})")
+    return regressions
+
+
+def print_report(result):
+    print(f"{'route':<36} {'count':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} {'p99':>8}  (ms)")
+    for route, row in list(result["routes"].items()) + [("total", result["total"])]:
+        print(f"{route:<36} {row['count']:>6} {row['errors']:>5} {row['rps']:>8.1f} "
+              f"{row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the API with an embedded database and fake OpenAI.")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="scenario=weight pairs")
+    parser.add_argument("--concurrency", type=int, default=8)
+    limit = parser.add_mutually_exclusive_group()
+    limit.add_argument("--duration", type=float, help="seconds to run (default 20)")
+    limit.add_argument("--requests", type=int, help="total requests to send")
+    parser.add_argument("--patients", type=int, default=200, help="patients to seed")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", help="SQLite file to use (default: a fresh temporary file)")
+    parser.add_argument("--seed-only", action="store_true", help="create and seed --db, then exit")
+    parser.add_argument("--target", help="base URL of a running server instead of the in-process app")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="fake OpenAI base latency (s)")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=0.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="injected latency per SQL statement (s)")
+    parser.add_argument("--db-error-rate", type=float, default=0.0, help="fraction of SQL statements that fail")
+    parser.add_argument("--replica", action="store_true",
+                        help="route GET requests through the read-replica path (same database file, no lag)")
+    parser.add_argument("--admission", action="store_true",
+                        help="keep admission control on (off by default: every client shares one IP)")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--compare", help="earlier JSON result to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative p95/throughput change")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    duration = args.duration if args.duration or args.requests else 20.0
+
+    db_path = args.db
+    if not args.target or args.seed_only:
+        if not db_path:
+            db_path = os.path.join(tempfile.mkdtemp(prefix="myh-load-"), "load.sqlite3")
+        if not os.path.exists(db_path):
+            seed_database(db_path, args.patients, args.seed)
+        if args.seed_only:
+            print(f"Seeded {args.patients} patients into {db_path}")
+            return 0
+
+    fake_llm = server = None
+    if args.target:
+        base_url = args.target
+    else:
+        from benchmarks.fake_openai import FakeOpenAIServer
+
+        fake_llm = FakeOpenAIServer(latency=args.llm_latency, tokens_per_second=args.llm_tokens_per_second,
+                                    error_rate=args.llm_error_rate, seed=args.seed)
+        os.environ.update({
+            "DB_BACKEND": "sqlite",
+            "SQLITE_PATH": db_path,
+            "SQLITE_REPLICA_PATH": db_path if args.replica else "",
+            "OPENAI_BASE_URL": fake_llm.start(),
+            "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "fake",
+            "PRECOMPUTE_ENABLED": "0",
+            "ADMISSION_ENABLED": "1" if args.admission else "0",
+            "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        })
+        from api import embedded_db
+
+        embedded_db.faults.configure(query_latency=args.db_latency, query_error_rate=args.db_error_rate)
+        server, base_url = start_app()
+
+    print(f"🚦 {args.concurrency} clients against {base_url} for "
+          f"{f'{args.requests} requests' if args.requests else f'{duration:.0f}s'}")
+    try:
+        samples, elapsed = run_load(base_url, mix, args.patients, args.concurrency,
+                                    duration=None if args.requests else duration,
+                                    requests=args.requests, seed=args.seed)
+    finally:
+        if server:
+            server.shutdown()
+        if fake_llm:
+            fake_llm.stop()
+
+    result = {
+        "commit": git_commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "config": {"mix": mix, "concurrency": args.concurrency, "duration": None if args.requests else duration,
+                   "requests": args.requests, "patients": args.patients, "target": args.target,
+                   "llm_latency": args.llm_latency, "llm_tokens_per_second": args.llm_tokens_per_second,
+                   "llm_error_rate": args.llm_error_rate},
+        **summarize(samples, elapsed),
+    }
+    print_report(result)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.max_regression)
+        if regressions:
+            print("❌ Regressions: " + "; ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
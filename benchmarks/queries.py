@@ -0,0 +1,105 @@
+"""Statements per request for the main endpoints, checked against budgets.
+
+Seeds an embedded database like ``benchmarks.load``, runs every load
+scenario a few times through Flask's test client inside
+``api.profiler.query_budget`` and prints the statement count and the most
+repeated statement per route. Exits 1 when a route runs more statements
+than its budget in ``QUERY_BUDGETS``, or one statement more than
+``--max-repeats`` times (the N+1 shape):
+
+    python -m benchmarks.queries
+    python -m benchmarks.queries --runs 10 --verbose
+
+Counts depend on the code path (first meal of a day inserts, later ones
+update), so budgets hold for the most expensive path of each route.
+``tests/test_query_budgets.py`` runs the same scenarios against these
+budgets under pytest.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+
+from benchmarks.load import REPO_ROOT, SCENARIOS, seed_database
+
+# route -> most statements one request of the load scenario may run
+QUERY_BUDGETS = {
+    "POST /register": 4,
+    "POST /login": 1,
+    "GET /search": 1,
+    "POST /patients/<id>/track_meals": 2,
+    "POST /patients/<id>/track_meals/batch": 2,
+    "GET /patients/<id>/meals": 1,
+    # Lookup, write and weekly rollup per exercise; the scenario posts 3
+    "POST /patients/<id>/track_exercise": 15,
+    # Draft lookup and single-flight generation (lock, draft upsert, publishing the result for
+    # other workers, unlock), the plan write and its parsed rows (delete, one executemany,
+    # PlanParses upsert), discarding the used draft
+    "POST /patients/<id>/generate-diet": 15,
+    "POST /patients/<id>/analyze_meals": 3,
+}
+DEFAULT_MAX_REPEATS = 3
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check SQL statements per request against budgets.")
+    parser.add_argument("--runs", type=int, default=5, help="requests per scenario")
+    parser.add_argument("--patients", type=int, default=10)
+    parser.add_argument("--max-repeats", type=int, default=DEFAULT_MAX_REPEATS,
+                        help="most times one statement fingerprint may run in a request")
+    parser.add_argument("--verbose", action="store_true", help="print every statement of the worst request")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    from benchmarks.fake_openai import FakeOpenAIServer
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="myh-queries-"), "queries.sqlite3")
+    seed_database(db_path, args.patients, args.seed)
+    fake_llm = FakeOpenAIServer(latency=0, seed=args.seed)
+    os.environ.update({
+        "DB_BACKEND": "sqlite",
+        "SQLITE_PATH": db_path,
+        "OPENAI_BASE_URL": fake_llm.start(),
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "fake",
+        "PRECOMPUTE_ENABLED": "0",
+        "ADMISSION_ENABLED": "0",
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+    })
+    sys.path.insert(0, REPO_ROOT)
+    from api.profiler import capture
+    from app import app
+
+    client = app.test_client()
+    rng = random.Random(args.seed)
+    failures = 0
+    print(f"{'route':<40}{'max':>6}{'budget':>8}  most repeated")
+    try:
+        for name, scenario in SCENARIOS.items():
+            worst = None
+            for _ in range(args.runs):
+                route, method, path, body = scenario(rng, args.patients)
+                with capture() as query_log:
+                    client.open(path, method=method, json=body)
+                if worst is None or query_log.count > worst.count:
+                    worst = query_log
+            budget = QUERY_BUDGETS.get(route)
+            repeats = worst.repeats(args.max_repeats)
+            top = worst.by_fingerprint().most_common(1)
+            over = (budget is not None and worst.count > budget) or repeats
+            failures += bool(over)
+            print(f"{route:<40}{worst.count:>6}{budget if budget is not None else '-':>8}  "
+                  + (f"{top[0][1]}x {top[0][0][:70]}" if top else "")
+                  + ("  ❌" if over else ""))
+            if args.verbose or over:
+                print("\n".join("    " + line for line in worst.report().splitlines()))
+    finally:
+        fake_llm.stop()
+
+    print("✅ All routes within their query budgets" if not failures
+          else f"❌ {failures} route(s) over budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Cold-start benchmark for the web workers.
+
+Imports the WSGI module (``app`` by default) in a fresh interpreter with
+``python -X importtime``, then reports the import wall time, the slowest
+modules by cumulative import time and the resident memory after import.
+
+It fails (exit code 1) when the median import time or RSS exceeds the
+budget, or when any of the heavy libraries that must stay lazy shows up
+in ``sys.modules`` right after import.
+
+    python -m benchmarks.startup
+    python -m benchmarks.startup --runs 5 --max-ms 600 --max-rss-mb 80 --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Libraries only needed by a few endpoints; importing the app must not load them.
+LAZY_MODULES = ["pandas", "matplotlib", "PIL", "openai", "supabase", "numpy"]
+
+# Default budgets for a worker cold start (median over the runs).
+DEFAULT_MAX_MS = 500
+DEFAULT_MAX_RSS_MB = 64
+
+PROBE = r"""
+import json, resource, sys, time
+start = time.perf_counter()
+import {module}
+elapsed_ms = (time.perf_counter() - start) * 1000
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024  # macOS reports bytes
+lazy = {lazy!r}
+print(json.dumps({{
+    "import_ms": elapsed_ms,
+    "rss_mb": rss_kb / 1024,
+    "loaded_lazy_modules": [m for m in lazy if m in sys.modules],
+}}))
+"""
+
+
+def parse_importtime(stderr):
+    """Parse ``-X importtime`` output into {module: (self_us, cumulative_us)}."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            _, self_us, cumulative_us, name = [part.strip() for part in line.replace("import time:", "|", 1).split("|")]
+            timings[name.strip()] = (int(self_us), int(cumulative_us))
+        except ValueError:
+            continue
+    return timings
+
+
+def run_once(module):
+    """Import ``module`` in a fresh interpreter and return (probe result, importtime table)."""
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-startup-benchmark")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE.format(module=module, lazy=LAZY_MODULES)],
+        cwd=REPO_ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr[-4000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    return result, parse_importtime(proc.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure worker cold-start import time and RSS.")
+    parser.add_argument("--module", default="app", help="module gunicorn imports (default: app)")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--max-ms", type=float, default=float(os.getenv("STARTUP_MAX_MS", DEFAULT_MAX_MS)))
+    parser.add_argument("--max-rss-mb", type=float, default=float(os.getenv("STARTUP_MAX_RSS_MB", DEFAULT_MAX_RSS_MB)))
+    parser.add_argument("--json", dest="json_path", help="write the report to this file")
+    args = parser.parse_args(argv)
+
+    results, importtimes = [], []
+    for _ in range(args.runs):
+        result, timings = run_once(args.module)
+        results.append(result)
+        importtimes.append(timings)
+
+    import_ms = statistics.median(r["import_ms"] for r in results)
+    rss_mb = statistics.median(r["rss_mb"] for r in results)
+    loaded_lazy = sorted({m for r in results for m in r["loaded_lazy_modules"]})
+
+    # Slowest modules by cumulative time, taken from the last run
+    slowest = sorted(importtimes[-1].items(), key=lambda item: item[1][1], reverse=True)[:args.top]
+
+    print(f"Cold start of '{args.module}' ({args.runs} runs, median)")
+    print(f"  import time : {import_ms:8.1f} ms   (budget {args.max_ms:.0f} ms)")
+    print(f"  RSS         : {rss_mb:8.1f} MB   (budget {args.max_rss_mb:.0f} MB)")
+    print(f"  {'cumulative':>12} {'self':>10}  module")
+    for name, (self_us, cumulative_us) in slowest:
+        print(f"  {cumulative_us / 1000:9.1f} ms {self_us / 1000:7.1f} ms  {name}")
+
+    failures = []
+    if import_ms > args.max_ms:
+        failures.append(f"import time {import_ms:.1f} ms exceeds {args.max_ms:.0f} ms")
+    if rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.1f} MB exceeds {args.max_rss_mb:.0f} MB")
+    if loaded_lazy:
+        failures.append(f"lazy modules imported at startup: {', '.join(loaded_lazy)}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({
+                "module": args.module,
+                "runs": args.runs,
+                "import_ms": import_ms,
+                "rss_mb": rss_mb,
+                "loaded_lazy_modules": loaded_lazy,
+                "slowest": [{"module": n, "self_us": s, "cumulative_us": c} for n, (s, c) in slowest],
+                "failures": failures,
+            }, f, indent=2)
+
+    for failure in failures:
+        print("❌", failure)
+    if not failures:
+        print("✅ Cold start within budget")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
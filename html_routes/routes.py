@@ -1,12 +1,37 @@
-from flask import Flask, render_template,request,Blueprint
+from flask import Flask, render_template,request,Blueprint,make_response
 from flask_cors import CORS
 from api.routes import app  # Importing the Flask app from api.py
+from api import page_data
+from api.db import get_db_connection
+from api.logs import get_logger
 from flask import send_from_directory
 import os
 
+log = get_logger(__name__)
+
 app_html = Blueprint('html', __name__)
 CORS(app_html)
 
+def render_patient_page(template, page, patient_id):
+    """Render a patient page with its initial data embedded (see api/page_data.py).
+
+    The data is None when it couldn't be loaded; the page then asks the
+    JSON endpoint for it. The response is per patient, so it isn't cached.
+    """
+    initial_data = None
+    conn = get_db_connection()
+    if conn:
+        try:
+            initial_data = page_data.load(conn.cursor(), page, patient_id)
+        except Exception:
+            log.exception("page_data_failed", page=page, patient_id=patient_id)
+        finally:
+            conn.close()
+
+    response = make_response(render_template(template, patient_id=patient_id, initial_data=initial_data))
+    response.headers["Cache-Control"] = "private, no-store"
+    return response
+
 @app_html.route("/home")
 def home():
     return send_from_directory(directory=os.path.join(app.root_path, 'static_html'), filename='index.html')
@@ -65,7 +90,7 @@ def recall_page():
     if not patient_id:
         return "Error: Patient ID is required", 400  # Handle missing patient_id
 
-    return render_template("3DayRecallPage.html", patient_id=patient_id)
+    return render_patient_page("3DayRecallPage.html", "recall", patient_id)
 
 @app_html.route("/ipaq")
 def ipaq_page():
@@ -73,7 +98,7 @@ def ipaq_page():
     if not patient_id:
         return "Error: Patient ID is required", 400  # Handle missing patient_id
 
-    return render_template("IpaqPage.html", patient_id=patient_id)
+    return render_patient_page("IpaqPage.html", "ipaq", patient_id)
 
 
 @app_html.route("/tracking_options")
@@ -83,7 +108,7 @@ def tracking_options():
     if not patient_id:
         return "Error: Patient ID is missing!", 400  # Handle missing patient_id
     
-    return render_template("Tracking_optionsPage.html", patient_id=patient_id)
+    return render_patient_page("Tracking_optionsPage.html", "tracking_options", patient_id)
 
 
 @app_html.route("/tracking_food")
@@ -93,7 +118,7 @@ def patient_tracking():
     if not patient_id:
         return "Error: Patient ID is missing!", 400  # Handle missing patient_id
     
-    return render_template("TrackingPage.html", patient_id=patient_id)
+    return render_patient_page("TrackingPage.html", "tracking_food", patient_id)
 
 
 @app_html.route("/tracking_exercise")
@@ -103,7 +128,7 @@ def tracking_exercise():
     if not patient_id:
         return "Error: Patient ID is missing!", 400  # Handle missing patient_id
     
-    return render_template("Tracking_exercisePage.html", patient_id=patient_id)
+    return render_patient_page("Tracking_exercisePage.html", "tracking_exercise", patient_id)
 
 @app_html.route("/blogs")
 def doctors_blogs():
@@ -0,0 +1,29 @@
+"""Bring the database schema up to date (tables and lookup indexes).
+
+Called by ``app.py`` on a local run; in production run ``python init_db.py``
+(or ``python -m scripts.migrate``) once per deploy, before the workers start.
+"""
+from api import migrations
+from api.db import get_db_connection
+from api.logs import get_logger
+
+log = get_logger("init_db")
+
+
+def initialize_database():
+    """Apply pending migrations; returns the applied versions. Safe to call on every start."""
+    conn = get_db_connection()
+    if not conn:
+        log.error("init_db_no_connection")
+        return []
+    try:
+        applied = migrations.migrate(conn)
+    finally:
+        conn.close()
+    if applied:
+        print(f"✅ Applied migrations: {', '.join(f'{m.version} {m.name}' for m in applied)}")
+    return [m.version for m in applied]
+
+
+if __name__ == "__main__":
+    initialize_database()
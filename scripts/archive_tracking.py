@@ -0,0 +1,70 @@
+"""Move old meal and exercise tracking rows into compressed cold storage.
+
+    python -m scripts.archive_tracking                      # both tables, ARCHIVE_HORIZON_DAYS (365)
+    python -m scripts.archive_tracking --horizon-days 180 --dataset exercise
+    python -m scripts.archive_tracking --patients MYH00239 --dry-run
+
+Rows dated before the horizon are written to per-patient-month Parquet
+segments under ``ARCHIVE_DIR`` and deleted from the table (see
+``api/archive.py``). Reads and exports keep returning them. Safe to run
+while the app is serving and to re-run after an interruption. Every app
+instance must see the same ``ARCHIVE_DIR`` (shared volume).
+"""
+import argparse
+import sys
+import time
+
+from api import archive
+from api.db import get_db_connection
+from api.logs import get_logger, init_logging
+
+log = get_logger("archive_tracking")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Archive old tracking rows to Parquet segments.")
+    parser.add_argument("--dataset", choices=sorted(archive.DATASETS) + ["all"], default="all")
+    parser.add_argument("--horizon-days", type=int, default=archive.ARCHIVE_HORIZON_DAYS,
+                        help="keep rows from the last N days in the database")
+    parser.add_argument("--patients", help="comma-separated patient ids (default: all with old rows)")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be archived")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+
+    cutoff = archive.cutoff_date(args.horizon_days)
+    datasets = sorted(archive.DATASETS) if args.dataset == "all" else [args.dataset]
+    started = time.monotonic()
+    failed = segments = rows = 0
+    try:
+        cursor = conn.cursor()
+        for dataset in datasets:
+            old = archive.patients_with_old_rows(cursor, dataset, cutoff)
+            if args.patients:
+                wanted = {p.strip() for p in args.patients.split(",") if p.strip()}
+                old = [p for p in old if p in wanted]
+            print(f"🔁 {dataset}: {len(old)} patients with rows before {cutoff.isoformat()}")
+            if args.dry_run:
+                continue
+            for patient_id in old:
+                try:
+                    written, moved = archive.archive_patient(conn, dataset, patient_id, cutoff)
+                    segments += written
+                    rows += moved
+                except Exception:
+                    failed += 1
+                    log.exception("archive_failed", dataset=dataset, patient_id=patient_id)
+    finally:
+        conn.close()
+
+    print(f"✅ {rows} rows into {segments} segments in {time.monotonic() - started:.1f}s"
+          + (f"  ❌ {failed} failed" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
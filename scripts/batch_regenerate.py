@@ -0,0 +1,277 @@
+"""Regenerate diet/exercise plans and meal analytics for many patients.
+
+Used after a prompt change in ``api/plans.py`` or ``api/meal_analysis.py``
+instead of clicking through the UI patient by patient.
+
+    python -m scripts.batch_regenerate --pipelines diet,exercise --concurrency 4 --rate 60 \\
+        --checkpoint runs/prompt-v2.jsonl
+    python -m scripts.batch_regenerate --pipelines analysis --where "fitness_goal LIKE '%weight%'"
+    python -m scripts.batch_regenerate --patients MYH00239,MYH00240 --force
+
+Each finished (patient, pipeline) pair is appended to the checkpoint file
+as one JSON line, so re-running the same command after an interruption
+only does what is left; failed items are retried. ``--rate`` caps how many
+items start per minute across all workers. A summary with throughput,
+latency percentiles and failures is printed at the end (``--report``
+writes it as JSON).
+
+For local runs and tests, start ``python -m benchmarks.fake_openai`` and set
+``OPENAI_BASE_URL=http://127.0.0.1:8089/v1``.
+"""
+import argparse
+import datetime
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from api import precompute
+from api.db import get_db_connection
+from api.logs import get_logger, init_logging
+from api.meal_analysis import MealAnalysisUnavailable, analyze_patient_meals
+from api.plans import DIET, EXERCISE, PLAN_TYPES, input_fingerprint, store_plan
+
+log = get_logger("batch_regenerate")
+
+ANALYSIS = "analysis"
+PIPELINES = (DIET, EXERCISE, ANALYSIS)
+DEFAULT_QUERY = "SELECT patient_id FROM PatientInformation"
+
+
+class Skipped(Exception):
+    """The patient lacks the inputs this pipeline needs."""
+
+
+class RateLimiter:
+    """Spaces item starts evenly so no more than ``per_minute`` begin each minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+class Checkpoint:
+    """Append-only JSON-lines record of finished items."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line from a crash
+                    if entry.get("status") in ("ok", "skipped"):
+                        self.done.add((entry["patient_id"], entry["pipeline"]))
+
+    def record(self, entry):
+        if not self.path:
+            return
+        with self._lock, open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def regenerate_plan(patient_id, plan_type, force=False):
+    """Regenerate and store one plan; reuses a matching draft unless ``force``.
+
+    Generation goes through ``precompute.generate_draft``, so an item for a
+    patient whose plan a doctor is generating right now waits for that
+    result instead of making a second call.
+    """
+    fetch_inputs, inputs_complete, _ = PLAN_TYPES[plan_type]
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        cursor = conn.cursor()
+        inputs = fetch_inputs(cursor, patient_id)
+        if not inputs_complete(inputs):
+            raise Skipped(f"incomplete {plan_type} inputs")
+        fingerprint = input_fingerprint(plan_type, inputs)
+        plan = None if force else precompute.load_draft(cursor, patient_id, plan_type, fingerprint)
+    finally:
+        conn.close()
+
+    if plan is None:
+        plan, _ = precompute.generate_draft(patient_id, plan_type, fingerprint, inputs)
+
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        cursor = conn.cursor()
+        store_plan(cursor, patient_id, plan_type, plan)
+        # Like the generate routes: the stored plan is not offered again as a draft
+        precompute.discard_draft(cursor, patient_id, plan_type)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def regenerate_analysis(patient_id):
+    """Re-run the meal analysis and store the new text and images."""
+    conn = get_db_connection()
+    if not conn:
+        raise RuntimeError("Database connection failed")
+    try:
+        try:
+            analyze_patient_meals(conn.cursor(), patient_id)
+        except MealAnalysisUnavailable as e:
+            raise Skipped(str(e))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def run_item(patient_id, pipeline, force):
+    if pipeline == ANALYSIS:
+        regenerate_analysis(patient_id)
+    else:
+        regenerate_plan(patient_id, pipeline, force)
+
+
+def select_patients(args):
+    if args.patients:
+        return [p.strip() for p in args.patients.split(",") if p.strip()]
+    sql = args.query or DEFAULT_QUERY + (f" WHERE {args.where}" if args.where else "")
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+    try:
+        cursor = conn.cursor()
+        cursor.execute(sql)
+        return sorted({row[0] for row in cursor.fetchall()})
+    finally:
+        conn.close()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run_batch(items, concurrency, rate, checkpoint, force=False, progress_every=25):
+    """Run (patient_id, pipeline) items and return the summary dict."""
+    limiter = RateLimiter(rate)
+    counts = {"ok": 0, "skipped": 0, "failed": 0}
+    latencies, failures = [], []
+    started = time.monotonic()
+
+    def work(item):
+        limiter.wait()
+        t0 = time.monotonic()
+        try:
+            run_item(*item, force)
+            return item, "ok", None, time.monotonic() - t0
+        except Skipped as e:
+            return item, "skipped", str(e), time.monotonic() - t0
+        except Exception as e:
+            log.exception("batch_item_failed", patient_id=item[0], pipeline=item[1])
+            return item, "failed", f"{type(e).__name__}: {e}", time.monotonic() - t0
+
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    interrupted = False
+    try:
+        futures = [executor.submit(work, item) for item in items]
+        for finished, future in enumerate(as_completed(futures), 1):
+            (patient_id, pipeline), status, error, seconds = future.result()
+            counts[status] += 1
+            if status == "ok":
+                latencies.append(seconds)
+            elif status == "failed":
+                failures.append({"patient_id": patient_id, "pipeline": pipeline, "error": error})
+            checkpoint.record({"patient_id": patient_id, "pipeline": pipeline, "status": status,
+                               "seconds": round(seconds, 3), "error": error,
+                               "ts": datetime.datetime.now(datetime.timezone.utc).isoformat()})
+            if progress_every and finished % progress_every == 0:
+                elapsed = time.monotonic() - started
+                print(f"  {finished}/{len(items)} done, {finished / elapsed * 60:.1f} items/min, "
+                      f"{counts['failed']} failed", flush=True)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\n⏸ Interrupted; finished items are checkpointed, re-run to resume.")
+        executor.shutdown(wait=True, cancel_futures=True)
+    else:
+        executor.shutdown(wait=True)
+
+    elapsed = time.monotonic() - started
+    processed = sum(counts.values())
+    return {
+        "items": len(items),
+        "processed": processed,
+        "interrupted": interrupted,
+        **counts,
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_minute": round(processed / elapsed * 60, 2) if elapsed else 0.0,
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "mean": round(statistics.mean(latencies), 3) if latencies else 0.0,
+        },
+        "failures": failures,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-regenerate plans and meal analytics.")
+    parser.add_argument("--pipelines", default=f"{DIET},{EXERCISE}",
+                        help=f"comma-separated subset of {','.join(PIPELINES)}")
+    selection = parser.add_mutually_exclusive_group()
+    selection.add_argument("--patients", help="comma-separated patient ids")
+    selection.add_argument("--where", help="SQL condition on PatientInformation")
+    selection.add_argument("--query", help="SQL returning patient ids in the first column")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0, help="max items started per minute (0 = unlimited)")
+    parser.add_argument("--checkpoint", help="JSON-lines progress file; reused to resume")
+    parser.add_argument("--force", action="store_true", help="ignore stored drafts with matching inputs")
+    parser.add_argument("--report", help="write the summary as JSON to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    pipelines = [p.strip() for p in args.pipelines.split(",") if p.strip()]
+    unknown = set(pipelines) - set(PIPELINES)
+    if unknown:
+        parser.error(f"unknown pipelines: {', '.join(sorted(unknown))}")
+
+    checkpoint = Checkpoint(args.checkpoint)
+    patients = select_patients(args)
+    items = [(p, pipeline) for p in patients for pipeline in pipelines if (p, pipeline) not in checkpoint.done]
+    print(f"🔁 {len(patients)} patients × {len(pipelines)} pipelines: {len(items)} items to run"
+          f" ({len(patients) * len(pipelines) - len(items)} already done)")
+
+    summary = run_batch(items, args.concurrency, args.rate, checkpoint, args.force)
+
+    print(f"✅ ok {summary['ok']}  ⏭ skipped {summary['skipped']}  ❌ failed {summary['failed']}"
+          f"  in {summary['elapsed_seconds']:.1f}s ({summary['throughput_per_minute']:.1f} items/min,"
+          f" p50 {summary['latency_seconds']['p50']:.2f}s, p95 {summary['latency_seconds']['p95']:.2f}s)")
+    for failure in summary["failures"][:20]:
+        print(f"   {failure['patient_id']} {failure['pipeline']}: {failure['error']}")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary["failed"] or summary["interrupted"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
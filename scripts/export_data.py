@@ -0,0 +1,107 @@
+"""Export patient and tracking tables to CSV or NDJSON files for audits.
+
+    python -m scripts.export_data visits --format csv --out exports/visits.csv.gz
+    python -m scripts.export_data meals --out exports/meals.ndjson --patient-id MYH00239
+    python -m scripts.export_data exercise --out exports/exercise.ndjson --resume
+
+Rows stream from the database in key order, ``--batch-size`` at a time, so
+memory stays flat. A ``.gz`` output is written as one gzip member per batch
+(any gzip reader handles that). After each batch the file is fsynced and
+``<out>.resume`` records the last key and file size; ``--resume`` truncates
+to that size and continues after that key, so an interrupted export ends
+up identical to an uninterrupted one. The state file is removed on success.
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+
+from api import exports
+from api.db import get_db_connection
+from api.logs import init_logging
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_state(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stream a table export to CSV or NDJSON.")
+    parser.add_argument("dataset", choices=sorted(exports.DATASETS))
+    parser.add_argument("--format", choices=sorted(exports.FORMATS),
+                        help="default: from the --out extension, else ndjson")
+    parser.add_argument("--out", required=True, help="output file; a .gz suffix compresses it")
+    parser.add_argument("--patient-id", help="only this patient's rows")
+    parser.add_argument("--batch-size", type=int, default=exports.BATCH_SIZE)
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted export of --out")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    compress = args.out.endswith(".gz")
+    fmt = args.format or ("csv" if args.out.removesuffix(".gz").endswith(".csv") else "ndjson")
+    state_path = args.out + ".resume"
+
+    state = load_state(state_path) if args.resume else None
+    if args.resume and state is None and os.path.exists(args.out):
+        raise SystemExit(f"❌ No resume state for {args.out}; remove the file or export again without --resume")
+    if state and (state["dataset"], state["format"], state.get("patient_id")) != (args.dataset, fmt, args.patient_id):
+        raise SystemExit("❌ Resume state belongs to a different export")
+
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    rows = state["rows"] if state else 0
+    started = time.monotonic()
+    try:
+        with open(args.out, "r+b" if state else "wb") as out:
+            if state:
+                out.truncate(state["offset"])
+                out.seek(state["offset"])
+
+            def write(text):
+                data = text.encode("utf-8")
+                out.write(gzip.compress(data) if compress else data)
+                out.flush()
+                os.fsync(out.fileno())
+
+            if not state and fmt == "csv":
+                write(exports.csv_header(args.dataset))
+            after = state["after"] if state else None
+            for batch in exports.iter_batches(conn.cursor(), args.dataset, after, args.patient_id, args.batch_size):
+                write(exports.format_batch(args.dataset, batch, fmt))
+                rows += len(batch)
+                save_state(state_path, {"dataset": args.dataset, "format": fmt, "patient_id": args.patient_id,
+                                        "after": exports.row_key(args.dataset, batch[-1]),
+                                        "offset": out.tell(), "rows": rows})
+    except KeyboardInterrupt:
+        print(f"\n⏸ Interrupted after {rows} rows; re-run with --resume to continue.")
+        return 1
+    finally:
+        conn.close()
+
+    if os.path.exists(state_path):
+        os.remove(state_path)
+    print(f"✅ {rows} {args.dataset} rows → {args.out} in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Apply or check the versioned schema migrations in ``api/migrations.py``.
+
+    python -m scripts.migrate              # apply everything pending
+    python -m scripts.migrate --target 2   # stop after version 2
+    python -m scripts.migrate --list       # applied / pending per version
+    python -m scripts.migrate --check      # exit 1 if a migration is pending or an index is missing
+
+``--check`` matches the required indexes by key columns, so an equivalent
+index created under another name also passes. Run it in CI against a copy
+of production, or after restoring a backup.
+"""
+import argparse
+import sys
+
+from api import migrations
+from api.db import DB_BACKEND, get_db_connection
+from api.logs import get_logger, init_logging
+
+log = get_logger("migrate")
+
+
+def list_migrations(cursor):
+    applied = migrations.applied_versions(cursor)
+    for migration in migrations.MIGRATIONS:
+        mark = "✅" if migration.version in applied else "⏳"
+        print(f"{mark} {migration.version:>3} {migration.name}")
+    return 0
+
+
+def check(cursor):
+    pending = migrations.pending_migrations(cursor)
+    for migration in pending:
+        print(f"❌ migration {migration.version} {migration.name} not applied")
+    missing = 0
+    for index, match in migrations.check_indexes(cursor, DB_BACKEND):
+        columns = ", ".join(index.columns)
+        if match:
+            print(f"✅ {index.table} ({columns}) -> {match}")
+        else:
+            missing += 1
+            print(f"❌ {index.table} ({columns}) has no index ({index.name})")
+    return 1 if pending or missing else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply or check database schema migrations.")
+    parser.add_argument("--check", action="store_true", help="only report pending migrations and missing indexes")
+    parser.add_argument("--list", action="store_true", help="list migrations and whether they are applied")
+    parser.add_argument("--target", type=int, help="highest version to apply (default: all)")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+
+    try:
+        cursor = conn.cursor()
+        if args.list:
+            return list_migrations(cursor)
+        if args.check:
+            return check(cursor)
+        applied = migrations.migrate(conn, target=args.target)
+    except Exception:
+        log.exception("migration_failed")
+        print("❌ Migration failed; fix the cause and run again (applied steps are kept)")
+        return 1
+    finally:
+        conn.close()
+
+    for migration in applied:
+        print(f"🔁 Applied {migration.version} {migration.name}")
+    print(f"✅ Schema up to date ({len(applied)} applied)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""Parse stored diet charts and exercise prescriptions into plan item rows.
+
+    python -m scripts.parse_plans                      # plans without a current parse
+    python -m scripts.parse_plans --all                # every plan
+    python -m scripts.parse_plans --plan-type diet
+
+``store_plan`` and ``store_patient_info`` parse at write time
+(``api/plan_items.py``). Run this once for plans stored before that, and
+after bumping ``PARSER_VERSION``.
+"""
+import argparse
+import sys
+import time
+
+from api import plan_items
+from api.db import get_db_connection
+from api.logs import get_logger, init_logging
+
+log = get_logger("parse_plans")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse stored plans into plan item rows.")
+    parser.add_argument("--plan-type", choices=sorted(plan_items.PARSERS) + ["all"], default="all")
+    parser.add_argument("--all", action="store_true", help="re-parse every plan, not only outdated ones")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+
+    plan_types = sorted(plan_items.PARSERS) if args.plan_type == "all" else [args.plan_type]
+    started = time.monotonic()
+    failed = parsed = items = 0
+    try:
+        cursor = conn.cursor()
+        for plan_type in plan_types:
+            column = plan_items.SOURCE_COLUMNS[plan_type]
+            cursor.execute(f"""
+                SELECT i.patient_id, i.{column} FROM PatientInformation i
+                LEFT JOIN PlanParses p ON p.patient_id = i.patient_id AND p.plan_type = ?
+                WHERE i.{column} IS NOT NULL AND i.{column} <> ''
+                    AND (? = 1 OR p.patient_id IS NULL OR p.parser_version < ?)
+                ORDER BY i.patient_id
+            """, (plan_type, int(args.all), plan_items.PARSER_VERSION))
+            plans = cursor.fetchall()
+            print(f"🔁 {plan_type}: parsing {len(plans)} plans (parser version {plan_items.PARSER_VERSION})")
+            for patient_id, text in plans:
+                try:
+                    items += len(plan_items.store_items(cursor, patient_id, plan_type, text))
+                    conn.commit()
+                    parsed += 1
+                except Exception:
+                    failed += 1
+                    log.exception("plan_parse_failed", patient_id=patient_id, plan_type=plan_type)
+    finally:
+        conn.close()
+
+    print(f"✅ {parsed} plans parsed into {items} items in {time.monotonic() - started:.1f}s"
+          + (f"  ❌ {failed} failed" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""Rebuild the blog search index from the DoctorBlogs table.
+
+    python -m scripts.rebuild_blog_index
+
+The API keeps the index current as blogs are created, updated and deleted
+(see ``api/blog_search.py``). Run this after changing blogs directly in the
+database, after a failed index update (``blog_index_update_failed`` in the
+logs), or to move the index to a new ``BLOG_INDEX_PATH``. Running workers
+pick up the new file on their next search.
+"""
+import argparse
+import sys
+import time
+
+from api import blog_search
+from api.db import get_db_connection
+from api.logs import init_logging
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild the blog search index.")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+
+    started = time.monotonic()
+    print(f"🔁 Indexing blogs into {blog_search.BLOG_INDEX_PATH}")
+    try:
+        blogs = blog_search.rebuild(conn.cursor())
+    finally:
+        conn.close()
+    print(f"✅ {blogs} blogs indexed in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Rebuild the exercise rollups from ``PatientExerciseTracking``.
+
+Run once to backfill history after deploying the rollup tables, after
+changing the MET table in ``api/rollups.py``, or to repair a patient whose
+rollups drifted:
+
+    python -m scripts.rebuild_rollups                 # every patient with exercise data
+    python -m scripts.rebuild_rollups --patients MYH00239,MYH00240
+
+Each patient is rebuilt with one grouped query over their own rows, so the
+command can run while the app is serving; a patient logging exercise at the
+same moment may need a second run.
+"""
+import argparse
+import sys
+import time
+
+from api import archive
+from api.db import get_db_connection
+from api.logs import get_logger, init_logging
+from api.rollups import rebuild_patient
+
+log = get_logger("rebuild_rollups")
+
+
+def select_patients(cursor, patients=None):
+    if patients:
+        return [p.strip() for p in patients.split(",") if p.strip()]
+    cursor.execute("SELECT DISTINCT patient_id FROM PatientExerciseTracking")
+    return sorted({row[0] for row in cursor.fetchall()} | set(archive.archived_patients("exercise")))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rebuild daily and weekly exercise rollups.")
+    parser.add_argument("--patients", help="comma-separated patient ids (default: all with exercise data)")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+
+    started = time.monotonic()
+    failed = days = 0
+    try:
+        cursor = conn.cursor()
+        patients = select_patients(cursor, args.patients)
+        print(f"🔁 Rebuilding rollups for {len(patients)} patients")
+        for done, patient_id in enumerate(patients, 1):
+            try:
+                days += rebuild_patient(cursor, patient_id)
+                conn.commit()
+            except Exception:
+                failed += 1
+                log.exception("rollup_rebuild_failed", patient_id=patient_id)
+            if done % 100 == 0:
+                print(f"  {done}/{len(patients)} patients")
+    finally:
+        conn.close()
+
+    print(f"✅ {len(patients) - failed} patients, {days} active days in {time.monotonic() - started:.1f}s"
+          + (f"  ❌ {failed} failed" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
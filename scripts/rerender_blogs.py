@@ -0,0 +1,63 @@
+"""Render stored blogs into BlogRenditions (sanitized HTML, excerpt, reading time).
+
+    python -m scripts.rerender_blogs           # blogs without a current rendition
+    python -m scripts.rerender_blogs --all     # every blog
+
+``create_blog`` and ``update_blog`` render at write time (``api/blog_render.py``).
+Run this once for blogs written before that, and after bumping
+``RENDER_VERSION``. The blog search index is rebuilt afterwards so it
+matches the new plain text.
+"""
+import argparse
+import sys
+import time
+
+from api import blog_render, blog_search
+from api.db import get_db_connection
+from api.logs import get_logger, init_logging
+
+log = get_logger("rerender_blogs")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-render stored blogs.")
+    parser.add_argument("--all", action="store_true", help="re-render every blog, not only outdated ones")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+
+    started = time.monotonic()
+    failed = rendered = 0
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT b.id, b.content FROM DoctorBlogs b LEFT JOIN BlogRenditions r ON r.blog_id = b.id
+            WHERE ? = 1 OR r.blog_id IS NULL OR r.render_version < ?
+            ORDER BY b.id
+        """, (int(args.all), blog_render.RENDER_VERSION))
+        blogs = cursor.fetchall()
+        print(f"🔁 Rendering {len(blogs)} blogs (render version {blog_render.RENDER_VERSION})")
+        for blog_id, content in blogs:
+            try:
+                blog_render.save_rendition(cursor, blog_id, blog_render.render(content))
+                conn.commit()
+                rendered += 1
+            except Exception:
+                failed += 1
+                log.exception("blog_render_failed", blog_id=blog_id)
+        if rendered:
+            blog_search.rebuild(cursor)
+    finally:
+        conn.close()
+
+    print(f"✅ {rendered} blogs rendered in {time.monotonic() - started:.1f}s"
+          + (f"  ❌ {failed} failed" if failed else ""))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
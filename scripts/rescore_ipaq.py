@@ -0,0 +1,89 @@
+"""Recompute stored IPAQ scores with the current rules in ``api/ipaq.py``.
+
+Loads every raw questionnaire from ``IpaqResponses``, scores them all in one
+vectorized pass and writes the results back to ``PatientActivityData``:
+
+    python -m scripts.rescore_ipaq --dry-run     # show how many scores/categories would change
+    python -m scripts.rescore_ipaq
+
+Rows submitted before answers were stored server-side have nothing to
+rescore and are left as they are (their count is reported).
+"""
+import argparse
+import json
+import sys
+import time
+from collections import Counter
+
+from api import ipaq
+from api.db import get_db_connection
+from api.logs import init_logging
+
+SCORE_COLUMNS = ("ipaQ_vigorous_met", "ipaQ_moderate_met", "ipaQ_walking_met", "ipaQ_total_met", "ipaQ_category")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rescore all stored IPAQ questionnaires.")
+    parser.add_argument("--dry-run", action="store_true", help="report changes without writing")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+
+    init_logging(level=args.log_level)
+    conn = get_db_connection()
+    if not conn:
+        raise SystemExit("❌ Database connection failed")
+
+    started = time.monotonic()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT r.patient_id, r.answers, {", ".join(f"a.{c}" for c in SCORE_COLUMNS)}
+            FROM IpaqResponses r
+            JOIN PatientActivityData a ON a.patient_id = r.patient_id
+        """)
+        rows = cursor.fetchall()
+        cursor.execute("SELECT COUNT(*) FROM PatientActivityData WHERE patient_id NOT IN (SELECT patient_id FROM IpaqResponses)")
+        without_answers = cursor.fetchone()[0]
+
+        patient_ids, answer_list, previous, invalid = [], [], [], []
+        for row in rows:
+            try:
+                answer_list.append(ipaq.normalize_answers(json.loads(row[1])))
+            except ValueError:
+                invalid.append(row[0])
+                continue
+            patient_ids.append(row[0])
+            previous.append(dict(zip(SCORE_COLUMNS, row[2:])))
+
+        scores = ipaq.score_answers(answer_list)
+        changed = [(patient_id, old, new) for patient_id, old, new in zip(patient_ids, previous, scores)
+                   if any(old[c] != new[c] for c in SCORE_COLUMNS)]
+        moves = Counter((old["ipaQ_category"], new["ipaQ_category"]) for _, old, new in changed
+                        if old["ipaQ_category"] != new["ipaQ_category"])
+
+        print(f"📊 {len(scores)} questionnaires scored with rules v{ipaq.RULES_VERSION} in "
+              f"{time.monotonic() - started:.2f}s: {len(changed)} changed")
+        for (old, new), count in moves.most_common():
+            print(f"   {old or '—'} → {new}: {count}")
+        if without_answers:
+            print(f"   {without_answers} patients have no stored answers and were skipped")
+        if invalid:
+            print(f"   ⚠ {len(invalid)} stored answers failed validation: {', '.join(invalid[:10])}")
+
+        if changed and not args.dry_run:
+            cursor.executemany(f"""
+                UPDATE PatientActivityData
+                SET {", ".join(f"{c} = ?" for c in SCORE_COLUMNS)}
+                WHERE patient_id = ?
+            """, [tuple(new[c] for c in SCORE_COLUMNS) + (patient_id,) for patient_id, _, new in changed])
+            cursor.executemany("UPDATE IpaqResponses SET rules_version = ? WHERE patient_id = ?",
+                               [(ipaq.RULES_VERSION, patient_id) for patient_id in patient_ids])
+            conn.commit()
+            print(f"✅ Updated {len(changed)} patients")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
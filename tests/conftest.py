@@ -0,0 +1,58 @@
+"""The app under test runs on the embedded SQLite backend (``api/embedded_db.py``)
+and the fake OpenAI server (``benchmarks/fake_openai.py``).
+
+``api.db`` reads its configuration at import time, so the environment is
+set here, before any test module imports the app.
+"""
+import os
+import tempfile
+
+import pytest
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.load import seed_database
+
+PATIENTS = 5
+DB_PATH = os.path.join(tempfile.mkdtemp(prefix="myh-tests-"), "tests.sqlite3")
+fake_llm = FakeOpenAIServer(latency=0)
+
+os.environ.update({
+    "DB_BACKEND": "sqlite",
+    "SQLITE_PATH": DB_PATH,
+    "OPENAI_API_KEY": "fake",
+    "OPENAI_BASE_URL": fake_llm.start(),
+    "OPENAI_MAX_RETRIES": "0",
+    "PRECOMPUTE_ENABLED": "0",
+    "ADMISSION_ENABLED": "0",
+    "LOG_LEVEL": "WARNING",
+})
+seed_database(DB_PATH, PATIENTS)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    fake_llm.stop()
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app
+    return app
+
+
+@pytest.fixture
+def fake_llm_errors():
+    """Make the fake OpenAI server fail every request for one test; returns the server."""
+    fake_llm.error_rate = 1.0
+    yield fake_llm
+    fake_llm.error_rate = 0.0
+
+
+@pytest.fixture(scope="session")
+def patients():
+    """Number of seeded patients, MYH00239 onwards."""
+    return PATIENTS
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
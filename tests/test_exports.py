@@ -0,0 +1,64 @@
+"""Resumable exports merged with archived rows (``api/exports.py``, ``api/archive.py``)."""
+import datetime
+
+import pytest
+
+from api import archive, exports
+from api.db import get_db_connection
+from api.profiler import capture
+
+PATIENT_ID = "MYH00900"
+NAMES = ("walking", "Walking", "WALKING", "yoga", "Yoga", "Zumba", "aerobics")
+
+
+@pytest.fixture
+def cursor(tmp_path, monkeypatch):
+    """Exercise rows with mixed-case names, half of them moved to archive segments."""
+    monkeypatch.setattr(archive, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    today = datetime.date.today()
+    old = today - datetime.timedelta(days=400)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    for back, date in enumerate((old, old + datetime.timedelta(days=1), today)):
+        for i, name in enumerate(NAMES):
+            for repeat in range(2):  # older data repeats (patient, day, exercise)
+                cursor.execute("""
+                    INSERT INTO PatientExerciseTracking (patient_id, exercise_name, duration_minutes, exercise_date)
+                    VALUES (?, ?, ?, ?)
+                """, (PATIENT_ID, name, 10 * back + i + repeat, date.isoformat()))
+    conn.commit()
+    archive.archive_patient(conn, "exercise", PATIENT_ID, today - datetime.timedelta(days=30))
+    try:
+        yield cursor
+    finally:
+        cursor.execute("DELETE FROM PatientExerciseTracking WHERE patient_id = ?", (PATIENT_ID,))
+        conn.commit()
+        conn.close()
+
+
+def export(cursor, after=None):
+    return [row for batch in exports.iter_batches(cursor, "exercise", after, PATIENT_ID, batch_size=5)
+            for row in batch]
+
+
+def test_both_tiers_are_merged_in_one_order(cursor):
+    rows = export(cursor)
+    assert len(archive.cold_rows("exercise", PATIENT_ID)) == 2 * len(NAMES) * 2
+    assert len(rows) == 3 * len(NAMES) * 2
+    assert len({row[-1] for row in rows}) == len(rows)
+    assert rows == sorted(rows, key=lambda row: archive.row_order("exercise", row))
+
+
+def test_resuming_after_any_row_continues_exactly_there(cursor):
+    rows = export(cursor)
+    for i, row in enumerate(rows):
+        assert export(cursor, exports.row_key("exercise", row)) == rows[i + 1:]
+
+
+def test_text_keys_are_ordered_in_binary_collation(cursor):
+    with capture() as query_log:
+        export(cursor, exports.row_key("exercise", export(cursor)[3]))
+    sql = query_log.statements[-1].fingerprint
+    assert "ORDER BY patient_id COLLATE Latin1_General_BIN2, exercise_date, " \
+           "exercise_name COLLATE Latin1_General_BIN2, id" in sql
+    assert "exercise_name COLLATE Latin1_General_BIN2 > ?" in sql
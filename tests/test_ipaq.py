@@ -0,0 +1,55 @@
+"""Boundaries of the IPAQ category rules in ``api/ipaq.py``."""
+from api import ipaq
+
+
+def category(**items):
+    """Category for answers given as item=(days, minutes per day), e.g. vigorous_leisure=(3, 20)."""
+    answers = {"job": "no"}
+    for item, (days, minutes) in items.items():
+        item = item.replace("_", "-")
+        answers[f"{item}-days"] = days
+        answers[f"{item}-hours"] = minutes // 60
+        answers[f"{item}-minutes"] = minutes % 60
+    return ipaq.score_one(answers)[1]["ipaQ_category"]
+
+
+def test_high_counts_total_met_minutes_not_only_vigorous():
+    # 3 × 20 × 8 = 480 vigorous + 3 × 85 × 4 = 1020 moderate: 1500 in total
+    assert category(vigorous_leisure=(3, 20), moderate_leisure=(3, 85)) == "High"
+
+
+def test_high_needs_1500_total():
+    # 480 + 3 × 84 × 4 = 1488
+    assert category(vigorous_leisure=(3, 20), moderate_leisure=(3, 84)) == "Moderate"
+
+
+def test_high_needs_three_vigorous_days():
+    # 2 × 180 × 8 = 2880 vigorous on 2 days, 2 walking days: 4 activity days
+    assert category(vigorous_leisure=(2, 180), walking_leisure=(2, 30)) == "Low"
+
+
+def test_high_with_seven_days_reaching_3000():
+    # 7 × 130 × 3.3 = 3003 walking
+    assert category(walking_leisure=(7, 130)) == "High"
+    # 7 × 129 × 3.3 = 2979.9
+    assert category(walking_leisure=(7, 129)) == "Moderate"
+
+
+def test_moderate_needs_three_days_of_20_vigorous_minutes():
+    assert category(vigorous_leisure=(3, 20)) == "Moderate"
+    assert category(vigorous_leisure=(3, 19)) == "Low"
+
+
+def test_moderate_vigorous_rule_is_per_day_not_weekly_minutes():
+    # 3 vigorous days and 80 minutes a week, but only one day reaches 20 minutes
+    assert category(vigorous_leisure=(1, 60), vigorous_garden=(2, 10)) == "Low"
+    assert category(vigorous_leisure=(1, 20), vigorous_garden=(2, 20)) == "Moderate"
+
+
+def test_moderate_with_five_days_of_150_minutes_moderate_or_walking():
+    assert category(walking_leisure=(5, 30)) == "Moderate"
+    assert category(walking_leisure=(4, 30), moderate_home=(1, 29)) == "Low"
+
+
+def test_short_bouts_are_ignored():
+    assert category(vigorous_leisure=(7, 9)) == "Low"
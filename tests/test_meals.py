@@ -0,0 +1,28 @@
+"""Validation of meal tracking payloads (``api/meals.py``)."""
+import pytest
+
+from api.meals import normalize_entries, normalize_entry
+
+
+def test_entry_fields_are_stripped_and_missing_ones_empty():
+    assert normalize_entry({"meal_date": "2026-10-01", "breakfast": " Poha ", "lunch": None}) == (
+        "2026-10-01", "Poha", "", "", "")
+
+
+@pytest.mark.parametrize("value", [3, ["rice"], {"item": "rice"}, True])
+def test_non_text_meal_is_rejected_with_its_field(value):
+    with pytest.raises(ValueError, match=r"^entries\[1\]\.lunch must be a string$"):
+        normalize_entries([{"meal_date": "2026-10-01"}, {"meal_date": "2026-10-02", "lunch": value}])
+
+
+def test_malformed_batch_answers_400(client):
+    response = client.post("/patients/MYH00239/track_meals/batch",
+                           json={"entries": [{"meal_date": "2026-10-01", "dinner": 42}]})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "entries[0].dinner must be a string"}
+
+
+def test_malformed_single_day_answers_400(client):
+    response = client.post("/patients/MYH00239/track_meals", json={"meal_date": "2026-10-01", "snacks": [1]})
+    assert response.status_code == 400
+    assert response.get_json() == {"error": "snacks must be a string"}
@@ -0,0 +1,22 @@
+"""Every load scenario stays within its statement budget in ``benchmarks.queries.QUERY_BUDGETS``."""
+import random
+
+import pytest
+
+from api.profiler import query_budget
+from benchmarks.load import SCENARIOS
+from benchmarks.queries import DEFAULT_MAX_REPEATS, QUERY_BUDGETS
+
+# Requests per scenario; enough to take both the insert and the update path of the tracking routes
+RUNS = 5
+
+
+@pytest.mark.parametrize("scenario", sorted(SCENARIOS))
+def test_scenario_within_query_budget(client, patients, scenario):
+    rng = random.Random(scenario)
+    for _ in range(RUNS):
+        route, method, path, body = SCENARIOS[scenario](rng, patients)
+        assert route in QUERY_BUDGETS, f"{route} has no query budget"
+        with query_budget(QUERY_BUDGETS[route], max_repeats=DEFAULT_MAX_REPEATS):
+            response = client.open(path, method=method, json=body)
+        assert response.status_code < 400, response.get_data(as_text=True)
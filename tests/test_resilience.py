@@ -0,0 +1,100 @@
+"""Circuit breakers, deadlines and fallbacks in ``api/resilience.py``, driven by injected faults."""
+import pytest
+
+from api import embedded_db, resilience
+from api.db import get_db_connection
+
+PATIENT_ID = "MYH00240"
+
+
+@pytest.fixture(autouse=True)
+def breakers(monkeypatch):
+    """Fresh breakers per test, so one test's open circuit doesn't leak into the next."""
+    monkeypatch.setattr(resilience, "database", resilience.CircuitBreaker("database", slow_seconds=5))
+    monkeypatch.setattr(resilience, "openai", resilience.CircuitBreaker("openai", min_calls=5, window=120.0))
+    yield
+    embedded_db.faults.configure(**{field: 0.0 for field in embedded_db.Faults.FIELDS})
+
+
+@pytest.fixture
+def without_stored_diet():
+    """A patient with no stored diet plan, so there is nothing to fall back to."""
+    patient_id = "MYH00243"
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT diet_prescription FROM PatientInformation WHERE patient_id = ?", (patient_id,))
+        stored = cursor.fetchone()[0]
+        cursor.execute("UPDATE PatientInformation SET diet_prescription = NULL WHERE patient_id = ?", (patient_id,))
+        conn.commit()
+        yield patient_id
+        cursor.execute("UPDATE PatientInformation SET diet_prescription = ? WHERE patient_id = ?",
+                       (stored, patient_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def assert_503(response):
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "error" in response.get_json()
+
+
+def test_database_errors_open_the_circuit_and_answer_503(client):
+    embedded_db.faults.configure(query_error_rate=1.0)
+    for _ in range(resilience.database.min_calls):
+        assert client.get(f"/patients/{PATIENT_ID}/info").status_code == 500
+    assert resilience.database.state == resilience.CircuitBreaker.OPEN
+
+    # Refused without touching the database, even though it has recovered
+    embedded_db.faults.configure(query_error_rate=0.0)
+    response = client.get(f"/patients/{PATIENT_ID}/info")
+    assert_503(response)
+    assert int(response.headers["Retry-After"]) <= resilience.database.open_seconds
+
+
+def test_database_circuit_closes_after_a_good_trial_call(client):
+    resilience.database.open_seconds = 0
+    embedded_db.faults.configure(query_error_rate=1.0)
+    for _ in range(resilience.database.min_calls):
+        client.get(f"/patients/{PATIENT_ID}/info")
+    assert resilience.database.state == resilience.CircuitBreaker.OPEN
+
+    embedded_db.faults.configure(query_error_rate=0.0)
+    assert client.get(f"/patients/{PATIENT_ID}/info").status_code == 200
+    assert resilience.database.state == resilience.CircuitBreaker.CLOSED
+
+
+def test_openai_circuit_serves_the_stored_plan(client, fake_llm_errors):
+    for _ in range(resilience.openai.min_calls):
+        assert client.post(f"/patients/{PATIENT_ID}/generate-diet").status_code == 500
+    assert resilience.openai.state == resilience.CircuitBreaker.OPEN
+
+    calls = fake_llm_errors.requests
+    response = client.post(f"/patients/{PATIENT_ID}/generate-diet")
+    assert response.status_code == 200
+    assert response.get_json()["fallback"] is True
+    assert response.headers["Warning"] == '110 - "Response is Stale"'
+    assert fake_llm_errors.requests == calls
+
+
+def test_openai_circuit_without_stored_plan_answers_503(client, fake_llm_errors, without_stored_diet):
+    for _ in range(resilience.openai.min_calls):
+        client.post(f"/patients/{PATIENT_ID}/generate-diet")
+    assert resilience.openai.state == resilience.CircuitBreaker.OPEN
+
+    assert_503(client.post(f"/patients/{without_stored_diet}/generate-diet"))
+
+
+def test_deadline_reached_during_a_slow_query_answers_503(client):
+    embedded_db.faults.configure(query_latency=1.0)
+    response = client.get(f"/patients/{PATIENT_ID}/info", headers={resilience.DEADLINE_HEADER: "0.2"})
+    assert_503(response)
+
+
+def test_fault_spec_parsing():
+    faults = embedded_db.Faults("query_latency=0.5, connect_error_rate=0.2")
+    assert (faults.query_latency, faults.connect_error_rate, faults.query_error_rate) == (0.5, 0.2, 0.0)
+    with pytest.raises(ValueError):
+        embedded_db.Faults("query_delay=1")
@@ -0,0 +1,60 @@
+"""Cross-worker coalescing in ``api/singleflight.py``, with worker processes sharing the database."""
+import multiprocessing
+import time
+
+from api import precompute, singleflight
+from api.db import get_db_connection
+from api.plans import DIET, PLAN_TYPES
+
+PATIENT_ID = "MYH00239"
+FINGERPRINT = "f" * 64
+
+
+def worker(calls, started, results):
+    """What one gunicorn worker's generate-diet does: generate (or wait), store, discard the draft."""
+    def generate(inputs):
+        with calls.get_lock():
+            calls.value += 1
+        started.set()
+        time.sleep(0.5)
+        return {"diet_prescription": "Plan", "structured_diet_chart": "Chart"}
+
+    precompute.PLAN_TYPES = dict(PLAN_TYPES, **{DIET: PLAN_TYPES[DIET][:2] + (generate,)})
+    singleflight.POLL_SECONDS = 0.05
+    plan, shared = precompute.generate_draft(PATIENT_ID, DIET, FINGERPRINT, {})
+    conn = get_db_connection()
+    try:
+        precompute.discard_draft(conn.cursor(), PATIENT_ID, DIET)
+        conn.commit()
+    finally:
+        conn.close()
+    results.put((plan, shared))
+
+
+def test_two_workers_make_one_llm_call():
+    context = multiprocessing.get_context("fork")
+    calls, started, results = context.Value("i", 0), context.Event(), context.Queue()
+    holder = context.Process(target=worker, args=(calls, started, results))
+    holder.start()
+    assert started.wait(10)
+    waiter = context.Process(target=worker, args=(calls, started, results))
+    waiter.start()
+    outcomes = [results.get(timeout=20) for _ in range(2)]
+    holder.join(10)
+    waiter.join(10)
+
+    assert calls.value == 1
+    assert sorted(shared for _, shared in outcomes) == [False, True]
+    assert outcomes[0][0] == outcomes[1][0] == {"diet_prescription": "Plan", "structured_diet_chart": "Chart"}
+
+
+def test_a_later_request_generates_again():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return len(calls)
+
+    key = ("plan", DIET, "MYH00240", FINGERPRINT)
+    assert singleflight.run(key, compute) == (1, False)
+    assert singleflight.run(key, compute) == (2, False)